@@ -0,0 +1,292 @@
+"""ASR 推理配置基准：在固定的带标注音频集上比较各配置的实时率与字错误率。
+
+默认使用 AISHELL-1 测试集（https://www.openslr.org/33/）的固定子集：解压 data_aishell
+（并解压其中 wav/test 下各说话人的压缩包）后直接运行
+
+    python -m benchmarks.asr_profiles --threads 4
+    python -m benchmarks.asr_profiles --max-cer 0.08 --json asr.json
+
+子集由 benchmarks/asr_eval_aishell.txt 固定：20 位测试说话人各取排序后的前 10 段。
+--write-manifest 可以把实际选中的音频名导出，之后用 --manifest 精确复现。
+
+也可以用 --dataset 指定自己的目录（含子目录），每段音频（WAV / NPY）旁放同名 .txt
+作为参考文本，或用 --transcripts 指定一个每行 "音频名 文本" 的标注文件。
+--synthetic 使用合成音频，只有实时率有意义。
+
+fp32 总是最先运行，作为明确的基准配置。只有每段音频都有参考文本时才计算字错误率
+并给出推荐配置；否则只报告各配置相对 fp32 识别结果的偏差，不做推荐。
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+
+import numpy as np
+
+from src.replay import load_audio
+
+AUDIO_EXTENSIONS = (".wav", ".npy")
+REFERENCE_PROFILE = "fp32"
+AISHELL_DATASET = "data_aishell/wav/test"
+AISHELL_TRANSCRIPTS = "data_aishell/transcript/aishell_transcript_v0.8.txt"
+AISHELL_MANIFEST = os.path.join(os.path.dirname(__file__), "asr_eval_aishell.txt")
+
+
+def load_transcripts(path: str) -> dict[str, str]:
+    """读取每行 "音频名 文本" 的标注文件（AISHELL 格式，文本中的空格会被忽略）。"""
+    transcripts = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            name, _, text = line.strip().partition(" ")
+            if name and text:
+                transcripts[name] = text
+    return transcripts
+
+
+def load_manifest(path: str) -> list[str]:
+    """读取清单：每行一个子目录名或音频名，忽略空行和 # 注释。"""
+    with open(path, encoding="utf-8") as f:
+        lines = (line.split("#", 1)[0].strip() for line in f)
+        return [line for line in lines if line]
+
+
+def select_files(
+    files: list[str], root: str, manifest: list[str], per_speaker: int
+) -> list[str]:
+    """按清单挑选音频：子目录名取其中排序后的前 per_speaker 段，音频名精确匹配。"""
+    by_dir: dict[str, list[str]] = {}
+    by_stem = {}
+    for file in files:
+        by_dir.setdefault(os.path.basename(os.path.dirname(file)), []).append(file)
+        by_stem[os.path.splitext(os.path.basename(file))[0]] = file
+    selected, missing = [], []
+    for entry in manifest:
+        if entry in by_stem:
+            selected.append(by_stem[entry])
+        elif entry in by_dir and os.path.dirname(by_dir[entry][0]) != root:
+            selected.extend(by_dir[entry][:per_speaker])
+        else:
+            missing.append(entry)
+    if missing:
+        raise SystemExit(f"{root} 中找不到清单里的 {len(missing)} 项: {missing[:5]}")
+    return selected
+
+
+def load_dataset(
+    path: str | None,
+    seconds: float,
+    transcripts: dict[str, str] | None = None,
+    limit: int | None = None,
+    manifest: list[str] | None = None,
+    per_speaker: int = 10,
+) -> list[tuple[str, np.ndarray, str | None]]:
+    """返回 [(名称, int16 音频, 参考文本或 None)]，至多 limit 段。
+
+    给出清单时按清单顺序挑选，否则按相对路径排序取全部音频。
+    """
+    if path is None:
+        from benchmarks.pipeline import synthetic_audio
+
+        audio = synthetic_audio(seconds)
+        step = 4 * 16000
+        return [
+            (f"synthetic-{i // step}", audio[i : i + step], None)
+            for i in range(0, len(audio), step)
+        ]
+    files = []
+    for root, dirs, names in os.walk(path):
+        dirs.sort()
+        files.extend(
+            os.path.join(root, name)
+            for name in sorted(names)
+            if os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS
+        )
+    if manifest is not None:
+        files = select_files(files, os.path.normpath(path), manifest, per_speaker)
+    items = []
+    for file in files[:limit]:
+        stem = os.path.splitext(os.path.basename(file))[0]
+        reference = None
+        transcript = os.path.splitext(file)[0] + ".txt"
+        if transcripts is not None:
+            reference = transcripts.get(stem)
+        elif os.path.exists(transcript):
+            with open(transcript, encoding="utf-8") as f:
+                reference = f.read().strip()
+        items.append((stem, load_audio(file), reference))
+    if not items:
+        raise SystemExit(f"{path} 中没有 WAV / NPY 音频")
+    return items
+
+
+def edit_distance(a: str, b: str) -> int:
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = cur
+    return prev[-1]
+
+
+def cer(hypotheses: list[str], references: list[str]) -> float:
+    """字错误率：按字符的编辑距离之和 / 参考文本字符数之和（忽略标点与大小写）。"""
+    from src.transcribe_worker import _normalize
+
+    errors = chars = 0
+    for hypothesis, reference in zip(hypotheses, references):
+        reference = _normalize(reference)
+        errors += edit_distance(_normalize(hypothesis), reference)
+        chars += len(reference)
+    return errors / chars if chars else 0.0
+
+
+def run_profile(profile: str, dataset, threads: int | None, repeat: int) -> dict:
+    from src.transcribe_worker import TranscribeWorker
+
+    start = time.perf_counter()
+    worker = TranscribeWorker(profile=profile, threads=threads)
+    load_s = time.perf_counter() - start
+    # 预热：torch.compile 在此完成编译，不计入实时率
+    start = time.perf_counter()
+    worker.transcribe(dataset[0][1][:16000])
+    warmup_s = time.perf_counter() - start
+
+    texts, rtfs = [], []
+    for _, audio, _ in dataset:
+        elapsed = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            text = worker.transcribe(audio)
+            elapsed.append(time.perf_counter() - start)
+        texts.append(text)
+        rtfs.append(min(elapsed) / (len(audio) / 16000))
+    return {
+        "profile": profile,
+        "device": worker.device,
+        "load_s": load_s,
+        "warmup_s": warmup_s,
+        "rtf_mean": statistics.mean(rtfs),
+        "rtf_max": max(rtfs),
+        "texts": texts,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--dataset", help=f"音频与参考文本所在目录，默认 {AISHELL_DATASET}"
+    )
+    parser.add_argument(
+        "--transcripts",
+        help=f"每行“音频名 文本”的标注文件，使用默认数据集时默认 {AISHELL_TRANSCRIPTS}",
+    )
+    parser.add_argument(
+        "--manifest",
+        help="固定评测子集的清单（每行一个子目录名或音频名），"
+        "使用默认数据集时默认 benchmarks/asr_eval_aishell.txt",
+    )
+    parser.add_argument(
+        "--per-speaker", type=int, default=10, help="清单中每个子目录取的音频段数"
+    )
+    parser.add_argument("--write-manifest", help="把实际使用的音频名写入清单文件")
+    parser.add_argument("--limit", type=int, help="只取前 N 段音频")
+    parser.add_argument(
+        "--synthetic", action="store_true", help="使用合成音频（只测实时率）"
+    )
+    parser.add_argument("--audio-seconds", type=float, default=40)
+    parser.add_argument(
+        "--profiles",
+        default="bf16,int8,compile,int8-compile",
+        help=f"逗号分隔，与 {REFERENCE_PROFILE} 比较；{REFERENCE_PROFILE} 总是最先运行",
+    )
+    parser.add_argument("--threads", type=int, help="torch CPU 线程数")
+    parser.add_argument(
+        "--repeat", type=int, default=2, help="每段音频识别次数，取最快"
+    )
+    parser.add_argument(
+        "--max-cer", type=float, default=0.1, help="可接受的字错误率上限"
+    )
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        args.dataset = None
+    elif args.dataset is None:
+        args.dataset = AISHELL_DATASET
+        args.transcripts = args.transcripts or AISHELL_TRANSCRIPTS
+        args.manifest = args.manifest or AISHELL_MANIFEST
+        if not os.path.isdir(args.dataset):
+            raise SystemExit(
+                f"找不到 {args.dataset}：请从 https://www.openslr.org/33/ 下载 "
+                "AISHELL-1 并解压到当前目录，或用 --dataset 指定音频目录"
+            )
+    transcripts = load_transcripts(args.transcripts) if args.transcripts else None
+    manifest = load_manifest(args.manifest) if args.manifest else None
+    dataset = load_dataset(
+        args.dataset,
+        args.audio_seconds,
+        transcripts,
+        args.limit,
+        manifest,
+        args.per_speaker,
+    )
+    if args.write_manifest:
+        with open(args.write_manifest, "w", encoding="utf-8") as f:
+            f.writelines(f"{name}\n" for name, _, _ in dataset)
+    seconds = sum(len(audio) for _, audio, _ in dataset) / 16000
+    labelled = sum(reference is not None for _, _, reference in dataset)
+    print(f"音频集: {len(dataset)} 段, 共 {seconds:.1f}s, 其中 {labelled} 段有参考文本")
+
+    profiles = [p for p in args.profiles.split(",") if p and p != REFERENCE_PROFILE]
+    results = []
+    for profile in [REFERENCE_PROFILE, *profiles]:
+        print(f"== {profile} ==")
+        try:
+            results.append(run_profile(profile, dataset, args.threads, args.repeat))
+        except Exception as e:
+            if profile == REFERENCE_PROFILE:
+                raise SystemExit(f"基准配置 {profile} 无法运行: {e}") from e
+            # 例如当前 torch 版本不支持 compile 或量化
+            print(f"跳过 {profile}: {e}")
+
+    reference_texts = results[0]["texts"]
+    if labelled == len(dataset):
+        metric, label = "cer", "字错误率"
+        references = [reference for _, _, reference in dataset]
+    else:
+        # 缺少标注时 fp32 自己的识别结果不是真值，只能衡量相对它的偏差
+        metric, label = f"drift_vs_{REFERENCE_PROFILE}", f"相对{REFERENCE_PROFILE}偏差"
+        references = reference_texts
+    print(f"\n{'配置':<14} {'设备':<6} {'RTF 均值':>9} {'RTF 最大':>9} {label:>9}")
+    for result in results:
+        result[metric] = cer(result["texts"], references)
+        print(
+            f"{result['profile']:<14} {result['device']:<6} "
+            f"{result['rtf_mean']:9.3f} {result['rtf_max']:9.3f} {result[metric]:9.2%}"
+        )
+
+    if metric != "cer":
+        print(
+            f"\n{len(dataset) - labelled} 段音频缺少参考文本，无法计算字错误率，"
+            "不给出推荐配置；请使用带标注的数据集（见 --transcripts）"
+        )
+    else:
+        passing = [r for r in results if r["cer"] <= args.max_cer]
+        if passing:
+            best = min(passing, key=lambda r: r["rtf_mean"])
+            print(
+                f"\n字错误率不超过 {args.max_cer:.0%} 的配置中最快的是 {best['profile']}"
+                f"（--asr-profile {best['profile']}）"
+            )
+        else:
+            print(f"\n没有配置的字错误率不超过 {args.max_cer:.0%}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=1)
+
+
+if __name__ == "__main__":
+    main()
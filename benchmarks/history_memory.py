@@ -0,0 +1,95 @@
+"""对话历史内存基准：模拟连续的屏幕事件，对比截图保留策略开启前后的内存增长。
+
+python -m benchmarks.history_memory --events 1000
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from agno.media import Image
+
+from src.history import ConversationHistory, Turn
+from src.screen_encoder import ScreenEncoder
+
+
+def make_frames(count: int, width: int, height: int) -> list[bytes]:
+    """生成若干张带渐变、色块和噪点的合成截图，编码为 JPEG。"""
+    rng = np.random.default_rng(0)
+    encoder = ScreenEncoder()
+    gradient = np.linspace(0, 255, width, dtype=np.uint8)[None, :, None]
+    frames = []
+    for _ in range(count):
+        img = np.empty((height, width, 4), np.uint8)
+        img[:] = gradient
+        for _ in range(12):
+            x, y = rng.integers(0, width - 200), rng.integers(0, height - 100)
+            color = tuple(int(c) for c in rng.integers(0, 255, 4))
+            cv2.rectangle(img, (x, y), (x + 200, y + 100), color, -1)
+        img += rng.integers(0, 24, img.shape, dtype=np.uint8)
+        frames.append(encoder.encode(img).data)
+    encoder.shutdown()
+    return frames
+
+
+def summarize(previous: str, turns: list[Turn]) -> str:
+    """固定长度的摘要，代替模型调用。"""
+    return "主人一直在写代码，偶尔切换到浏览器查资料。" * 4
+
+
+def run(name: str, history: ConversationHistory, frames: list[bytes], events: int):
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    print(f"\n[{name}]")
+    print(f"{'事件':>6} {'内存 MB':>9} {'历史截图 MB':>12} {'上下文 tokens':>14}")
+    for i in range(1, events + 1):
+        # 复制一份字节，模拟每次截图都是新的对象
+        data = bytes(bytearray(frames[i % len(frames)]))
+        history.add(
+            Turn(
+                "screen",
+                "主人的屏幕刚刚发生了变化，请根据屏幕内容做出你的反应。",
+                "哼，又在摸鱼了吗？",
+                [Image(content=data, mime_type="image/jpeg")],
+            )
+        )
+        if i % (events // 10) == 0:
+            _, tokens = history.context()
+            current = tracemalloc.get_traced_memory()[0] - base
+            print(
+                f"{i:>6} {current / 2**20:>9.1f} "
+                f"{history.image_bytes / 2**20:>12.2f} {tokens:>14}"
+            )
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    history.shutdown()
+    print(f"峰值 {peak / 2**20:.1f} MB, 平均每事件 {elapsed / events * 1000:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    args = parser.parse_args()
+
+    frames = make_frames(8, args.width, args.height)
+    print(f"单张截图约 {np.mean([len(f) for f in frames]) / 1024:.0f} KB")
+
+    # 不限制轮数与截图，相当于所有截图都留在会话历史中
+    unbounded = ConversationHistory(
+        token_budget=10**12,
+        keep_turns=10**9,
+        full_image_turns=10**9,
+        max_image_bytes=10**15,
+    )
+    run("无保留策略", unbounded, frames, args.events)
+    run("保留策略", ConversationHistory(summarizer=summarize), frames, args.events)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""屏幕检测空闲 CPU 占用对比：固定帧率轮询 / 自适应轮询 / XDamage 事件驱动。
+
+在静止的 Xvfb 虚拟屏幕上运行：
+
+    xvfb-run -s "-screen 0 1920x1080x24 +extension DAMAGE" \\
+        python -m benchmarks.idle_cpu --seconds 10
+"""
+
+import argparse
+import threading
+import time
+
+from src.screen_worker import ScreenChangeDetector
+from src.xdamage import XDamageMonitor
+
+
+def measure(detector: ScreenChangeDetector, seconds: float, warmup: float) -> float:
+    """在后台线程运行检测器，返回稳定阶段的进程 CPU 占用率（%）。"""
+    thread = threading.Thread(target=detector.start_detecting, daemon=True)
+    thread.start()
+    time.sleep(warmup)
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    time.sleep(seconds)
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    detector.stop_detecting()
+    thread.join()
+    return cpu / wall * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--warmup", type=float, default=2)
+    parser.add_argument("--monitor", type=int, default=1)
+    args = parser.parse_args()
+
+    fixed = ScreenChangeDetector(args.monitor)
+    fixed.max_interval = fixed.min_interval  # 关闭自适应降频，相当于原先的固定 30fps
+    modes = [
+        ("poll-fixed", fixed),
+        ("poll-adaptive", ScreenChangeDetector(args.monitor)),
+    ]
+    damage = XDamageMonitor.create()
+    if damage is None:
+        print("XDamage 不可用，跳过 damage 模式")
+    else:
+        damage.close()
+        modes.append(("damage", ScreenChangeDetector(args.monitor, capture="damage")))
+
+    for name, detector in modes:
+        usage = measure(detector, args.seconds, args.warmup)
+        print(f"{name:<14} CPU {usage:6.2f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""长期记忆检索基准：在 10 万条事实的 SQLite FTS5 库上测量 top-k 检索延迟与召回。
+
+召回按合成事实的宾语判断：每个查询对应一组相关宾语，top-k 中至少有一条事实
+含有其中之一即算召回（recall@k）；precision@k 为 top-k 中相关事实的比例。
+
+python -m benchmarks.memory_retrieval --facts 100000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from src.memory_store import MemoryStore, MemoryTools
+
+SUBJECTS = ["主人", "主人的朋友", "主人的同事", "主人的猫"]
+VERBS = ["喜欢", "讨厌", "正在学习", "计划去", "上周完成了", "经常提到"]
+OBJECTS = [
+    "无糖乌龙茶", "黑咖啡", "Python", "Rust", "机器学习", "毕业论文", "健身",
+    "京都旅行", "周报", "钢琴", "摄影", "红烧肉", "科幻小说", "马拉松", "日语",
+    "开源项目", "期末考试", "早起", "熬夜", "原神",
+]  # fmt: skip
+CATEGORIES = ["preference", "plan", "achievement", "fact"]
+# 查询 -> 相关的宾语
+QUERIES = {
+    "你还记得我喜欢喝什么吗": ["无糖乌龙茶", "黑咖啡"],
+    "我的论文写到哪了": ["毕业论文"],
+    "周末想去旅行": ["京都旅行"],
+    "今天又熬夜了": ["熬夜"],
+    "我在学 Rust": ["Rust"],
+    "帮我想想健身计划": ["健身"],
+    "考试快到了好紧张": ["期末考试"],
+    "推荐一本科幻小说": ["科幻小说"],
+}
+
+
+def make_facts(count: int, seed: int = 0) -> list[tuple[str, str]]:
+    rng = random.Random(seed)
+    facts = []
+    for i in range(count):
+        text = (
+            f"{rng.choice(SUBJECTS)}{rng.choice(VERBS)}{rng.choice(OBJECTS)}"
+            f"（第 {i} 条）"
+        )
+        facts.append((text, rng.choice(CATEGORIES)))
+    return facts
+
+
+def percentile(samples: list[float], q: float) -> float:
+    return statistics.quantiles(samples, n=100)[int(q) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--facts", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "memory.db")
+        store = MemoryStore(path)
+        facts = make_facts(args.facts)
+        start = time.perf_counter()
+        for i in range(0, len(facts), 10_000):
+            store.add_many(facts[i : i + 10_000])
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(path) / 2**20
+        print(
+            f"写入 {len(store)} 条事实: {elapsed:.1f}s "
+            f"({len(facts) / elapsed:.0f} 条/s), 数据库 {size:.1f} MB"
+        )
+
+        tools = MemoryTools(store, top_k=args.top_k)
+        queries = list(QUERIES)
+        latencies = []
+        injected = []
+        for i in range(args.queries):
+            query = queries[i % len(queries)]
+            start = time.perf_counter()
+            context = tools.context_for(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+            injected.append(len(context))
+        print(
+            f"top-{args.top_k} 检索 {args.queries} 次: "
+            f"p50 {percentile(latencies, 50):.2f} ms, "
+            f"p95 {percentile(latencies, 95):.2f} ms, "
+            f"p99 {percentile(latencies, 99):.2f} ms, "
+            f"注入上下文平均 {statistics.mean(injected):.0f} 字符"
+        )
+
+        recalled = 0
+        relevant = 0
+        for query, objects in QUERIES.items():
+            contents = [fact.content for fact in store.search(query, args.top_k)]
+            hits = sum(any(obj in content for obj in objects) for content in contents)
+            recalled += hits > 0
+            relevant += hits
+            print(f"  {query}: {len(contents)} 条, 相关 {hits} 条")
+        print(
+            f"recall@{args.top_k} {recalled / len(QUERIES):.2f}, "
+            f"precision@{args.top_k} {relevant / (len(QUERIES) * args.top_k):.2f}"
+        )
+        for query in queries[:3]:
+            print(f"\n示例: {query}\n{tools.context_for(query) or '（无相关记忆）'}")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
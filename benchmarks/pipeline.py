@@ -0,0 +1,552 @@
+"""无头流水线基准：用回放的音频、画面和模拟 LLM 测量各环节开销与端到端延迟。
+
+不需要麦克风、显示器和 API Key，可在只有 CPU 的 Linux 机器上运行：
+
+    python -m benchmarks.pipeline                       # 合成音频与画面
+    python -m benchmarks.pipeline --audio speech.wav --frames recording.mp4
+    python -m benchmarks.pipeline --json result.json    # 保存结果
+    python -m benchmarks.pipeline --baseline result.json  # 与之前的结果比较，退化时返回 1
+
+报告的指标：
+- vad:      每秒音频消耗的 CPU 时间（毫秒）
+- asr:      实时率 RTF（识别耗时 / 音频时长），整句与流式识别在语音结束后的延迟
+- asr_batch: 积压多句时逐句识别与批量识别的吞吐（音频秒数 / 识别秒数）、排队等待分位数，
+            以及批量与逐句识别文本不一致的句数
+- asr_short: 1-2 秒短句上，逐句渲染模板与预渲染模板两种方式的
+            输入准备耗时（generate 之外的开销）和总识别耗时
+- speculative: 推测识别的命中率、作废浪费的识别时间、省下的延迟，以及与整句识别的一致率
+- detector: 检测器每秒处理帧数、每帧 CPU 时间（毫秒）
+- e2e:      语音（从 ASR 输出起）与屏幕（从检测到变化起）到气泡显示的延迟分位数
+缺少依赖（torch / silero-vad / transformers）的环节会被跳过。
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from src.replay import AudioReplay, FrameReplay
+from src.tracing import tracer
+
+SECTIONS = (
+    "vad",
+    "asr",
+    "asr_batch",
+    "asr_short",
+    "speculative",
+    "detector",
+    "e2e",
+)
+
+UTTERANCES = [
+    "在吗",
+    "今天好累啊",
+    "帮我看看这段代码哪里有问题",
+    "你觉得我该先写论文还是先去吃饭",
+    "晚安",
+    "这个 bug 我修了一下午",
+]
+
+
+# ── 合成输入 ──
+
+
+def synthetic_audio(seconds: float, sample_rate: int = 16000, seed: int = 0):
+    """交替的“语音”（调幅的谐波加噪声）与静音，用于没有录音时测量开销。"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    voiced = (np.sin(2 * np.pi * 0.25 * t) > 0).astype(np.float32)
+    pitch = 140 + 40 * np.sin(2 * np.pi * 3 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    signal = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t)
+    audio = voiced * envelope * signal * 0.3 + rng.normal(0, 0.01, len(t))
+    return (np.clip(audio, -1, 1) * 32767).astype(np.int16)
+
+
+def synthetic_frames(
+    count: int,
+    width: int = 1920,
+    height: int = 1080,
+    hold: int = 20,
+    seed: int = 0,
+    **kwargs,
+) -> FrameReplay:
+    """每 hold 帧切换一次“窗口”，期间有闪烁的光标；场景循环出现，可命中去重。"""
+    rng = np.random.default_rng(seed)
+    scenes = []
+    for i in range(6):
+        img = np.full((height, width, 4), 235, np.uint8)
+        for _ in range(8):
+            x, y = rng.integers(0, width - 200), rng.integers(0, height - 150)
+            w, h = rng.integers(200, width // 2), rng.integers(150, height // 2)
+            color = tuple(int(c) for c in rng.integers(0, 255, 3)) + (255,)
+            cv2.rectangle(img, (x, y), (x + w, y + h), color, -1)
+        cv2.putText(
+            img, f"scene {i}", (80, 120), cv2.FONT_HERSHEY_SIMPLEX, 3, (0, 0, 0, 255), 6
+        )
+        scenes.append(img)
+
+    def read_frame(index: int) -> np.ndarray:
+        img = scenes[(index // hold) % len(scenes)].copy()
+        if index % 2:
+            cv2.rectangle(img, (400, 600), (412, 640), (0, 0, 0, 255), -1)
+        return img
+
+    return FrameReplay(count, read_frame, **kwargs)
+
+
+def load_frames(args, **kwargs) -> FrameReplay:
+    if args.frames:
+        return FrameReplay.open(args.frames, **kwargs)
+    return synthetic_frames(args.frame_count, **kwargs)
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    if len(samples) == 1:
+        return {"p50": samples[0], "p90": samples[0], "p99": samples[0]}
+    q = statistics.quantiles(samples, n=100, method="inclusive")
+    return {"p50": q[49], "p90": q[89], "p99": q[98]}
+
+
+# ── 各环节 ──
+
+
+def bench_vad(args, audio: np.ndarray) -> tuple[dict, list[np.ndarray]]:
+    from src.vad_worker import FullSentenceWorker
+
+    sentences = []
+    worker = FullSentenceWorker(source=AudioReplay(audio))
+    worker.sentence_ready.connect(lambda _, sentence: sentences.append(sentence))
+    seconds = len(audio) / 16000
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    worker.start_listening()
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+    return {
+        "vad.cpu_ms_per_audio_s": cpu / seconds * 1000,
+        "vad.wall_ms_per_audio_s": wall / seconds * 1000,
+        "vad.sentences": len(sentences),
+    }, sentences
+
+
+def bench_asr(args, audio: np.ndarray, sentences: list[np.ndarray]) -> dict:
+    """整句识别的实时率，以及整句 / 流式两种模式下语音结束后的识别延迟。"""
+    from PySide6.QtCore import QCoreApplication
+
+    from src.transcribe_worker import TranscribeWorker
+
+    app = QCoreApplication.instance() or QCoreApplication([])
+    if not sentences:
+        # VAD 未运行或没有检测到语句时，按固定长度切段
+        step = int(args.asr_segment * 16000)
+        sentences = [audio[i : i + step] for i in range(0, len(audio), step)]
+    sentences = sentences[: args.asr_segments]
+    worker = TranscribeWorker()
+    worker.transcribe(sentences[0][:16000])  # 预热
+    rtfs, full_ms, stream_ms = [], [], []
+    for sentence in sentences:
+        start = time.perf_counter()
+        worker.on_sentence_audio(tracer.reserve(), sentence)
+        worker.drain()
+        elapsed = time.perf_counter() - start
+        rtfs.append(elapsed / (len(sentence) / 16000))
+        full_ms.append(elapsed * 1000)
+
+        # 流式：按 VAD 的节奏转发音频段，说话期间的临时识别不计入语音结束后的延迟
+        chunk = int(0.5 * 16000)
+        trace_id = tracer.reserve()
+        for i in range(0, len(sentence), chunk):
+            worker.on_speech_chunk(trace_id, sentence[i : i + chunk])
+            app.processEvents()
+        start = time.perf_counter()
+        worker.on_sentence_audio(trace_id, sentence)
+        worker.drain()
+        stream_ms.append((time.perf_counter() - start) * 1000)
+    return {
+        "asr.rtf_mean": statistics.mean(rtfs),
+        **{f"asr.rtf_{k}": v for k, v in percentiles(rtfs).items()},
+        **{f"asr.post_speech_ms_{k}": v for k, v in percentiles(full_ms).items()},
+        **{
+            f"asr.stream_post_speech_ms_{k}": v
+            for k, v in percentiles(stream_ms).items()
+        },
+        "asr.segments": len(rtfs),
+    }
+
+
+def bench_asr_batch(args, audio: np.ndarray, sentences: list[np.ndarray]) -> dict:
+    """一次积压 asr_backlog 句，比较逐句识别与 max_batch=asr_batch 批量识别。
+
+    等待时间为入队到识别完成，取自追踪记录的 asr_end 阶段；批量识别的文本逐句与
+    逐句识别核对，不一致的句数记为 mismatches（填充导致识别结果变化时大于 0）。
+    """
+    from PySide6.QtCore import Qt
+
+    from src.transcribe_worker import AsrQueueStats, TranscribeWorker, _normalize
+
+    if not sentences:
+        step = int(args.asr_segment * 16000)
+        sentences = [audio[i : i + step] for i in range(0, len(audio), step)]
+    backlog = [sentences[i % len(sentences)] for i in range(args.asr_backlog)]
+    worker = TranscribeWorker()
+    worker.transcribe(backlog[0][:16000])  # 预热
+    worker.max_queue = len(backlog)
+    worker.max_wait = float("inf")
+    results = {}
+    received: dict[int, str] = {}
+    worker.transcription_ready.connect(
+        received.__setitem__, Qt.ConnectionType.DirectConnection
+    )
+    texts: dict[str, list[str]] = {}
+    for name, batch in (("sequential", 1), ("batched", args.asr_batch)):
+        tracer.clear()
+        received.clear()
+        worker.max_batch = batch
+        stats = worker.queue_stats = AsrQueueStats()
+        trace_ids = [tracer.begin("voice") for _ in backlog]
+        for trace_id, sentence in zip(trace_ids, backlog):
+            worker.on_sentence_audio(trace_id, sentence)
+        worker.drain()
+        # 空文本不会发出 transcription_ready，按空字符串比较
+        texts[name] = [received.get(trace_id, "") for trace_id in trace_ids]
+        waits = [
+            trace["stages"]["asr_end"]
+            for trace in tracer.traces().values()
+            if "asr_end" in trace["stages"]
+        ]
+        print(f"[{name}] {stats.describe()}")
+        results[f"asr_batch.{name}_throughput"] = stats.throughput
+        results.update(
+            {f"asr_batch.{name}_wait_ms_{k}": v for k, v in percentiles(waits).items()}
+        )
+    mismatches = 0
+    for i, (one, many) in enumerate(zip(texts["sequential"], texts["batched"])):
+        if _normalize(one) != _normalize(many):
+            mismatches += 1
+            print(f"[asr_batch] 第 {i} 句批量与逐句结果不一致: {many!r} / {one!r}")
+    results["asr_batch.mismatches"] = mismatches
+    results["asr_batch.count"] = len(backlog)
+    return results
+
+
+def bench_asr_short(args, audio: np.ndarray) -> dict:
+    """短句的识别开销：关闭 / 开启 fast_prompt 时的输入准备与总耗时（毫秒）。"""
+    from src.transcribe_worker import TranscribeWorker
+
+    rng = np.random.default_rng(0)
+    clips = []
+    for _ in range(args.asr_short_clips):
+        n = int(rng.uniform(1.0, 2.0) * 16000)
+        start = int(rng.integers(0, max(1, len(audio) - n)))
+        clips.append(audio[start : start + n])
+    worker = TranscribeWorker()
+    worker.transcribe(clips[0])  # 预热
+    results = {}
+    for name, fast in (("template", False), ("prerendered", True)):
+        worker.fast_prompt = fast
+        prep_ms, total_ms = [], []
+        for clip in clips:
+            start = time.perf_counter()
+            worker._prepare_inputs([clip])
+            prep_ms.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            worker.transcribe(clip)
+            total_ms.append((time.perf_counter() - start) * 1000)
+        for metric, samples in (("prep_ms", prep_ms), ("total_ms", total_ms)):
+            results.update(
+                {
+                    f"asr_short.{name}_{metric}_{k}": v
+                    for k, v in percentiles(samples).items()
+                }
+            )
+    results["asr_short.count"] = len(clips)
+    return results
+
+
+def bench_speculative(args, audio: np.ndarray) -> dict:
+    """VAD 与 ASR 串联实时回放，停顿 speculative_silence_ms 后即推测识别，并与整句识别核对。
+
+    连接方式与 main.py 相同：VAD 与 ASR 各在自己的 QThread 中运行，VAD 按音频时长
+    推进，推测识别与确认静音在时间上真实地重叠。
+    """
+    from PySide6.QtCore import QCoreApplication, Qt, QThread, QTimer
+
+    from src.transcribe_worker import TranscribeWorker
+    from src.vad_worker import FullSentenceWorker
+
+    app = QCoreApplication.instance() or QCoreApplication([])
+    direct = Qt.ConnectionType.DirectConnection
+    asr = TranscribeWorker()
+    asr.verify_speculation = True
+    asr.max_wait = float("inf")  # 不因排队超时丢句，保证每句都有结果
+    vad = FullSentenceWorker(
+        source=AudioReplay(audio, realtime=True),
+        speculative_silence_ms=args.speculative_silence,
+    )
+    sentences = []
+    vad.sentence_ready.connect(lambda trace_id, _: sentences.append(trace_id), direct)
+    vad.sentence_ready.connect(asr.on_sentence_audio, direct)
+    vad.speech_paused.connect(asr.on_speech_paused)
+    vad.speech_resumed.connect(asr.cancel_speculation, direct)
+
+    vad_thread, asr_thread = QThread(), QThread()
+    vad.moveToThread(vad_thread)
+    asr.moveToThread(asr_thread)
+    vad_thread.started.connect(vad.start_listening)
+    vad.finished.connect(vad_thread.quit, direct)
+
+    def check_done():
+        # 回放结束后还要等识别线程处理完排队的语句
+        queue = asr.queue_stats
+        handled = queue.utterances + sum(queue.dropped.values())
+        if vad_thread.isFinished() and handled >= len(sentences):
+            app.quit()
+
+    poll = QTimer()
+    poll.timeout.connect(check_done)
+    poll.start(100)
+    asr_thread.start()
+    vad_thread.start()
+    app.exec()
+    poll.stop()
+    asr_thread.quit()
+    asr_thread.wait()
+    stats = asr.speculation
+    return {
+        "speculative.hit_rate": stats.committed / stats.started if stats.started else 0,
+        "speculative.mismatch_rate": (
+            stats.mismatched / stats.verified if stats.verified else 0
+        ),
+        "speculative.saved_ms_mean": (
+            stats.saved_seconds / stats.committed * 1000 if stats.committed else 0
+        ),
+        "speculative.wasted_s_per_audio_min": stats.wasted_seconds
+        / (len(audio) / 16000 / 60),
+        "speculative.count": stats.started,
+    }
+
+
+def bench_detector(args) -> dict:
+    from PySide6.QtCore import Qt
+
+    from src.screen_worker import ScreenChangeDetector
+
+    replay = load_frames(args)
+    detector = ScreenChangeDetector(source=replay)
+    # 不等待，测量检测器本身的吞吐
+    detector.min_interval = detector.max_interval = detector.interval = 0
+    events = []
+    # 检测器线程没有事件循环，直接在发射线程中调用
+    detector.significant_change_detected.connect(
+        events.append, Qt.ConnectionType.DirectConnection
+    )
+    thread = threading.Thread(target=detector.start_detecting, daemon=True)
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    thread.start()
+    replay.exhausted.wait()
+    detector.stop_detecting()
+    thread.join()
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+    return {
+        "detector.fps": replay.grabs / wall,
+        "detector.cpu_ms_per_frame": cpu / replay.grabs * 1000,
+        "detector.frames": replay.grabs,
+        "detector.events": len(events),
+    }
+
+
+def bench_e2e(args) -> dict:
+    """Controller + AgentWorker（模拟 LLM 后端）+ 回放画面的检测器，测量到气泡显示的延迟。
+
+    气泡用一个记录 bubble_shown 的槽代替；语音直接从 ASR 输出开始注入。
+    """
+    from PySide6.QtCore import QCoreApplication, QThread, QTimer
+
+    from src.agent import AgentWorker
+    from src.controller import Controller
+    from src.llm_backend import BackendConfig, LLMBackend
+    from src.screen_dedup import ScreenDedupFilter
+    from src.screen_encoder import ScreenEncoder
+    from src.screen_worker import ScreenChangeDetector
+
+    app = QCoreApplication.instance() or QCoreApplication([])
+    tracer.clear()
+    backend = LLMBackend(
+        BackendConfig(backend="mock", mock_first_token=args.mock_first_token)
+    )
+    encoder = ScreenEncoder()
+    agent = AgentWorker(
+        encoder=encoder, memory=None, cache=None, backend=backend, streaming=True
+    )
+    controller = Controller()
+    dedup = ScreenDedupFilter()
+    controller.text_accepted.connect(agent.on_text_input)
+    controller.screen_accepted.connect(agent.on_screen_change)
+    controller.cancel_requested.connect(agent.cancel)
+    agent.run_finished.connect(controller.on_agent_done)
+    agent.response_started.connect(lambda i: tracer.mark(i, "bubble_shown"))
+    agent.response_ready.connect(lambda i, _: tracer.mark(i, "bubble_shown"))
+    dedup.screen_passed.connect(controller.on_screen_change)
+
+    replay = load_frames(args, realtime=True, fps=args.frame_fps)
+    detector = ScreenChangeDetector(source=replay, encoder=encoder)
+    screen_thread = QThread()
+    detector.moveToThread(screen_thread)
+    screen_thread.started.connect(detector.start_detecting)
+    detector.significant_change_detected.connect(dedup.on_screen_change)
+    screen_thread.start()
+
+    sent = [0]
+
+    def send_voice():
+        text = UTTERANCES[sent[0] % len(UTTERANCES)]
+        trace_id = tracer.begin("voice")
+        tracer.mark(trace_id, "asr_end")
+        controller.on_text_input(trace_id, text)
+        sent[0] += 1
+        if sent[0] < args.utterances:
+            QTimer.singleShot(int(args.utterance_interval * 1000), send_voice)
+
+    def check_done():
+        if (
+            sent[0] >= args.utterances
+            and replay.exhausted.is_set()
+            and not controller.is_busy
+            and controller.queue_depth == 0
+        ):
+            app.quit()
+
+    QTimer.singleShot(int(args.utterance_interval * 1000), send_voice)
+    poll = QTimer()
+    poll.timeout.connect(check_done)
+    poll.start(100)
+    app.exec()
+    poll.stop()
+
+    detector.stop_detecting()
+    screen_thread.quit()
+    screen_thread.wait()
+    agent.shutdown(wait=True)
+    encoder.shutdown()
+    backend.close()
+
+    results = {}
+    for kind, stages in tracer.summary().items():
+        for stage in ("llm_first_token", "bubble_shown"):
+            if stage in stages:
+                for k, v in stages[stage].items():
+                    results[f"e2e.{kind}.{stage}_{k}"] = v
+    return results
+
+
+# ── 结果比较 ──
+
+
+def higher_is_better(key: str) -> bool:
+    return key.endswith(("fps", "hit_rate", "throughput", "saved_ms_mean"))
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """返回退化超过 tolerance（相对值）的指标说明；计数类指标不参与比较。"""
+    regressions = []
+    for key, value in results.items():
+        old = baseline.get(key)
+        if (
+            not isinstance(old, (int, float))
+            or not old
+            or key.endswith(("count", "sentences", "segments", "frames", "events"))
+        ):
+            continue
+        change = (value - old) / old
+        if higher_is_better(key):
+            change = -change
+        if change > tolerance:
+            regressions.append(f"{key}: {old:.3f} -> {value:.3f} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--only",
+        default=",".join(SECTIONS),
+        help=f"只运行这些环节，逗号分隔（{', '.join(SECTIONS)}）",
+    )
+    parser.add_argument("--audio", help="回放的 WAV / NPY 音频，默认合成 60 秒")
+    parser.add_argument("--audio-seconds", type=float, default=60)
+    parser.add_argument("--asr-segment", type=float, default=4.0)
+    parser.add_argument("--asr-segments", type=int, default=10)
+    parser.add_argument("--asr-backlog", type=int, default=8)
+    parser.add_argument("--asr-batch", type=int, default=4)
+    parser.add_argument("--asr-short-clips", type=int, default=20)
+    parser.add_argument("--speculative-silence", type=int, default=120)
+    parser.add_argument("--frames", help="回放的截图目录、视频文件或 .npy 帧数组")
+    parser.add_argument("--frame-count", type=int, default=600)
+    parser.add_argument("--frame-fps", type=float, default=30)
+    parser.add_argument("--utterances", type=int, default=12)
+    parser.add_argument("--utterance-interval", type=float, default=1.5)
+    parser.add_argument("--mock-first-token", type=float, default=0.3)
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    parser.add_argument("--baseline", help="与之前保存的结果比较")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    sections = [s for s in args.only.split(",") if s]
+
+    if args.audio:
+        audio = AudioReplay.from_file(args.audio).audio
+    else:
+        audio = synthetic_audio(args.audio_seconds)
+
+    results: dict[str, float] = {}
+    sentences: list[np.ndarray] = []
+    for section in sections:
+        print(f"== {section} ==")
+        try:
+            if section == "vad":
+                result, sentences = bench_vad(args, audio)
+            elif section == "asr":
+                result = bench_asr(args, audio, sentences)
+            elif section == "asr_batch":
+                result = bench_asr_batch(args, audio, sentences)
+            elif section == "asr_short":
+                result = bench_asr_short(args, audio)
+            elif section == "speculative":
+                result = bench_speculative(args, audio)
+            elif section == "detector":
+                result = bench_detector(args)
+            elif section == "e2e":
+                result = bench_e2e(args)
+            else:
+                parser.error(f"未知环节: {section}")
+        except ImportError as e:
+            print(f"跳过 {section}：缺少依赖 ({e.name})")
+            continue
+        results.update(result)
+
+    print("\n== 结果 ==")
+    for key, value in results.items():
+        print(f"{key:<36} {value:10.3f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n相对基线退化超过 {args.tolerance:.0%}:")
+            print("\n".join(f"  {line}" for line in regressions))
+            sys.exit(1)
+        print(f"\n与基线相比没有超过 {args.tolerance:.0%} 的退化")
+
+
+if __name__ == "__main__":
+    main()
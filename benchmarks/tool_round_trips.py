@@ -0,0 +1,73 @@
+"""工具调用往返基准：用模拟 LLM 服务统计每条回复的模型调用次数和空回复数。
+
+python -m benchmarks.tool_round_trips --replies 20
+
+三种模拟响应：不调用工具；先写文本再调用 perform；只调用 perform、
+收到工具结果后才写文本（Gemini 常见）。
+"""
+
+import argparse
+import threading
+
+from PySide6.QtCore import Qt
+
+from src.agent import AgentWorker
+from src.llm_backend import BackendConfig, LLMBackend
+
+UTTERANCES = ["在吗", "帮我看看这段代码", "今天好累", "我去吃饭了", "这个报错怎么办"]
+SCENARIOS = {
+    "无工具调用": {},
+    "文本后调用 perform": {"mock_tool_call_every": 1},
+    "先调用 perform": {"mock_tool_call_every": 1, "mock_tool_call_first": True},
+}
+
+
+def run_scenario(config: BackendConfig, replies: int, streaming: bool) -> dict:
+    backend = LLMBackend(config)
+    # 保留全部轮次，摘要请求不会混入模拟服务的请求计数
+    agent = AgentWorker(
+        streaming=streaming,
+        history_turns=replies,
+        memory=None,
+        cache=None,
+        backend=backend,
+    )
+    done = threading.Event()
+    texts: list[str] = []
+    # 没有事件循环，信号在请求所在的线程中直接调用
+    direct = Qt.ConnectionType.DirectConnection
+    agent.response_ready.connect(lambda _, reply: texts.append(reply), direct)
+    agent.run_finished.connect(lambda _: done.set(), direct)
+    for i in range(replies):
+        done.clear()
+        agent.on_text_input(i, UTTERANCES[i % len(UTTERANCES)])
+        done.wait(30)
+    requests = backend.mock_server.requests
+    agent.shutdown(wait=True)
+    backend.close()
+    return {
+        "calls": requests / replies,
+        "empty": replies - sum(bool(text) for text in texts),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--replies", type=int, default=20)
+    parser.add_argument("--no-stream", dest="stream", action="store_false")
+    parser.add_argument("--mock-first-token", type=float, default=0.05)
+    args = parser.parse_args()
+
+    for name, options in SCENARIOS.items():
+        config = BackendConfig(
+            backend="mock", mock_first_token=args.mock_first_token, **options
+        )
+        result = run_scenario(config, args.replies, args.stream)
+        print(
+            f"{name}: 模型调用 {result['calls']:.2f} 次/回复, "
+            f"空回复 {result['empty']}/{args.replies}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""XDamage 事件驱动截图的行为检查：他人窗口的重绘能唤醒检测，自身窗口的重绘不能。
+
+在 Xvfb 虚拟屏幕上运行（无窗口管理器，窗口位置即创建时的坐标）：
+
+    xvfb-run -s "-screen 0 1280x720x24 +extension DAMAGE" \\
+        python -m benchmarks.xdamage_check
+
+任一检查失败时返回非零。
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import threading
+import time
+
+from src.screen_worker import ScreenChangeDetector
+from src.window_mask import OwnWindowMask, Rect
+from src.xdamage import XDamageMonitor
+
+
+class TestWindows:
+    """用 Xlib 在独立的连接上创建并绘制窗口，模拟其他程序与本程序的窗口。"""
+
+    def __init__(self):
+        x11 = ctypes.CDLL(ctypes.util.find_library("X11"))
+        x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        x11.XOpenDisplay.restype = ctypes.c_void_p
+        x11.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        x11.XDefaultRootWindow.restype = ctypes.c_ulong
+        x11.XDefaultScreen.argtypes = [ctypes.c_void_p]
+        x11.XDefaultGC.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x11.XDefaultGC.restype = ctypes.c_void_p
+        x11.XCreateSimpleWindow.argtypes = [
+            ctypes.c_void_p,
+            ctypes.c_ulong,
+            ctypes.c_int,  # x
+            ctypes.c_int,  # y
+            ctypes.c_uint,  # width
+            ctypes.c_uint,  # height
+            ctypes.c_uint,  # border_width
+            ctypes.c_ulong,  # border
+            ctypes.c_ulong,  # background
+        ]
+        x11.XCreateSimpleWindow.restype = ctypes.c_ulong
+        x11.XMapWindow.argtypes = [ctypes.c_void_p, ctypes.c_ulong]
+        x11.XSetForeground.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_ulong]
+        x11.XFillRectangle.argtypes = [
+            ctypes.c_void_p,
+            ctypes.c_ulong,
+            ctypes.c_void_p,
+            ctypes.c_int,
+            ctypes.c_int,
+            ctypes.c_uint,
+            ctypes.c_uint,
+        ]
+        x11.XSync.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x11.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        self._x11 = x11
+        self._display = x11.XOpenDisplay(None)
+        if not self._display:
+            raise SystemExit("无法连接 X 服务器，请在 xvfb-run 下运行")
+        self._gc = x11.XDefaultGC(self._display, x11.XDefaultScreen(self._display))
+        self._lock = threading.Lock()
+        self._color = 0
+
+    def create(self, rect: Rect) -> int:
+        x, y, w, h = rect
+        root = self._x11.XDefaultRootWindow(self._display)
+        window = self._x11.XCreateSimpleWindow(
+            self._display, root, x, y, w, h, 0, 0, 0xFFFFFF
+        )
+        self._x11.XMapWindow(self._display, window)
+        self._x11.XSync(self._display, 0)
+        return window
+
+    def draw(self, window: int, w: int, h: int):
+        """整窗填充一个新颜色并等待服务器处理完成。"""
+        with self._lock:
+            self._color = (self._color + 0x102030) & 0xFFFFFF
+            self._x11.XSetForeground(self._display, self._gc, self._color)
+            self._x11.XFillRectangle(self._display, window, self._gc, 0, 0, w, h)
+            self._x11.XSync(self._display, 0)
+
+    def close(self):
+        self._x11.XCloseDisplay(self._display)
+
+
+def intersects(a: Rect, b: Rect) -> bool:
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    return ax < bx + bw and bx < ax + aw and ay < by + bh and by < ay + ah
+
+
+def settle(monitor: XDamageMonitor):
+    """丢弃窗口创建、映射产生的重绘事件。"""
+    while monitor.wait(0.2):
+        pass
+
+
+def animate(windows: TestWindows, window: int, rect: Rect, stop: threading.Event):
+    """以 60fps 重绘窗口，模拟 Live2D 模型的动画。"""
+    while not stop.is_set():
+        windows.draw(window, rect[2], rect[3])
+        time.sleep(1 / 60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=3)
+    args = parser.parse_args()
+
+    monitor = XDamageMonitor.create()
+    if monitor is None:
+        raise SystemExit("XDamage 不可用（需要 X11 与 libXdamage）")
+    windows = TestWindows()
+    other_rect, own_rect = (100, 100, 200, 150), (600, 300, 300, 400)
+    other = windows.create(other_rect)
+    own = windows.create(own_rect)
+    mask = OwnWindowMask()
+    mask.set(own, own_rect)
+    settle(monitor)
+    failures = []
+
+    # 1. 其他窗口的重绘应在超时前唤醒，且重绘区域落在该窗口内
+    windows.draw(other, other_rect[2], other_rect[3])
+    start = time.perf_counter()
+    rects = monitor.wait(2.0, ignore=mask.rects)
+    elapsed = time.perf_counter() - start
+    print(f"其他窗口重绘: {elapsed * 1000:.0f} ms 后唤醒, 区域 {rects}")
+    if not rects or not all(intersects(r, other_rect) for r in rects):
+        failures.append("其他窗口的重绘没有唤醒等待，或区域不在窗口内")
+
+    # 2. 自身窗口持续重绘时，等待应一直阻塞到超时
+    stop = threading.Event()
+    painter = threading.Thread(
+        target=animate, args=(windows, own, own_rect, stop), daemon=True
+    )
+    painter.start()
+    timeout = 0.5
+    start = time.perf_counter()
+    rects = monitor.wait(timeout, ignore=mask.rects)
+    elapsed = time.perf_counter() - start
+    print(f"自身窗口 60fps 重绘: 等待 {elapsed * 1000:.0f} ms, 区域 {rects}")
+    if rects or elapsed < timeout * 0.9:
+        failures.append("自身窗口的重绘唤醒了等待")
+
+    # 3. 检测循环：自身窗口持续重绘期间，只有超时返回，没有截图
+    detector = ScreenChangeDetector(1, window_mask=mask, capture="damage")
+    calls = frames = 0
+    next_damaged_frame = detector.next_damaged_frame
+
+    def counted():
+        nonlocal calls, frames
+        calls += 1
+        frame = next_damaged_frame()
+        frames += frame is not None
+        return frame
+
+    detector.next_damaged_frame = counted
+    thread = threading.Thread(target=detector.start_detecting, daemon=True)
+    thread.start()
+    time.sleep(args.seconds)
+    detector.stop_detecting()
+    thread.join()
+    stop.set()
+    painter.join()
+    limit = args.seconds / detector.max_interval + 2
+    print(f"检测循环 {args.seconds:.0f}s: 唤醒 {calls} 次, 截取重绘区域 {frames} 次")
+    if calls == 0:
+        failures.append("检测器没有使用 XDamage")
+    if frames or calls > limit:
+        failures.append(f"自身窗口的重绘唤醒了检测循环（上限 {limit:.0f} 次超时唤醒）")
+
+    monitor.close()
+    windows.close()
+    if failures:
+        for failure in failures:
+            print(f"失败: {failure}")
+        raise SystemExit(1)
+    print("全部通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,9 +14,17 @@ from PySide6.QtWidgets import QApplication, QMenu
 from src.agent import AgentWorker
 from src.chat_bubble import ChatBubble
 from src.controller import Controller
-from src.screen_worker import ScreenChangeDetector
+from src.llm_backend import BACKENDS, BackendConfig, LLMBackend
+from src.memory_store import MemoryStore
+from src.response_cache import ResponseCache
+from src.screen_dedup import ScreenDedupFilter
+from src.screen_encoder import ScreenEncoder
+from src.screen_worker import FrameBudget, ScreenChangeDetector, available_monitors
+from src.tracing import tracer
+from src.transcribe_worker import PROFILES as ASR_PROFILES
 from src.transcribe_worker import TranscribeWorker
 from src.vad_worker import FullSentenceWorker
+from src.window_mask import OwnWindowMask, OwnWindowTracker
 
 
 class Live2DWidget(QOpenGLWidget):
@@ -154,13 +162,17 @@ class Live2DWidget(QOpenGLWidget):
             self.model.ResetExpressions()
             print("[Live2D] 气泡消失，表情已重置")
 
-    def on_significant_screen_change(self, score, _img):
-        print(f"屏幕显著变化: {score:.2f}")
+    def on_significant_screen_change(self, event):
+        print(
+            f"屏幕 {event.monitor} 显著变化: {event.score:.2f} "
+            f"(变化瓦片 {event.changed_count} 个)"
+        )
 
-    def on_agent_response(self, text):
+    def on_agent_response(self, request_id, text):
         """收到 Agent 回复时，通过对话气泡显示。"""
         if self.chat_bubble is not None:
             self.chat_bubble.show_message(text)
+            tracer.mark(request_id, "bubble_shown")
 
     def _apply_initial_expressions(self):
         """加载模型目录下的指定表情文件，自动应用参数"""
@@ -190,6 +202,22 @@ class Live2DWidget(QOpenGLWidget):
                 print(f"[表情] 加载失败 {exp_name}: {e}")
 
 
+def monitor_threshold(text: str) -> tuple[int, float]:
+    """解析 --monitor-thresholds 的一项 IDX=VALUE。"""
+    idx, sep, value = text.partition("=")
+    try:
+        if not sep:
+            raise ValueError
+        monitor_idx, threshold = int(idx), float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"格式应为 显示器编号=阈值，例如 2=30: {text!r}"
+        ) from None
+    if monitor_idx < 1 or not threshold >= 0:
+        raise argparse.ArgumentTypeError(f"显示器编号从 1 开始，阈值不能为负: {text!r}")
+    return monitor_idx, threshold
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Yuuki Desktop")
     parser.add_argument(
@@ -203,6 +231,160 @@ if __name__ == "__main__":
         default=["水印关闭.exp3.json"],
         help="启动时自动应用的表情文件列表",
     )
+    parser.add_argument(
+        "--monitors",
+        nargs="*",
+        type=int,
+        default=None,
+        help="需要检测屏幕变化的显示器编号（从 1 开始），默认全部",
+    )
+    parser.add_argument(
+        "--monitor-thresholds",
+        nargs="*",
+        type=monitor_threshold,
+        default=[],
+        metavar="IDX=VALUE",
+        help="按显示器覆盖屏幕变化全局阈值，例如 2=30",
+    )
+    parser.add_argument(
+        "--screen-fps",
+        type=float,
+        default=30,
+        help="所有显示器合计的最大截图帧率",
+    )
+    parser.add_argument(
+        "--image-format",
+        choices=["auto", "jpeg", "webp", "png"],
+        default="auto",
+        help="发送给 Agent 的截图编码格式；auto 按字节预算在 PNG 与 JPEG 之间选择",
+    )
+    parser.add_argument(
+        "--image-budget-kb",
+        type=int,
+        default=300,
+        help="单张截图的目标大小上限（KB），超出时逐级降低分辨率和质量",
+    )
+    parser.add_argument(
+        "--screen-roi",
+        action="store_true",
+        help="只把屏幕上发生变化的区域裁剪后发给 Agent",
+    )
+    parser.add_argument(
+        "--no-roi-thumbnail",
+        dest="roi_thumbnail",
+        action="store_false",
+        help="ROI 模式下不附带整屏缩略图",
+    )
+    parser.add_argument(
+        "--screen-capture",
+        choices=["poll", "damage"],
+        default="poll",
+        help=(
+            "截图方式：定时轮询（默认），或等待 X11 XDamage 重绘通知"
+            "（实验性，仅 Linux X11，尚未在真实 X 服务器上验证）"
+        ),
+    )
+    parser.add_argument(
+        "--no-stream",
+        dest="stream",
+        action="store_false",
+        help="关闭流式回复，等完整回复生成后再一次性显示",
+    )
+    parser.add_argument(
+        "--history-budget",
+        type=int,
+        default=8000,
+        help="对话历史的 token 预算，超出部分折叠进滚动摘要",
+    )
+    parser.add_argument(
+        "--history-turns",
+        type=int,
+        default=6,
+        help="按原文保留的最近对话轮数",
+    )
+    parser.add_argument(
+        "--history-full-images",
+        type=int,
+        default=2,
+        help="历史中保留原图的最近截图轮数，更早的截图缩为缩略图",
+    )
+    parser.add_argument(
+        "--memory-db",
+        default="data/memory.db",
+        help="长期记忆数据库路径（SQLite）",
+    )
+    parser.add_argument(
+        "--no-memory",
+        dest="memory",
+        action="store_false",
+        help="关闭长期记忆",
+    )
+    parser.add_argument(
+        "--response-cache",
+        default="data/response_cache.json",
+        help="回复缓存文件路径",
+    )
+    parser.add_argument(
+        "--no-response-cache",
+        dest="use_response_cache",
+        action="store_false",
+        help="关闭回复缓存",
+    )
+    parser.add_argument(
+        "--cache-variants",
+        type=int,
+        default=3,
+        help="同一输入收集多少条不同回复后才开始复用（1 表示总是复用同一条）",
+    )
+    parser.add_argument(
+        "--llm-backend",
+        choices=BACKENDS,
+        default="gemini",
+        help="LLM 后端：Gemini、OpenAI 兼容接口，或本地模拟服务（离线测试延迟）",
+    )
+    parser.add_argument("--llm-model", help="模型 ID，默认取决于后端")
+    parser.add_argument(
+        "--llm-base-url", help="OpenAI 兼容接口地址，例如 http://localhost:11434/v1"
+    )
+    parser.add_argument(
+        "--llm-timeout", type=float, default=30.0, help="单次 LLM 请求超时（秒）"
+    )
+    parser.add_argument(
+        "--llm-retries", type=int, default=2, help="LLM 请求失败后的最大重试次数"
+    )
+    parser.add_argument(
+        "--mock-first-token",
+        type=float,
+        default=0.3,
+        help="模拟服务的首 token 延迟（秒）",
+    )
+    parser.add_argument(
+        "--streaming-asr",
+        action="store_true",
+        help="说话期间就开始识别，语音结束后只需识别最后一小段",
+    )
+    parser.add_argument(
+        "--speculative-silence",
+        type=int,
+        metavar="MS",
+        help="推测识别：静音达到此毫秒数（小于 300）就开始识别，确认结束后立即提交",
+    )
+    parser.add_argument(
+        "--asr-profile",
+        choices=["auto", *ASR_PROFILES],
+        default="auto",
+        help="ASR 推理配置：auto 在有 CUDA 时用 bf16，否则用 fp32；int8 为 CPU 动态量化",
+    )
+    parser.add_argument(
+        "--asr-threads", type=int, help="ASR 推理使用的 CPU 线程数，默认由 torch 决定"
+    )
+    parser.add_argument(
+        "--trace-json", help="退出时把各阶段延迟追踪导出为 JSON（每条追踪 + 分位数）"
+    )
+    parser.add_argument(
+        "--chrome-trace",
+        help="退出时导出 Chrome Trace 格式的追踪，可在 chrome://tracing 或 Perfetto 中查看",
+    )
     args, remaining = parser.parse_known_args()
     load_dotenv()
 
@@ -222,19 +404,74 @@ if __name__ == "__main__":
     chat_bubble.dismissed.connect(widget.on_bubble_dismissed)
     widget.chat_bubble = chat_bubble
 
-    # 输入控制器（主线程，Agent 忙碌时丢弃新输入）
+    # 跟踪自身窗口位置，屏幕检测时排除模型动画和气泡
+    own_windows = OwnWindowMask()
+    window_tracker = OwnWindowTracker(own_windows)
+    window_tracker.track(widget)
+    window_tracker.track(chat_bubble)
+
+    # 输入调度器（主线程，语音优先、屏幕事件合并，带超时看门狗）
     controller = Controller()
 
+    # 截图编码线程池（检测器在等待画面稳定时即可开始编码）
+    screen_encoder = ScreenEncoder(
+        byte_budget=args.image_budget_kb * 1024, fmt=args.image_format
+    )
+    app.aboutToQuit.connect(screen_encoder.shutdown)
+
+    # 长期记忆（SQLite FTS5），作为工具集交给 Agent
+    memory = MemoryStore(args.memory_db) if args.memory else None
+    if memory is not None:
+        print(f"[Memory] 已加载 {len(memory)} 条记忆: {args.memory_db}")
+        app.aboutToQuit.connect(memory.close)
+
+    # 回复缓存：重复的口头语和隔一段时间又回到的画面直接复用之前的回复
+    response_cache = None
+    if args.use_response_cache:
+        response_cache = ResponseCache(
+            args.response_cache, variants=args.cache_variants
+        )
+        app.aboutToQuit.connect(response_cache.save)
+
+    llm_backend = LLMBackend(
+        BackendConfig(
+            backend=args.llm_backend,
+            model_id=args.llm_model,
+            base_url=args.llm_base_url,
+            timeout=args.llm_timeout,
+            max_retries=args.llm_retries,
+            mock_first_token=args.mock_first_token,
+        )
+    )
+    app.aboutToQuit.connect(llm_backend.close)
+
     # 启动 Agent 线程
     agent_thread = QThread()
-    agent_worker = AgentWorker()
+    agent_worker = AgentWorker(
+        encoder=screen_encoder,
+        streaming=args.stream,
+        history_budget=args.history_budget,
+        history_turns=args.history_turns,
+        history_full_images=args.history_full_images,
+        memory=memory,
+        cache=response_cache,
+        backend=llm_backend,
+    )
     agent_worker.moveToThread(agent_thread)
     # Controller -> AgentWorker（转发被接受的输入）
     controller.text_accepted.connect(agent_worker.on_text_input)
     controller.screen_accepted.connect(agent_worker.on_screen_change)
-    # AgentWorker -> 对话气泡 + Controller（解除忙碌）
+    # Controller 抢占 / 超时 -> 取消进行中的请求
+    controller.cancel_requested.connect(agent_worker.cancel)
+    app.aboutToQuit.connect(agent_worker.shutdown)
+    # AgentWorker 流式回复 -> 对话气泡逐段显示
+    agent_worker.response_started.connect(chat_bubble.begin_stream)
+    agent_worker.response_delta.connect(chat_bubble.append_text)
+    agent_worker.response_discarded.connect(chat_bubble.discard_stream)
+    # AgentWorker -> 对话气泡
     agent_worker.response_ready.connect(widget.on_agent_response)
-    agent_worker.response_ready.connect(controller.on_agent_done)
+    # AgentWorker 处理结束 -> Controller 派发下一个请求
+    agent_worker.run_finished.connect(controller.on_agent_done)
     # Widget 模型加载完成 -> AgentWorker 接收表情/动作信息
     widget.model_info_ready.connect(agent_worker.on_model_info)
     # AgentWorker 工具调用 -> Widget 执行表情/动作
@@ -242,20 +479,44 @@ if __name__ == "__main__":
     agent_worker.motion_requested.connect(widget.on_start_motion)
     agent_thread.start()
 
-    screen_thread = QThread()
-    detector = ScreenChangeDetector()
-    detector.moveToThread(screen_thread)
-    screen_thread.started.connect(detector.start_detecting)
-    detector.significant_change_detected.connect(widget.on_significant_screen_change)
-    # 屏幕变化 -> Controller 过滤
-    detector.significant_change_detected.connect(controller.on_screen_change)
-    detector.finished.connect(screen_thread.quit)
-    app.aboutToQuit.connect(detector.stop_detecting)
-    screen_thread.start()
+    # 每个显示器一条检测流水线，共享全局截图帧率预算，事件汇入同一个去重过滤器
+    monitor_thresholds = dict(args.monitor_thresholds)
+    frame_budget = FrameBudget(max_fps=args.screen_fps)
+    # 屏幕变化 -> 感知哈希去重 -> Controller 过滤
+    dedup_filter = ScreenDedupFilter()
+    dedup_filter.screen_passed.connect(controller.on_screen_change)
+    screen_threads = []
+    detectors = []
+    for monitor_idx in args.monitors or available_monitors():
+        screen_thread = QThread()
+        detector = ScreenChangeDetector(
+            monitor_idx,
+            threshold=monitor_thresholds.get(monitor_idx, 50),
+            budget=frame_budget,
+            encoder=screen_encoder,
+            roi_mode=args.screen_roi,
+            roi_thumbnail=args.roi_thumbnail,
+            window_mask=own_windows,
+            capture=args.screen_capture,
+        )
+        detector.moveToThread(screen_thread)
+        screen_thread.started.connect(detector.start_detecting)
+        detector.significant_change_detected.connect(
+            widget.on_significant_screen_change
+        )
+        detector.significant_change_detected.connect(dedup_filter.on_screen_change)
+        detector.finished.connect(screen_thread.quit)
+        app.aboutToQuit.connect(detector.stop_detecting)
+        screen_thread.start()
+        screen_threads.append(screen_thread)
+        detectors.append(detector)
 
     # 启动 VAD 语音监听
     vad_thread = QThread()
-    vad_worker = FullSentenceWorker()
+    vad_worker = FullSentenceWorker(
+        chunk_seconds=0.5 if args.streaming_asr else None,
+        speculative_silence_ms=args.speculative_silence,
+    )
     vad_worker.moveToThread(vad_thread)
     vad_thread.started.connect(vad_worker.start_listening)
     vad_worker.finished.connect(vad_thread.quit)
@@ -264,9 +525,21 @@ if __name__ == "__main__":
 
     # 启动 ASR 语音识别
     asr_thread = QThread()
-    asr_worker = TranscribeWorker()
+    asr_worker = TranscribeWorker(profile=args.asr_profile, threads=args.asr_threads)
     asr_worker.moveToThread(asr_thread)
-    vad_worker.sentence_ready.connect(asr_worker.on_sentence_audio)
+    # 整句在 VAD 线程中直接放入 ASR 的有界队列，识别线程按批取出
+    vad_worker.sentence_ready.connect(
+        asr_worker.on_sentence_audio, Qt.ConnectionType.DirectConnection
+    )
+    if args.streaming_asr:
+        # 说话期间的音频段 -> ASR 滚动识别
+        vad_worker.speech_chunk.connect(asr_worker.on_speech_chunk)
+    if args.speculative_silence is not None:
+        # 短暂停顿 -> ASR 提前识别；恢复说话时在 VAD 线程中直接作废推测
+        vad_worker.speech_paused.connect(asr_worker.on_speech_paused)
+        vad_worker.speech_resumed.connect(
+            asr_worker.cancel_speculation, Qt.ConnectionType.DirectConnection
+        )
     # ASR 转写文本 -> Controller 过滤
     asr_worker.transcription_ready.connect(controller.on_text_input)
     asr_thread.start()
@@ -274,4 +547,12 @@ if __name__ == "__main__":
     widget.show()
     app.exec()
 
+    print(tracer.describe())
+    if args.trace_json:
+        tracer.export_json(args.trace_json)
+        print(f"[Trace] 已导出 {args.trace_json}")
+    if args.chrome_trace:
+        tracer.export_chrome_trace(args.chrome_trace)
+        print(f"[Trace] 已导出 {args.chrome_trace}")
+
     live2d.dispose()
@@ -1,99 +1,202 @@
-import cv2
-import numpy as np
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 from agno.agent import Agent, Toolkit
+from agno.exceptions import StopAgentRun
 from agno.media import Image
-from agno.models.google import Gemini
+from agno.models.message import Message
+from agno.run import RunContext
+from agno.run.agent import (
+    ModelRequestCompletedEvent,
+    RunCompletedEvent,
+    RunContentEvent,
+    RunErrorEvent,
+    RunStatus,
+)
 from PySide6.QtCore import QObject, Signal, Slot
 
-from src.prompt import sys_prompt
+from src.history import ConversationHistory, Turn, estimate_tokens
+from src.llm_backend import LLMBackend
+from src.memory_store import MemoryStore, MemoryTools
+from src.prompt import summary_prompt, sys_prompt
+from src.response_cache import ResponseCache
+from src.screen_encoder import ScreenEncoder
+from src.screen_worker import ScreenEvent
+from src.tracing import tracer
 
 
 class Live2dTools(Toolkit):
-    """Live2D 模型控制工具集，供 Agent 调用以切换表情和播放动作。"""
+    """Live2D 模型控制工具集，供 Agent 调用以切换表情和播放动作。
+
+    可用的表情和动作在模型加载后直接写进指令，模型无需先调用工具查询。
+    流式模式下，本次运行已经输出过回复文本时，perform 执行后立即结束运行，
+    不再把工具结果发回模型，大多数回复只需要一次模型调用；同一条响应里的
+    其他工具调用（例如 remember）在结束前照常执行。perform 出现在文本之前
+    （Gemini 常见）时不结束运行，模型会在下一次调用中写出回复文本。
+    """
 
     def __init__(self, agent_worker: "AgentWorker"):
-        super().__init__(
-            name="live2d_model_controls",
-            instructions=(
-                "使用这些工具来控制你的 Live2D 模型表情和动作。"
-                "当你想表达某种情绪时，调用 set_expression 切换表情；"
-                "当你想做出动作时，调用 start_motion 播放动作。"
-            ),
-            add_instructions=True,
-        )
         self._agent_worker = agent_worker
         self._expression_ids: list[str] = []
         self._motion_groups: dict[str, int] = {}
-        self.register(self.set_expression)
-        self.register(self.start_motion)
-        self.register(self.get_available_expressions)
-        self.register(self.get_available_motions)
+        # 动作只影响画面，结果无需交给模型，perform 返回空字符串
+        super().__init__(
+            name="live2d_model_controls",
+            tools=[self.perform],
+            show_result_tools=[],
+        )
+        self.instructions = self._render_instructions()
 
     def update_model_info(self, expression_ids: list, motion_groups: dict):
-        """更新可用的表情和动作信息。"""
+        """更新可用的表情和动作信息，并重新生成指令。"""
         self._expression_ids = expression_ids
         self._motion_groups = motion_groups
+        self.instructions = self._render_instructions()
 
-    def get_available_expressions(self) -> str:
-        """获取当前模型所有可用的表情 ID 列表。"""
-        if not self._expression_ids:
-            return "当前没有可用的表情。"
-        return "可用表情: " + ", ".join(self._expression_ids)
-
-    def get_available_motions(self) -> str:
-        """获取当前模型所有可用的动作组及每组动作数量。"""
-        if not self._motion_groups:
-            return "当前没有可用的动作。"
-        items = [
-            f"{group}（{count}个动作，index: 0~{count - 1}）"
-            for group, count in self._motion_groups.items()
-        ]
-        return "可用动作组: " + ", ".join(items)
-
-    def set_expression(self, expression_id: str) -> str:
-        """切换 Live2D 模型的表情。
-
-        Args:
-            expression_id: 表情 ID，必须是 get_available_expressions 返回的有效 ID 之一。
-        """
-        if expression_id not in self._expression_ids:
-            return f"无效的表情 ID: {expression_id}。可用: {', '.join(self._expression_ids)}"
-        self._agent_worker.expression_requested.emit(expression_id)
-        return f"已切换表情: {expression_id}"
+    def _render_instructions(self) -> str:
+        if self._expression_ids:
+            expressions = ", ".join(self._expression_ids)
+        else:
+            expressions = "（无）"
+        if self._motion_groups:
+            motions = ", ".join(
+                f"{group}（index: 0~{count - 1}）"
+                for group, count in self._motion_groups.items()
+            )
+        else:
+            motions = "（无）"
+        return (
+            "## Live2D 模型控制\n"
+            "想表达情绪或做出动作时，先写出回复文本，再在同一条回复的末尾调用一次 "
+            "perform，不要单独为动作再回复一次；只想做表情不想说话时，可以只调用 perform。\n"
+            f"- 可用表情: {expressions}\n"
+            f"- 可用动作组: {motions}"
+        )
 
-    def start_motion(self, group: str, index: int = 0) -> str:
-        """播放 Live2D 模型的动作。
+    def perform(
+        self,
+        run_context: RunContext,
+        expression: str = "",
+        motion_group: str = "",
+        index: int = 0,
+    ) -> str:
+        """切换 Live2D 模型的表情并播放动作，两者都可以留空。
 
         Args:
-            group: 动作组名称，必须是 get_available_motions 返回的有效组名之一。
+            expression: 表情 ID，必须是指令中列出的可用表情之一，留空表示不切换。
+            motion_group: 动作组名称，必须是指令中列出的可用动作组之一，留空表示不播放。
             index: 动作在组内的索引，从 0 开始。
         """
-        if group not in self._motion_groups:
-            return (
-                f"无效的动作组: {group}。可用: {', '.join(self._motion_groups.keys())}"
-            )
-        max_idx = self._motion_groups[group] - 1
-        if index < 0 or index > max_idx:
-            return f"索引超出范围，{group} 的有效 index: 0~{max_idx}"
-        self._agent_worker.motion_requested.emit(group, index)
-        return f"已播放动作: {group}[{index}]"
+        results = []
+        if expression:
+            if expression in self._expression_ids:
+                self._agent_worker.expression_requested.emit(expression)
+                results.append(f"已切换表情: {expression}")
+            else:
+                results.append(f"无效的表情 ID: {expression}")
+        if motion_group:
+            count = self._motion_groups.get(motion_group, 0)
+            if 0 <= index < count:
+                self._agent_worker.motion_requested.emit(motion_group, index)
+                results.append(f"已播放动作: {motion_group}[{index}]")
+            else:
+                results.append(f"无效的动作: {motion_group}[{index}]")
+        print(f"[Agent] {'；'.join(results) or '未执行任何动作'}")
+        if self._agent_worker.has_streamed(run_context.run_id):
+            # 回复文本已经发出，不必再调用一次模型
+            raise StopAgentRun("动作已执行")
+        return ""
 
 
 class AgentWorker(QObject):
-    """Agent 工作线程：接收文本或屏幕截图，调用 LLM 并发射响应文本。"""
+    """Agent 工作线程：接收文本或屏幕截图，调用 LLM 并发射响应文本。
+
+    每个请求在线程池中执行，工作线程本身保持空闲，可以随时处理 cancel()；
+    被取消的请求停止接收流式输出，其结果不会再发给对话气泡。
+    agno 的 Agent 在实例上保存每次运行的状态（解析后的工具、取消用的运行记录），
+    不能被两个运行同时使用，因此每个并发的运行从池中取用独立的 Agent。
+    """
 
-    response_ready = Signal(str)
+    response_ready = Signal(int, str)  # (请求 ID, 完整回复)
+    # 请求处理结束（无论成功、出错、取消或无回复），携带请求 ID
+    run_finished = Signal(int)
+    response_started = Signal(int)  # 流式模式：请求收到第一段回复文本
+    response_delta = Signal(int, str)  # 流式模式：请求新到达的一段回复文本
+    response_discarded = Signal(int)  # 流式模式：已开始显示的请求被取消
     expression_requested = Signal(str)
     motion_requested = Signal(str, int)
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        encoder: ScreenEncoder | None = None,
+        streaming: bool = True,
+        history_budget: int = 8000,
+        history_turns: int = 6,
+        history_full_images: int = 2,
+        memory: MemoryStore | None = None,
+        cache: ResponseCache | None = None,
+        backend: LLMBackend | None = None,
+    ) -> None:
         super().__init__()
+        self.encoder = encoder or ScreenEncoder()
+        self.streaming = streaming
+        self.cache = cache
+        self.backend = backend or LLMBackend()
         self._live2d_tools = Live2dTools(self)
-        self.agent = Agent(
-            model=Gemini(id="gemini-3-flash-preview"),
-            system_message=sys_prompt,
-            tools=[self._live2d_tools],
+        self._memory_tools = MemoryTools(memory) if memory is not None else None
+        tools = [self._live2d_tools]
+        if self._memory_tools is not None:
+            tools.append(self._memory_tools)
+        self._toolkits = tools
+        # 被抢占的请求在收到首个 token 前无法中断，因此允许两个请求同时运行
+        self.max_concurrent_runs = 2
+        self._agents = [
+            Agent(
+                model=self.backend.create_model(),
+                system_message=self._system_message(),
+                tools=tools,
+            )
+            for _ in range(self.max_concurrent_runs)
+        ]
+        self._idle_agents: queue.SimpleQueue[Agent] = queue.SimpleQueue()
+        for agent in self._agents:
+            self._idle_agents.put(agent)
+        # 摘要用独立的 Agent，不带工具，不影响对话会话
+        self._summarizer = Agent(
+            model=self.backend.create_model(), system_message=summary_prompt
+        )
+        self.history = ConversationHistory(
+            history_budget,
+            history_turns,
+            summarizer=self._summarize,
+            full_image_turns=history_full_images,
         )
+        # 线程数与 Agent 数相同，取用 Agent 时不会等待
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.max_concurrent_runs, thread_name_prefix="agent-run"
+        )
+        self._lock = threading.Lock()
+        self._cancel_events: dict[int, threading.Event] = {}
+        # 统计每条回复平均需要几次模型调用（工具调用会额外增加往返）
+        self._replies = 0
+        self._model_calls = 0
+        # 已经输出过回复文本的流式运行，perform 据此决定是否结束运行
+        self._streamed_runs: set[str] = set()
+
+    def has_streamed(self, run_id: str) -> bool:
+        """该运行是否已经输出过回复文本（仅流式模式记录）。"""
+        return run_id in self._streamed_runs
+
+    def _system_message(self) -> str:
+        """人设提示词加上各工具集的指令。
+
+        设置了 system_message 时 agno 不会自动附加工具集指令，因此在这里拼接。
+        """
+        parts = [sys_prompt]
+        parts.extend(tool.instructions for tool in self._toolkits if tool.instructions)
+        return "\n\n".join(parts)
 
     # ── 模型信息接收 ──
 
@@ -101,46 +204,315 @@ class AgentWorker(QObject):
     def on_model_info(self, expression_ids: list, motion_groups: dict):
         """接收模型加载完成后的表情和动作信息。"""
         self._live2d_tools.update_model_info(expression_ids, motion_groups)
+        system_message = self._system_message()
+        for agent in self._agents:
+            agent.system_message = system_message
         print(
             f"[Agent] 已接收模型信息 - 表情: {len(expression_ids)} 个, 动作组: {len(motion_groups)} 个"
         )
 
     # ── 槽函数 ──
 
-    @Slot(str)
-    def on_text_input(self, text: str):
+    @Slot(int, str)
+    def on_text_input(self, request_id: int, text: str):
         """接收语音转文字后的文本，发送给 Agent 获取回复。"""
+        self._submit(request_id, self._handle_text, text)
+
+    @Slot(int, object)
+    def on_screen_change(self, request_id: int, event: ScreenEvent):
+        """接收屏幕变化事件，取得编码后的截图（整屏或变化区域）发给 Agent。"""
+        self._submit(request_id, self._handle_screen, event)
+
+    @Slot(int)
+    def cancel(self, request_id: int):
+        """取消进行中的请求：停止接收流式输出并丢弃其结果。"""
+        with self._lock:
+            cancelled = self._cancel_events.get(request_id)
+        if cancelled is None:
+            return
+        cancelled.set()
+        # 让 agno 在下一个检查点（模型分块、工具调用之间）中止运行
+        Agent.cancel_run(self._run_id(request_id))
+        print(f"[Agent] 取消请求 #{request_id}")
+
+    @Slot()
+    def shutdown(self, wait: bool = False):
+        """停止接收新请求；wait=True 时等待进行中的请求和摘要完成（用于基准测试）。"""
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+        self.history.shutdown(wait)
+
+    # ── 请求处理 ──
+
+    def _handle_text(self, request_id: int, cancelled: threading.Event, text: str):
         if not text.strip():
             return
+        print(f"[Agent] 收到文本输入: {text}")
+        key = self.cache.text_key(text) if self.cache is not None else None
+        if self._reply_from_cache(request_id, key, "voice", text):
+            return
+        self._run(request_id, cancelled, "voice", text, cache_key=key)
+
+    def _handle_screen(
+        self, request_id: int, cancelled: threading.Event, event: ScreenEvent
+    ):
+        score = event.score
+        payload = event.payload
+        if not payload.regions:
+            prompt = "主人的屏幕刚刚发生了变化，请根据屏幕内容做出你的反应。"
+        elif payload.with_thumbnail:
+            prompt = (
+                f"主人的屏幕刚刚发生了变化。前 {len(payload.regions)} 张图是"
+                "发生变化的局部区域，最后一张是整个屏幕的缩略图，"
+                "请根据屏幕内容做出你的反应。"
+            )
+        else:
+            prompt = (
+                "主人的屏幕刚刚发生了变化，这些图是发生变化的局部区域，"
+                "请根据屏幕内容做出你的反应。"
+            )
+        # 之前回到过的画面直接复用回复，省去编码和模型调用
+        key = None
+        if self.cache is not None and event.fingerprint is not None:
+            key = self.cache.screen_key(event.fingerprint, event.changed_tiles)
+        if self._reply_from_cache(request_id, key, "screen", prompt):
+            event.discard()
+            return
+
+        if payload.encoded:
+            # 检测器在等待画面稳定期间已提交编码
+            encoded = [future.result() for future in payload.encoded]
+            if payload.thumbnail is not None:
+                encoded.append(payload.thumbnail.result())
+        else:
+            img = event.image
+            if img is None:
+                print("[Agent] 截图已被新帧覆盖，跳过")
+                return
+            encoded = [self.encoder.encode(crop) for crop in payload.crops(img)]
+            if payload.regions and payload.with_thumbnail:
+                encoded.append(self.encoder.encode_thumbnail(img))
+            if not event.ring.is_valid(event.frame):
+                print("[Agent] 截图在读取时被覆盖，跳过")
+                return
+        if cancelled.is_set():
+            return
+        # 检测器提交的编码任务完成时已记录过 encoded，这里只对 Agent 自己编码的情况生效
+        tracer.mark(request_id, "encoded")
+
+        print(f"[Agent] 收到屏幕变化 (score={score:.2f})，发送截图给 Agent:")
+        for item in encoded:
+            print(f"  - {item.describe()}")
+        self._run(
+            request_id,
+            cancelled,
+            "screen",
+            prompt,
+            images=[
+                Image(content=item.data, mime_type=item.mime_type) for item in encoded
+            ],
+            cache_key=key,
+        )
+
+    # ── 内部方法 ──
+
+    @staticmethod
+    def _run_id(request_id: int) -> str:
+        return f"yuuki-request-{request_id}"
+
+    def _submit(self, request_id: int, handler, *args):
+        cancelled = threading.Event()
+        with self._lock:
+            self._cancel_events[request_id] = cancelled
+        self._pool.submit(self._execute, request_id, cancelled, handler, *args)
+
+    def _execute(self, request_id: int, cancelled: threading.Event, handler, *args):
+        """在线程池中运行请求，结束时总是发射 run_finished。"""
         try:
-            print(f"[Agent] 收到文本输入: {text}")
-            response = self.agent.run(text)
-            reply = response.content if response.content else ""
-            if reply:
-                print(f"[Agent] 回复: {reply}")
-                self.response_ready.emit(reply)
+            handler(request_id, cancelled, *args)
         except Exception as e:
-            print(f"[Agent Error] {e}")
+            if not cancelled.is_set():
+                print(f"[Agent Error] {e}")
+        finally:
+            with self._lock:
+                self._cancel_events.pop(request_id, None)
+            self.run_finished.emit(request_id)
 
-    @Slot(float, np.ndarray)
-    def on_screen_change(self, score: float, img: np.ndarray):
-        """接收屏幕截图（BGRA ndarray），编码为 PNG 发给 Agent 进行图像理解。"""
+    def _run(self, *args, **kwargs):
+        """从池中取一个空闲的 Agent 执行请求，结束后归还。"""
+        agent = self._idle_agents.get()
         try:
-            # BGRA -> BGR -> PNG bytes
-            bgr = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
-            success, buf = cv2.imencode(".png", bgr)
-            if not success:
-                return
-            png_bytes = buf.tobytes()
+            self._run_with(agent, *args, **kwargs)
+        finally:
+            self._idle_agents.put(agent)
 
-            print(f"[Agent] 收到屏幕变化 (score={score:.2f})，发送截图给 Agent...")
-            response = self.agent.run(
-                "主人的屏幕刚刚发生了变化，请根据屏幕内容做出你的反应。",
-                images=[Image(content=png_bytes, mime_type="image/png")],
+    def _run_with(
+        self,
+        agent: Agent,
+        request_id: int,
+        cancelled: threading.Event,
+        kind: str,
+        message: str,
+        images: list[Image] | None = None,
+        cache_key: str | None = None,
+    ):
+        """带上对话历史调用 Agent 并发射回复；请求被取消时丢弃结果。
+
+        流式模式下每收到一段文本就发射 response_delta，结束时发射完整的
+        response_ready；中途出错时也会把已收到的部分作为完整回复发出，
+        避免气泡停留在流式状态。只有正常结束（收到 RunCompletedEvent）的
+        一轮对话才记入 history 和回复缓存，不完整的回复不会被复用。
+        """
+        run_id = self._run_id(request_id)
+        history, context_tokens = self.history.context()
+        turn = Turn(kind, message, "", images or [])
+        memories = self._recall(kind, message)
+        if memories:
+            history += [
+                Message(role="user", content=memories),
+                Message(role="assistant", content="嗯，记得。"),
+            ]
+            context_tokens += estimate_tokens(memories)
+        messages = [*history, *turn.to_messages()[:1]]
+        # 历史由 ConversationHistory 管理，每次运行使用独立会话，避免 agno 会话无限增长
+        options = {"run_id": run_id, "session_id": run_id}
+        metrics = None
+        start = time.perf_counter()
+        tracer.mark(request_id, "llm_start", start)
+
+        if not self.streaming:
+            response = agent.run(messages, **options)
+            if cancelled.is_set():
+                print(f"[Agent] 请求 #{request_id} 已取消，丢弃回复")
+                return
+            turn.reply = response.content if response.content else ""
+            tracer.mark(request_id, "llm_last_token")
+            if response.status != RunStatus.completed:
+                self._discard_incomplete(request_id, turn.reply, response.status)
+                return
+            # 输入中的历史消息也是 assistant 角色，只统计本次运行新生成的
+            sent = {m.id for m in messages}
+            calls = sum(
+                1
+                for m in response.messages or []
+                if m.role == "assistant" and m.id not in sent
             )
-            reply = response.content if response.content else ""
-            if reply:
-                print(f"[Agent] 回复: {reply}")
-                self.response_ready.emit(reply)
+            self._finish(request_id, turn, context_tokens, response.metrics, calls)
+            self._store_in_cache(cache_key, turn.reply, start)
+            return
+
+        parts: list[str] = []
+        calls = 0
+        completed = False
+        error = None
+        stream = agent.run(messages, stream=True, stream_events=True, **options)
+        try:
+            for event in stream:
+                if cancelled.is_set():
+                    break
+                if isinstance(event, RunCompletedEvent):
+                    metrics = event.metrics
+                    completed = True
+                    continue
+                if isinstance(event, RunErrorEvent):
+                    error = event.content
+                    continue
+                if isinstance(event, ModelRequestCompletedEvent):
+                    calls += 1
+                    continue
+                if not isinstance(event, RunContentEvent):
+                    continue
+                if not isinstance(event.content, str) or not event.content:
+                    continue
+                if not parts:
+                    tracer.mark(request_id, "llm_first_token")
+                    self._streamed_runs.add(run_id)
+                    self.response_started.emit(request_id)
+                parts.append(event.content)
+                self.response_delta.emit(request_id, event.content)
+        finally:
+            # 关闭生成器，断开仍在进行的流式响应
+            stream.close()
+            self._streamed_runs.discard(run_id)
+            if cancelled.is_set():
+                print(f"[Agent] 请求 #{request_id} 已取消，丢弃回复")
+                if parts:
+                    self.response_discarded.emit(request_id)
+            else:
+                tracer.mark(request_id, "llm_last_token")
+                turn.reply = "".join(parts)
+                if completed and error is None:
+                    self._finish(request_id, turn, context_tokens, metrics, calls)
+                    self._store_in_cache(cache_key, turn.reply, start)
+                else:
+                    # 运行抛出异常时 error 为 None，异常本身由 _execute 记录
+                    reason = error or "流式输出中断"
+                    self._discard_incomplete(request_id, turn.reply, reason)
+
+    def _discard_incomplete(self, request_id: int, reply: str, reason):
+        """运行未正常结束：已收到的部分照常显示，但不记入 history 和缓存。"""
+        print(f"[Agent] 请求 #{request_id} 未正常结束，回复不完整，不记录: {reason}")
+        self._emit_reply(request_id, reply)
+
+    def _reply_from_cache(
+        self, request_id: int, key: str | None, kind: str, message: str
+    ) -> bool:
+        """缓存中有可复用的回复时直接发射，返回是否命中。
+
+        缓存只保存回复文本，原回复附带的 perform 和记忆工具调用不会重放。
+        """
+        if key is None:
+            return False
+        reply = self.cache.lookup(key)
+        if reply is None:
+            return False
+        print(f"[Agent] 使用缓存回复 | {self.cache.describe()}")
+        tracer.mark(request_id, "cache_hit")
+        self._emit_reply(request_id, reply)
+        self.history.add(Turn(kind, message, reply))
+        return True
+
+    def _store_in_cache(self, key: str | None, reply: str, start: float):
+        if key is not None and reply:
+            self.cache.store(key, reply, time.perf_counter() - start)
+
+    def _recall(self, kind: str, message: str) -> str:
+        """检索与语音输入相关的长期记忆；屏幕提示词是固定文本，不做检索。"""
+        if self._memory_tools is None or kind != "voice":
+            return ""
+        try:
+            return self._memory_tools.context_for(message)
         except Exception as e:
-            print(f"[Agent Error] {e}")
+            print(f"[Agent] 记忆检索失败: {e}")
+            return ""
+
+    def _finish(
+        self, request_id: int, turn: Turn, context_tokens: int, metrics, calls: int
+    ):
+        """发射回复、记录本轮对话，报告 prompt token 数和模型调用次数。"""
+        self._emit_reply(request_id, turn.reply)
+        self._replies += 1
+        self._model_calls += calls
+        estimated = context_tokens + turn.tokens
+        actual = f", 实际输入 {metrics.input_tokens}" if metrics else ""
+        print(
+            f"[Agent] 请求 #{request_id} prompt tokens: 估算 {estimated} "
+            f"(上下文 {context_tokens}){actual}, 模型调用 {calls} 次 "
+            f"(平均 {self._model_calls / self._replies:.2f} 次/回复) | "
+            f"{self.history.describe()}"
+        )
+        if turn.reply:
+            self.history.add(turn)
+
+    def _summarize(self, previous: str, turns: list[Turn]) -> str:
+        """在 history 的后台线程中调用模型，把旧轮次折叠进摘要。"""
+        transcript = "\n\n".join(turn.transcript() for turn in turns)
+        prompt = (
+            f"已有摘要：\n{previous or '（无）'}\n\n新增对话：\n{transcript}\n\n"
+            f"请输出合并后的新摘要，不超过 {self.history.summary_budget} 字。"
+        )
+        return self._summarizer.run(prompt, session_id="yuuki-summary").content or ""
+
+    def _emit_reply(self, request_id: int, reply: str):
+        if reply:
+            print(f"[Agent] 回复: {reply}")
+            self.response_ready.emit(request_id, reply)
@@ -4,6 +4,8 @@ from PySide6.QtCore import QPropertyAnimation, Qt, QTimer, Signal, Slot
 from PySide6.QtGui import QColor, QFont, QPainter, QPainterPath
 from PySide6.QtWidgets import QLabel, QWidget
 
+from src.tracing import tracer
+
 
 class ChatBubble(QWidget):
     """无边框粉色圆角对话气泡，自动跟随父窗口定位并在若干秒后淡出。"""
@@ -20,6 +22,7 @@ class ChatBubble(QWidget):
     MAX_WIDTH = 360
     DISPLAY_SECONDS = 8
     TAIL_SIZE = 12  # 小尾巴大小
+    RELAYOUT_MS = 30  # 流式显示时最快每隔多少毫秒重排一次
 
     def __init__(self, parent_widget: QWidget | None = None):
         # 使用独立顶层窗口，这样即使父控件是 OpenGL 也不会出问题
@@ -53,39 +56,72 @@ class ChatBubble(QWidget):
         # 淡出动画
         self._fade_anim: QPropertyAnimation | None = None
 
+        # 流式显示：累积的文本，以及合并短时间内多个增量的重排定时器
+        self._streaming = False
+        self._stream_id = 0
+        self._stream_text = ""
+        self._relayout_timer = QTimer(self)
+        self._relayout_timer.setSingleShot(True)
+        self._relayout_timer.setInterval(self.RELAYOUT_MS)
+        self._relayout_timer.timeout.connect(self._flush_stream)
+
         self.hide()
 
     # ── 公共接口 ──
 
     @Slot(str)
     def show_message(self, text: str):
-        """显示一条新消息，自动定位与定时隐藏。"""
-        self._hide_timer.stop()
-        if (
-            self._fade_anim
-            and self._fade_anim.state() == QPropertyAnimation.State.Running
-        ):
-            self._fade_anim.stop()
-        self.setWindowOpacity(1.0)
-
-        self._label.setText(text)
-        self._label.adjustSize()
-
-        # 计算气泡尺寸
-        lw = self._label.width()
-        lh = self._label.height()
-        bubble_w = lw + 2 * self.PADDING
-        bubble_h = lh + 2 * self.PADDING + self.TAIL_SIZE
-        self.setFixedSize(bubble_w, bubble_h)
-        self._label.move(self.PADDING, self.PADDING)
-
-        # 定位：在父窗口的左上方弹出
-        self._reposition()
+        """显示一条新消息，自动定位与定时隐藏。
+
+        流式显示进行中时，用完整文本结束本次流式显示并开始计时。
+        """
+        if self._streaming:
+            self._streaming = False
+            self._relayout_timer.stop()
+            self._set_text(text)
+            self._hide_timer.start(self.DISPLAY_SECONDS * 1000)
+            return
 
+        self._prepare_show()
+        self._set_text(text)
         self.show()
         self.raise_()
         self._hide_timer.start(self.DISPLAY_SECONDS * 1000)
 
+    @Slot(int)
+    def begin_stream(self, stream_id: int):
+        """开始流式显示一条新消息，文本由 append_text 逐段追加。
+
+        stream_id 标识本次流式显示，来自其他（已被替换的）流的增量会被忽略。
+        """
+        tracer.mark(stream_id, "bubble_shown")
+        self._prepare_show()
+        self._streaming = True
+        self._stream_id = stream_id
+        self._stream_text = ""
+        self._set_text("…")
+        self.show()
+        self.raise_()
+
+    @Slot(int, str)
+    def append_text(self, stream_id: int, delta: str):
+        """追加一段流式文本；短时间内的多次追加合并为一次重排。"""
+        if not self._streaming or stream_id != self._stream_id:
+            return
+        self._stream_text += delta
+        if not self._relayout_timer.isActive():
+            self._relayout_timer.start()
+
+    @Slot(int)
+    def discard_stream(self, stream_id: int):
+        """流式显示的消息被取消，立即隐藏气泡。"""
+        if not self._streaming or stream_id != self._stream_id:
+            return
+        self._streaming = False
+        self._relayout_timer.stop()
+        self._stream_text = ""
+        self.hide()
+
     # ── 绘制 ──
 
     def paintEvent(self, event):
@@ -115,6 +151,36 @@ class ChatBubble(QWidget):
 
     # ── 内部方法 ──
 
+    def _prepare_show(self):
+        """停止上一条消息的计时和淡出，恢复不透明。"""
+        self._hide_timer.stop()
+        if (
+            self._fade_anim
+            and self._fade_anim.state() == QPropertyAnimation.State.Running
+        ):
+            self._fade_anim.stop()
+        self.setWindowOpacity(1.0)
+
+    def _set_text(self, text: str):
+        """更新文本并按内容重新计算气泡尺寸和位置。"""
+        self._label.setText(text)
+        self._label.adjustSize()
+
+        # 计算气泡尺寸
+        lw = self._label.width()
+        lh = self._label.height()
+        bubble_w = lw + 2 * self.PADDING
+        bubble_h = lh + 2 * self.PADDING + self.TAIL_SIZE
+        self.setFixedSize(bubble_w, bubble_h)
+        self._label.move(self.PADDING, self.PADDING)
+
+        # 定位：在父窗口的左上方弹出
+        self._reposition()
+
+    def _flush_stream(self):
+        if self._streaming:
+            self._set_text(self._stream_text)
+
     def _reposition(self):
         """将气泡定位到父窗口的左上角偏移处。"""
         if self._parent_widget is None:
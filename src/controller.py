@@ -1,53 +1,218 @@
-"""输入控制器：当 Agent 正在处理时，丢弃新的输入请求。"""
+"""输入调度器：按优先级排队发往 Agent 的请求，合并屏幕事件，并为每个请求设置期限与超时。"""
 
-import numpy as np
-from PySide6.QtCore import QObject, Signal, Slot
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+from PySide6.QtCore import QObject, QTimer, Signal, Slot
+
+from src.screen_worker import ScreenEvent
+from src.tracing import tracer
+
+
+@dataclass
+class AgentRequest:
+    id: int  # 与追踪 ID 相同，贯穿 ASR / Controller / Agent / 气泡
+    kind: str  # "voice" 或 "screen"
+    payload: str | ScreenEvent
+    enqueued_at: float
+    deadline: float  # 超过此时间仍未派发则丢弃
+
+    @property
+    def label(self) -> str:
+        return f"{'语音' if self.kind == 'voice' else '屏幕'}请求 #{self.id}"
+
+    def discard(self):
+        if isinstance(self.payload, ScreenEvent):
+            self.payload.discard()
+
+
+@dataclass
+class SchedulerMetrics:
+    accepted: int = 0
+    dispatched: int = 0
+    completed: int = 0
+    timed_out: int = 0
+    preempted: int = 0
+    dropped: dict[str, int] = field(default_factory=dict)  # 丢弃原因 -> 次数
+    wait_total: float = 0.0  # 累计排队时间（秒）
+    wait_max: float = 0.0
+    max_depth: int = 0
+
+    @property
+    def avg_wait(self) -> float:
+        return self.wait_total / self.dispatched if self.dispatched else 0.0
+
+    def drop(self, reason: str):
+        self.dropped[reason] = self.dropped.get(reason, 0) + 1
+
+    def describe(self) -> str:
+        return (
+            f"已派发 {self.dispatched}, 完成 {self.completed}, 超时 {self.timed_out}, "
+            f"被抢占 {self.preempted}, "
+            f"平均等待 {self.avg_wait:.2f}s (最长 {self.wait_max:.2f}s), "
+            f"最大队列 {self.max_depth}, 丢弃 {self.dropped or 0}"
+        )
 
 
 class Controller(QObject):
     """
-    位于输入源（屏幕变化 / ASR 文本）和 AgentWorker 之间，
-    确保同一时间只有一个请求被处理，Agent 忙碌时丢弃后续输入。
+    位于输入源（屏幕变化 / ASR 文本）和 AgentWorker 之间，同一时间只派发一个请求：
+    - 语音优先于屏幕，语音按到达顺序排队，队列有上限，溢出时丢弃最旧的；
+    - 屏幕事件只保留最新一个（后到覆盖先到）；
+    - 每个请求有排队期限，过期未派发即丢弃；
+    - 派发后启动看门狗，Agent 超时未完成则通过 cancel_requested 取消该请求
+      （AgentWorker 中止 agno 运行并释放其线程），继续处理后续输入；
+    - 新的语音到达时，取消正在进行的屏幕请求，让语音立即得到处理。
     """
 
-    # 转发给 AgentWorker 的信号
-    text_accepted = Signal(str)
-    screen_accepted = Signal(float, np.ndarray)
+    # 转发给 AgentWorker 的信号：(请求 ID, 内容)
+    text_accepted = Signal(int, str)
+    screen_accepted = Signal(int, object)  # ScreenEvent
+    # 请求 AgentWorker 取消进行中的请求
+    cancel_requested = Signal(int)
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        voice_ttl: float = 15.0,
+        screen_ttl: float = 5.0,
+        max_voice_queue: int = 3,
+        run_timeout: float = 60.0,
+        voice_preempts_screen: bool = True,
+    ) -> None:
         super().__init__()
-        self._busy = False
+        self.voice_ttl = voice_ttl
+        self.screen_ttl = screen_ttl
+        self.max_voice_queue = max_voice_queue
+        self.run_timeout = run_timeout
+        self.voice_preempts_screen = voice_preempts_screen
+
+        self._voice: deque[AgentRequest] = deque()
+        self._screen: AgentRequest | None = None
+        self._current: AgentRequest | None = None
+        self._current_started = 0.0
+        self.metrics = SchedulerMetrics()
+
+        self._watchdog = QTimer(self)
+        self._watchdog.setSingleShot(True)
+        self._watchdog.timeout.connect(self._on_watchdog)
 
     @property
     def is_busy(self) -> bool:
-        return self._busy
+        return self._current is not None
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._voice) + (self._screen is not None)
 
     # ── 输入槽 ──
 
-    @Slot(str)
-    def on_text_input(self, text: str):
-        """接收 ASR 转写文本；Agent 空闲时转发，忙碌时丢弃。"""
-        if self._busy:
-            print("[Controller] Agent 忙碌中，丢弃文本输入")
-            return
-        self._busy = True
-        print("[Controller] 转发文本输入给 Agent")
-        self.text_accepted.emit(text)
-
-    @Slot(float, np.ndarray)
-    def on_screen_change(self, score: float, img: np.ndarray):
-        """接收屏幕变化；Agent 空闲时转发，忙碌时丢弃。"""
-        if self._busy:
-            print("[Controller] Agent 忙碌中，丢弃屏幕输入")
-            return
-        self._busy = True
-        print(f"[Controller] 转发屏幕变化 (score={score:.2f}) 给 Agent")
-        self.screen_accepted.emit(score, img)
+    @Slot(int, str)
+    def on_text_input(self, trace_id: int, text: str):
+        """接收 ASR 转写文本，进入语音队列。"""
+        req = self._new_request("voice", text, self.voice_ttl, trace_id)
+        if len(self._voice) >= self.max_voice_queue:
+            self._drop(self._voice.popleft(), "overflow")
+        self._voice.append(req)
+        current = self._current
+        if self.voice_preempts_screen and current and current.kind == "screen":
+            self.metrics.preempted += 1
+            print(f"[Controller] 语音输入抢占进行中的{current.label}")
+            tracer.mark(current.id, "cancelled:preempted")
+            self._abandon()
+            self.cancel_requested.emit(current.id)
+        self._dispatch()
+
+    @Slot(object)
+    def on_screen_change(self, event: ScreenEvent):
+        """接收屏幕变化；未派发的旧屏幕事件被新事件替换。"""
+        req = self._new_request("screen", event, self.screen_ttl, event.trace_id)
+        if self._screen is not None:
+            self._drop(self._screen, "coalesced")
+        self._screen = req
+        self._dispatch()
 
     # ── Agent 完成后的回调 ──
 
-    @Slot(str)
-    def on_agent_done(self, _text: str):
-        """Agent 返回响应后，解除忙碌状态，允许接受新输入。"""
-        self._busy = False
-        print("[Controller] Agent 处理完毕，恢复接受输入")
+    @Slot(int)
+    def on_agent_done(self, request_id: int):
+        """Agent 处理完一个请求（无论成功、出错或无回复），派发下一个。"""
+        if self._current is None or self._current.id != request_id:
+            print(f"[Controller] 请求 #{request_id} 已被放弃，忽略其完成通知")
+            return
+        self.metrics.completed += 1
+        elapsed = time.monotonic() - self._current_started
+        print(
+            f"[Controller] 请求 #{request_id} 完成，耗时 {elapsed:.2f}s | "
+            f"{self.metrics.describe()}"
+        )
+        self._abandon()
+        self._dispatch()
+
+    # ── 内部方法 ──
+
+    def _abandon(self):
+        """结束当前请求的跟踪，之后到达的完成通知会被忽略。"""
+        self._watchdog.stop()
+        self._current = None
+
+    def _new_request(
+        self, kind: str, payload, ttl: float, trace_id: int | None
+    ) -> AgentRequest:
+        now = time.monotonic()
+        self.metrics.accepted += 1
+        if trace_id is None:
+            trace_id = tracer.begin(kind)
+        tracer.mark(trace_id, "accepted")
+        return AgentRequest(trace_id, kind, payload, now, now + ttl)
+
+    def _drop(self, req: AgentRequest, reason: str):
+        req.discard()
+        self.metrics.drop(reason)
+        tracer.mark(req.id, f"dropped:{reason}")
+        print(f"[Controller] 丢弃{req.label} ({reason})")
+
+    def _next(self) -> AgentRequest | None:
+        if self._voice:
+            return self._voice.popleft()
+        req, self._screen = self._screen, None
+        return req
+
+    def _dispatch(self):
+        self.metrics.max_depth = max(self.metrics.max_depth, self.queue_depth)
+        if self._current is not None:
+            return
+        while (req := self._next()) is not None:
+            now = time.monotonic()
+            if now > req.deadline:
+                self._drop(req, "expired")
+                continue
+            wait = now - req.enqueued_at
+            self.metrics.dispatched += 1
+            self.metrics.wait_total += wait
+            self.metrics.wait_max = max(self.metrics.wait_max, wait)
+            self._current = req
+            self._current_started = now
+            self._watchdog.start(int(self.run_timeout * 1000))
+            print(
+                f"[Controller] 派发{req.label} 给 Agent "
+                f"(排队 {wait:.2f}s, 剩余队列 {self.queue_depth})"
+            )
+            tracer.mark(req.id, "dispatched")
+            if req.kind == "voice":
+                self.text_accepted.emit(req.id, req.payload)
+            else:
+                self.screen_accepted.emit(req.id, req.payload)
+            return
+
+    def _on_watchdog(self):
+        req = self._current
+        if req is None:
+            return
+        self.metrics.timed_out += 1
+        print(f"[Controller] 请求 #{req.id} 超过 {self.run_timeout:.0f}s 未完成，取消")
+        tracer.mark(req.id, "cancelled:timeout")
+        self._abandon()
+        # 只是放弃跟踪的话，卡住的运行仍占着 Agent，必须真正取消才能腾出位置
+        self.cancel_requested.emit(req.id)
+        self._dispatch()
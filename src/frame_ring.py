@@ -0,0 +1,98 @@
+"""共享内存帧环形缓冲区：截图写入预分配槽位，信号中只传递槽位句柄和序号。"""
+
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+@dataclass(frozen=True)
+class FrameRef:
+    """环形缓冲区中某一帧的句柄。"""
+
+    slot: int
+    seq: int
+
+
+class FrameRing:
+    """基于 multiprocessing.shared_memory 的固定尺寸帧环。
+
+    内存布局：slots 个 int64 序号，随后是 slots 帧 (height, width, channels) 的像素。
+    写入槽位前先把该槽序号置 0，写完再写入新序号；读者在使用前后
+    校验序号（seqlock），即可发现帧已被覆盖，无需加锁。
+    其他进程可通过 attach() 按名称挂载同一块内存。
+    """
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        slots: int = 4,
+        channels: int = 4,
+        name: str | None = None,
+    ):
+        self.width = width
+        self.height = height
+        self.slots = slots
+        self.channels = channels
+        frame_bytes = width * height * channels
+        header_bytes = slots * np.dtype(np.int64).itemsize
+        self._owner = name is None
+        self._shm = shared_memory.SharedMemory(
+            name=name, create=self._owner, size=header_bytes + slots * frame_bytes
+        )
+        self._seqs = np.ndarray((slots,), np.int64, self._shm.buf, 0)
+        self._frames = np.ndarray(
+            (slots, height, width, channels), np.uint8, self._shm.buf, header_bytes
+        )
+        if self._owner:
+            self._seqs[:] = 0
+        self._cursor = 0
+        self._next_seq = 1
+
+    @classmethod
+    def attach(
+        cls, name: str, width: int, height: int, slots: int = 4, channels: int = 4
+    ) -> "FrameRing":
+        """挂载由其他进程创建的帧环（只读使用）。"""
+        return cls(width, height, slots, channels, name=name)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.height, self.width
+
+    def write(self, img: np.ndarray) -> FrameRef:
+        """将一帧复制进下一个槽位，返回其句柄。"""
+        slot = self._cursor
+        self._cursor = (slot + 1) % self.slots
+        self._seqs[slot] = 0  # 写入中
+        np.copyto(self._frames[slot], img)
+        seq = self._next_seq
+        self._next_seq += 1
+        self._seqs[slot] = seq
+        return FrameRef(slot, seq)
+
+    def is_valid(self, ref: FrameRef) -> bool:
+        """帧是否仍未被覆盖。"""
+        return int(self._seqs[ref.slot]) == ref.seq
+
+    def view(self, ref: FrameRef) -> np.ndarray | None:
+        """返回帧的只读零拷贝视图；帧已被覆盖时返回 None。
+
+        视图在下一次覆盖该槽位前有效，耗时处理结束后应再次调用 is_valid() 确认。
+        """
+        if not self.is_valid(ref):
+            return None
+        frame = self._frames[ref.slot]
+        frame.flags.writeable = False
+        return frame
+
+    def unlink(self):
+        """释放共享内存名称（仅创建者调用）；已映射的视图在被回收前仍然可用。"""
+        if self._owner:
+            self._shm.unlink()
+            self._owner = False
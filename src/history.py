@@ -0,0 +1,236 @@
+"""对话历史管理：在 token 预算内保留最近几轮原文，更早的轮次折叠进滚动摘要。
+
+历史中的截图按保留策略降级：只有最近几轮保留原图，之后缩为缩略图，
+超出内存上限或移出原文区的截图只留下文字说明。
+"""
+
+import threading
+import unicodedata
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from agno.media import Image
+from agno.models.message import Message
+
+from src.screen_encoder import shrink_encoded
+
+# 每张图片按固定 token 数估算（Gemini 对 ≤384px 的图片计 258 token，大图按切块累加）
+IMAGE_TOKENS = 258
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本的 token 数：CJK 字符约 1 token/字，其余约 4 字符/token。"""
+    wide = sum(1 for ch in text if unicodedata.east_asian_width(ch) in "WF")
+    return wide + (len(text) - wide + 3) // 4
+
+
+@dataclass
+class Turn:
+    """一轮对话：用户输入（语音文本或屏幕提示词 + 截图）与 Yuuki 的回复。"""
+
+    kind: str  # "voice" 或 "screen"
+    user: str
+    reply: str
+    images: list[Image] = field(default_factory=list)
+    downgraded: bool = False  # 截图已缩为缩略图
+    omitted_images: int = 0  # 已被移除、只保留文字说明的截图数
+
+    @property
+    def image_bytes(self) -> int:
+        return sum(len(image.content or b"") for image in self.images)
+
+    @property
+    def tokens(self) -> int:
+        return (
+            estimate_tokens(self.user)
+            + estimate_tokens(self.reply)
+            + IMAGE_TOKENS * len(self.images)
+        )
+
+    def transcript(self) -> str:
+        """纯文本形式，供摘要使用。"""
+        speaker = "主人" if self.kind == "voice" else "屏幕"
+        count = len(self.images) + self.omitted_images
+        user = self.user if self.kind == "voice" else f"（{count} 张截图）"
+        return f"{speaker}: {user}\nYuuki: {self.reply}"
+
+    def to_messages(self) -> list[Message]:
+        user = self.user
+        if self.omitted_images:
+            user += f"\n（当时附带的 {self.omitted_images} 张截图已省略）"
+        return [
+            Message(role="user", content=user, images=self.images or None),
+            Message(role="assistant", content=self.reply),
+        ]
+
+    def downgrade(self, max_side: int, quality: int):
+        """把截图替换为缩略图；无法解码的截图直接移除。"""
+        thumbnails = []
+        for image in self.images:
+            small = shrink_encoded(image.content or b"", max_side, quality)
+            if small is None:
+                self.omitted_images += 1
+                continue
+            thumbnails.append(Image(content=small.data, mime_type=small.mime_type))
+        self.images = thumbnails
+        self.downgraded = True
+
+    def drop_images(self):
+        self.omitted_images += len(self.images)
+        self.images = []
+
+
+# (旧摘要, 待折叠的轮次) -> 新摘要
+Summarizer = Callable[[str, list[Turn]], str]
+
+
+class ConversationHistory:
+    """线程安全的对话历史。
+
+    - 最近 keep_turns 轮按原文（含截图）放入上下文；
+    - 超出轮数或 token 预算的旧轮次移出原文区，在后台线程中折叠进滚动摘要，
+      折叠完成前以纯文本形式暂留，不阻塞当前请求；
+    - 未提供 summarizer 时，旧轮次直接丢弃，只保留最近的原文；
+    - 截图只在最近 full_image_turns 轮保留原图，更早的缩为缩略图，
+      全部截图超过 max_image_bytes 时从最旧的开始移除，只留文字说明。
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 8000,
+        keep_turns: int = 6,
+        summarizer: Summarizer | None = None,
+        full_image_turns: int = 2,
+        max_image_bytes: int = 2_000_000,
+    ) -> None:
+        self.token_budget = token_budget
+        self.keep_turns = keep_turns
+        self.summarizer = summarizer
+        # 摘要本身的长度上限，超出后下一次折叠会要求模型进一步压缩
+        self.summary_budget = token_budget // 4
+        self.full_image_turns = full_image_turns
+        self.max_image_bytes = max_image_bytes
+        # 降级后缩略图的最长边与 JPEG 质量
+        self.thumbnail_side = 320
+        self.thumbnail_quality = 40
+
+        self._lock = threading.Lock()
+        self._turns: list[Turn] = []
+        self._pending: list[Turn] = []  # 已移出原文区、尚未折叠进摘要
+        self._summary = ""
+        self._summarizing = False
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history")
+        self.summaries = 0  # 已完成的折叠次数
+
+    @property
+    def summary(self) -> str:
+        with self._lock:
+            return self._summary
+
+    def add(self, turn: Turn):
+        """记录一轮完成的对话，必要时触发后台摘要。"""
+        with self._lock:
+            self._turns.append(turn)
+            while len(self._turns) > 1 and (
+                len(self._turns) > self.keep_turns
+                or self._verbatim_tokens() > self.token_budget - self.summary_budget
+            ):
+                evicted = self._turns.pop(0)
+                if self.summarizer is not None:
+                    # 待折叠轮次只以文字形式出现在上下文中
+                    evicted.drop_images()
+                    self._pending.append(evicted)
+            self._apply_retention()
+            self._schedule_summary()
+
+    def context(self) -> tuple[list[Message], int]:
+        """构造放在当前输入之前的历史消息，返回 (消息列表, 估算 token 数)。"""
+        with self._lock:
+            messages: list[Message] = []
+            tokens = 0
+            background = self._background()
+            if background:
+                messages.append(Message(role="user", content=background))
+                messages.append(Message(role="assistant", content="嗯，记得。"))
+                tokens += estimate_tokens(background)
+            for turn in self._turns:
+                messages.extend(turn.to_messages())
+                tokens += turn.tokens
+            return messages, tokens
+
+    @property
+    def image_bytes(self) -> int:
+        with self._lock:
+            return sum(turn.image_bytes for turn in self._turns)
+
+    def describe(self) -> str:
+        with self._lock:
+            image_kb = sum(turn.image_bytes for turn in self._turns) / 1024
+            return (
+                f"原文 {len(self._turns)} 轮 / {self._verbatim_tokens()} tokens, "
+                f"截图 {image_kb:.0f} KB, "
+                f"摘要 {estimate_tokens(self._summary)} tokens, "
+                f"待折叠 {len(self._pending)} 轮"
+            )
+
+    def shutdown(self, wait: bool = False):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+    # ── 内部方法（调用方持有锁） ──
+
+    def _verbatim_tokens(self) -> int:
+        return sum(turn.tokens for turn in self._turns)
+
+    def _apply_retention(self):
+        """按保留策略降级截图：先缩略较旧的轮次，再按字节上限从最旧的开始移除。"""
+        with_images = [turn for turn in self._turns if turn.images]
+        cutoff = len(with_images) - self.full_image_turns
+        for turn in with_images[: max(0, cutoff)]:
+            if not turn.downgraded:
+                turn.downgrade(self.thumbnail_side, self.thumbnail_quality)
+        total = sum(turn.image_bytes for turn in with_images)
+        for turn in with_images:
+            if total <= self.max_image_bytes:
+                break
+            total -= turn.image_bytes
+            turn.drop_images()
+
+    def _background(self) -> str:
+        parts = []
+        if self._summary:
+            parts.append(f"[之前对话的摘要]\n{self._summary}")
+        if self._pending:
+            lines = "\n".join(turn.transcript() for turn in self._pending)
+            parts.append(f"[更早的对话]\n{lines}")
+        return "\n\n".join(parts)
+
+    def _schedule_summary(self):
+        if self._summarizing or not self._pending:
+            return
+        self._summarizing = True
+        self._pool.submit(self._fold, self._summary, list(self._pending))
+
+    def _fold(self, previous: str, turns: list[Turn]):
+        """后台线程：把 turns 折叠进摘要。失败时保留待折叠轮次，下次再试。"""
+        try:
+            summary = self.summarizer(previous, turns).strip()
+        except Exception as e:
+            print(f"[History] 摘要失败: {e}")
+            summary = None
+        with self._lock:
+            self._summarizing = False
+            if summary:
+                self._summary = summary
+                del self._pending[: len(turns)]
+                self.summaries += 1
+                print(
+                    f"[History] 折叠 {len(turns)} 轮进摘要，"
+                    f"摘要 {estimate_tokens(summary)} tokens"
+                )
+                # 折叠期间又有新轮次被移出原文区
+                self._schedule_summary()
+            elif len(self._pending) > self.keep_turns:
+                # 摘要失败时等下一轮对话再重试；持续失败则丢弃最旧的待折叠轮次，
+                # 避免上下文无限增长
+                del self._pending[: len(self._pending) - self.keep_turns]
@@ -0,0 +1,116 @@
+"""LLM 后端：按配置创建 Gemini、OpenAI 兼容接口或本地模拟服务的 agno 模型。
+
+同一后端创建的模型共享一个 HTTP 客户端以复用连接；超时与带退避的重试
+交给各自的 SDK 处理。
+"""
+
+import os
+from dataclasses import dataclass
+
+import httpx
+from agno.models.base import Model
+from agno.models.google import Gemini
+from agno.models.openai.like import OpenAILike
+from google import genai
+from google.genai import types
+
+from src.mock_llm import MockLLMServer
+
+BACKENDS = ("gemini", "openai", "mock")
+
+DEFAULT_MODEL_IDS = {
+    "gemini": "gemini-3-flash-preview",
+    "openai": "local-model",
+    "mock": "yuuki-mock",
+}
+
+
+@dataclass
+class BackendConfig:
+    backend: str = "gemini"
+    model_id: str | None = None
+    base_url: str | None = None  # OpenAI 兼容接口地址，例如 http://localhost:11434/v1
+    api_key: str | None = None
+    timeout: float = 30.0  # 单次请求超时（秒）
+    max_retries: int = 2  # 失败后的最大重试次数，指数退避
+    mock_first_token: float = 0.3  # 模拟服务的首 token 延迟（秒）
+    mock_tool_call_every: int = 0  # 模拟服务每 N 个请求附带一次工具调用
+    mock_tool_call_first: bool = False  # 模拟服务的工具调用出现在回复文本之前
+
+
+class LLMBackend:
+    """持有共享的 HTTP 客户端（以及模拟服务），按需创建 agno 模型。"""
+
+    def __init__(self, config: BackendConfig | None = None) -> None:
+        self.config = config or BackendConfig()
+        if self.config.backend not in BACKENDS:
+            raise ValueError(f"不支持的 LLM 后端: {self.config.backend}")
+        self.model_id = self.config.model_id or DEFAULT_MODEL_IDS[self.config.backend]
+        self.mock_server = None
+        self._client = None
+
+    def describe(self) -> str:
+        url = f" @ {self.base_url}" if self.config.backend != "gemini" else ""
+        return f"{self.config.backend}:{self.model_id}{url}"
+
+    @property
+    def base_url(self) -> str | None:
+        if self.mock_server is not None:
+            return self.mock_server.url
+        return self.config.base_url
+
+    def create_model(self) -> Model:
+        """创建一个新的模型实例；同一后端的实例共享底层连接。"""
+        if self.config.backend == "gemini":
+            return self._gemini()
+        if self.config.backend == "mock" and self.mock_server is None:
+            self.mock_server = MockLLMServer(
+                first_token_latency=self.config.mock_first_token,
+                tool_call_every=self.config.mock_tool_call_every,
+                tool_call_first=self.config.mock_tool_call_first,
+            ).start()
+            print(f"[LLM] 已启动模拟服务: {self.mock_server.url}")
+        return self._openai_like()
+
+    def close(self):
+        if self._client is not None and hasattr(self._client, "close"):
+            self._client.close()
+        self._client = None
+        if self.mock_server is not None:
+            self.mock_server.stop()
+            self.mock_server = None
+
+    def _gemini(self) -> Model:
+        if self._client is None:
+            self._client = genai.Client(
+                api_key=self.config.api_key or os.getenv("GOOGLE_API_KEY"),
+                http_options=types.HttpOptions(
+                    timeout=int(self.config.timeout * 1000),
+                    retry_options=types.HttpRetryOptions(
+                        attempts=self.config.max_retries + 1,
+                        initial_delay=0.5,
+                        max_delay=8.0,
+                        exp_base=2.0,
+                    ),
+                ),
+            )
+        return Gemini(id=self.model_id, client=self._client)
+
+    def _openai_like(self) -> Model:
+        if not self.base_url:
+            raise ValueError("openai 后端需要指定 base_url（--llm-base-url）")
+        if self._client is None:
+            self._client = httpx.Client(
+                timeout=self.config.timeout,
+                limits=httpx.Limits(max_keepalive_connections=4, keepalive_expiry=60),
+            )
+        return OpenAILike(
+            id=self.model_id,
+            base_url=self.base_url,
+            api_key=self.config.api_key
+            or os.getenv("OPENAI_API_KEY")
+            or "not-provided",
+            timeout=self.config.timeout,
+            max_retries=self.config.max_retries,
+            http_client=self._client,
+        )
@@ -0,0 +1,235 @@
+"""长期记忆：基于 SQLite FTS5 的个性化事实库，以及供 Agent 调用的记忆工具集。"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+from agno.agent import Toolkit
+
+# 连续的 CJK 字符，或连续的字母数字
+_TOKEN_RE = re.compile(r"[㐀-鿿豈-﫿]+|[0-9A-Za-z]+")
+_CJK_RE = re.compile(r"[㐀-鿿豈-﫿]")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS facts (
+    id INTEGER PRIMARY KEY,
+    content TEXT NOT NULL UNIQUE,
+    category TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS facts_fts USING fts5(terms);
+CREATE VIRTUAL TABLE IF NOT EXISTS facts_vocab USING fts5vocab(facts_fts, 'row');
+"""
+
+
+def segment(text: str) -> list[str]:
+    """把文本切成检索词：中文按二元组（单字成词时保留单字），其余按单词小写。
+
+    FTS5 的默认分词器把整段中文当作一个词，无法做部分匹配，因此写入和查询
+    都先经过这里切分，再以空格连接交给 FTS5。
+    """
+    terms = []
+    for run in _TOKEN_RE.findall(text):
+        if not _CJK_RE.match(run):
+            terms.append(run.lower())
+        elif len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i : i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+@dataclass
+class Fact:
+    id: int
+    content: str
+    category: str
+    created_at: float
+    updated_at: float
+
+
+class MemoryStore:
+    """线程安全的事实库。
+
+    facts 表保存原文，facts_fts 以相同 rowid 保存切分后的检索词；
+    检索按 BM25 排序，只返回与查询最相关的 top-k 条。
+    出现在大量事实中的检索词（如“主人”“喜欢”）几乎不影响排序，却会让 FTS5
+    对所有命中行打分；查询中还有更少见的词时才把它们剔除，否则保留其中
+    最少见的 max_common_terms 个，避免把查询的主题本身（“我的论文写到哪了”里的“论文”）丢掉。
+    """
+
+    def __init__(self, path: str = "data/memory.db"):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        # 查询最多使用的检索词数，避免长文本生成过长的 MATCH 表达式
+        self.max_query_terms = 32
+        # 文档频率超过 max(common_min_docs, 总数 * common_term_ratio) 的检索词视为常见词
+        self.common_term_ratio = 0.05
+        self.common_min_docs = 100
+        # 查询只含常见词时，保留其中文档频率最低的这么多个
+        self.max_common_terms = 1
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM facts").fetchone()[0]
+
+    def add(self, content: str, category: str = "fact") -> int:
+        """记录一条事实；内容完全相同的事实只更新时间，返回事实 ID。"""
+        content = content.strip()
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT id FROM facts WHERE content = ?", (content,)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE facts SET updated_at = ?, category = ? WHERE id = ?",
+                    (now, category, row[0]),
+                )
+                return row[0]
+            fact_id = self._conn.execute(
+                "INSERT INTO facts (content, category, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                (content, category, now, now),
+            ).lastrowid
+            self._conn.execute(
+                "INSERT INTO facts_fts (rowid, terms) VALUES (?, ?)",
+                (fact_id, " ".join(segment(f"{category} {content}"))),
+            )
+            return fact_id
+
+    def add_many(self, items: list[tuple[str, str]]):
+        """批量写入 (内容, 类别)，在同一个事务中完成。"""
+        now = time.time()
+        with self._lock, self._conn:
+            for content, category in items:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO facts "
+                    "(content, category, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                    (content.strip(), category, now, now),
+                )
+                if cursor.rowcount:
+                    self._conn.execute(
+                        "INSERT INTO facts_fts (rowid, terms) VALUES (?, ?)",
+                        (cursor.lastrowid, " ".join(segment(f"{category} {content}"))),
+                    )
+
+    def forget(self, fact_id: int) -> bool:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM facts_fts WHERE rowid = ?", (fact_id,))
+            cursor = self._conn.execute("DELETE FROM facts WHERE id = ?", (fact_id,))
+            return cursor.rowcount > 0
+
+    def search(self, query: str, k: int = 5) -> list[Fact]:
+        """返回与 query 最相关的至多 k 条事实。"""
+        terms = list(dict.fromkeys(segment(query)))[: self.max_query_terms]
+        if not terms or k <= 0:
+            return []
+        with self._lock:
+            terms = self._drop_common(terms)
+            if not terms:
+                return []
+            match = " OR ".join(f'"{term}"' for term in terms)
+            rows = self._conn.execute(
+                "SELECT f.id, f.content, f.category, f.created_at, f.updated_at "
+                "FROM facts_fts JOIN facts AS f ON f.id = facts_fts.rowid "
+                "WHERE facts_fts MATCH ? ORDER BY bm25(facts_fts) LIMIT ?",
+                (match, k),
+            ).fetchall()
+        return [Fact(*row) for row in rows]
+
+    def _drop_common(self, terms: list[str]) -> list[str]:
+        """有更少见的检索词时剔除常见词，并去掉库中不存在的词（调用方持有锁）。"""
+        # 用最大 rowid 近似事实总数，避免每次查询都对整表计数
+        total = self._conn.execute("SELECT MAX(rowid) FROM facts_fts").fetchone()[0]
+        limit = max(self.common_min_docs, (total or 0) * self.common_term_ratio)
+        placeholders = ", ".join("?" * len(terms))
+        docs = dict(
+            self._conn.execute(
+                f"SELECT term, doc FROM facts_vocab WHERE term IN ({placeholders})",
+                terms,
+            )
+        )
+        rare = [term for term in terms if 0 < docs.get(term, 0) <= limit]
+        if rare:
+            return rare
+        common = sorted((term for term in terms if term in docs), key=docs.get)
+        return common[: self.max_common_terms]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class MemoryTools(Toolkit):
+    """长期记忆工具集，供 Agent 记录和查询关于主人的个性化信息。"""
+
+    def __init__(self, store: MemoryStore, top_k: int = 5):
+        super().__init__(
+            name="long_term_memory",
+            instructions=(
+                "使用这些工具维护关于主人的长期记忆。"
+                "当主人提到昵称、喜好、习惯、计划或取得的成就时，调用 remember 记下来，"
+                "每条只记一个简短的事实；与当前话题相关的记忆会自动附在输入中，"
+                "需要更多时再调用 recall 查询；发现记忆过时或错误时调用 forget 删除。"
+            ),
+            add_instructions=True,
+        )
+        self.store = store
+        self.top_k = top_k
+        self.register(self.remember)
+        self.register(self.recall)
+        self.register(self.forget)
+
+    def remember(self, content: str, category: str = "fact") -> str:
+        """记住一条关于主人的事实。
+
+        Args:
+            content: 事实内容，一句简短的陈述，例如“主人喜欢喝无糖乌龙茶”。
+            category: 类别，例如 nickname、preference、achievement、plan、fact。
+        """
+        if not content.strip():
+            return "记忆内容为空。"
+        fact_id = self.store.add(content, category)
+        return f"已记住 (#{fact_id}): {content}"
+
+    def recall(self, query: str) -> str:
+        """按关键词查询关于主人的记忆。
+
+        Args:
+            query: 查询内容，例如“喜欢的饮料”。
+        """
+        facts = self.store.search(query, self.top_k)
+        if not facts:
+            return "没有相关记忆。"
+        return "\n".join(
+            f"#{fact.id} [{fact.category}] {fact.content}" for fact in facts
+        )
+
+    def forget(self, fact_id: int) -> str:
+        """删除一条过时或错误的记忆。
+
+        Args:
+            fact_id: 记忆编号，即 recall 结果中 # 后的数字。
+        """
+        if self.store.forget(fact_id):
+            return f"已删除记忆 #{fact_id}"
+        return f"不存在记忆 #{fact_id}"
+
+    def context_for(self, text: str) -> str:
+        """检索与 text 相关的记忆，格式化为附在输入前的上下文；没有时返回空串。"""
+        facts = self.store.search(text, self.top_k)
+        if not facts:
+            return ""
+        lines = "\n".join(f"- {fact.content}" for fact in facts)
+        return f"[关于主人的记忆]\n{lines}"
@@ -0,0 +1,289 @@
+"""本地 OpenAI 兼容的模拟 LLM 服务：固定回复、可配置延迟、流式输出与工具调用。
+
+用于离线测量端到端延迟，也可以单独运行：
+
+python -m src.mock_llm --port 8765 --first-token 0.3
+"""
+
+import argparse
+import contextlib
+import json
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLIES = [
+    "哼，又在磨蹭什么。",
+    "……我才没有在等你。",
+    "啧，这种小事也要问我？",
+    "做得还行吧，别得意。",
+    "累了就休息一下，笨蛋。",
+    "看什么看，快去干活。",
+]
+
+
+class MockLLMServer:
+    """在后台线程运行的模拟 /v1/chat/completions 服务。
+
+    回复由最后一条用户消息的 CRC32 决定，同样的输入总是得到同样的回复；
+    首个 token 前等待 first_token_latency 秒，之后每段文本间隔 token_interval 秒。
+    tool_call_every=N 时每 N 个请求在文本之后附带一次 perform 工具调用；
+    tool_call_first=True 时改为只返回工具调用、不带文本（Gemini 常见），
+    收到工具结果后再返回回复文本；
+    fail_every=N 时每 N 个请求返回 503，用于验证重试。
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        first_token_latency: float = 0.3,
+        token_interval: float = 0.02,
+        tool_call_every: int = 0,
+        fail_every: int = 0,
+        tool_call_first: bool = False,
+    ) -> None:
+        self.first_token_latency = first_token_latency
+        self.token_interval = token_interval
+        self.tool_call_every = tool_call_every
+        self.fail_every = fail_every
+        self.tool_call_first = tool_call_first
+        # 每段流式文本的字符数
+        self.chunk_chars = 2
+
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self._httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._httpd.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockLLMServer":
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, name="mock-llm", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _next_request(self) -> int:
+        with self._lock:
+            self.requests += 1
+            return self.requests
+
+    def _on_connect(self):
+        with self._lock:
+            self.connections += 1
+
+    def respond(self, body: dict, count: int) -> tuple[str, dict | None]:
+        """根据请求内容生成 (回复文本, 工具调用或 None)。"""
+        messages = body.get("messages", [])
+        prompt = _last_user_text(messages)
+        reply = REPLIES[zlib.crc32(prompt.encode()) % len(REPLIES)]
+        if messages and messages[-1].get("role") == "tool":
+            # 工具调用之前已经说过话时只补一句，否则这才给出回复文本
+            start = max(
+                (i for i, m in enumerate(messages) if m.get("role") == "user"),
+                default=0,
+            )
+            said = any(
+                m.get("role") == "assistant" and m.get("content")
+                for m in messages[start:]
+            )
+            return ("哼。" if said else reply), None
+        tool_call = None
+        tool_names = [t["function"]["name"] for t in body.get("tools") or []]
+        if (
+            self.tool_call_every
+            and count % self.tool_call_every == 0
+            and "perform" in tool_names
+        ):
+            tool_call = {
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {
+                    "name": "perform",
+                    "arguments": json.dumps({"expression": "", "motion_group": ""}),
+                },
+            }
+            if self.tool_call_first:
+                reply = ""
+        return reply, tool_call
+
+
+def _last_user_text(messages: list[dict]) -> str:
+    for message in reversed(messages):
+        if message.get("role") != "user":
+            continue
+        content = message.get("content")
+        if isinstance(content, list):
+            return "".join(
+                p.get("text", "") for p in content if p.get("type") == "text"
+            )
+        return content or ""
+    return ""
+
+
+def _make_handler(server: MockLLMServer):
+    class Handler(BaseHTTPRequestHandler):
+        # HTTP/1.1 + Content-Length / chunked，客户端可以复用连接
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            server._on_connect()
+
+        def log_message(self, format, *args):
+            pass
+
+        def handle(self):
+            # 请求被取消时客户端会直接断开连接
+            with contextlib.suppress(ConnectionResetError, BrokenPipeError):
+                super().handle()
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/v1/models":
+                self._send_json(200, {"object": "list", "data": [{"id": "mock"}]})
+            else:
+                self._send_json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if self.path.rstrip("/") != "/v1/chat/completions":
+                self._send_json(404, {"error": {"message": "not found"}})
+                return
+            count = server._next_request()
+            if server.fail_every and count % server.fail_every == 0:
+                self._send_json(503, {"error": {"message": "mock overloaded"}})
+                return
+            reply, tool_call = server.respond(body, count)
+            model = body.get("model", "mock")
+            if body.get("stream"):
+                self._stream(model, reply, tool_call, body)
+            else:
+                self._complete(model, reply, tool_call)
+
+        def _complete(self, model: str, reply: str, tool_call: dict | None):
+            chunks = -(-len(reply) // server.chunk_chars)
+            time.sleep(server.first_token_latency + server.token_interval * chunks)
+            message = {"role": "assistant", "content": reply}
+            if tool_call:
+                message["tool_calls"] = [tool_call]
+            self._send_json(
+                200,
+                {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": message,
+                            "finish_reason": "tool_calls" if tool_call else "stop",
+                        }
+                    ],
+                    "usage": _usage(reply),
+                },
+            )
+
+        def _stream(self, model: str, reply: str, tool_call: dict | None, body):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            base = {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+            }
+
+            def send(delta: dict, finish: str | None = None, usage=None):
+                event = {
+                    **base,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+                }
+                if usage is not None:
+                    event["usage"] = usage
+                self._write_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n")
+
+            time.sleep(server.first_token_latency)
+            send({"role": "assistant", "content": ""})
+            for i in range(0, len(reply), server.chunk_chars):
+                send({"content": reply[i : i + server.chunk_chars]})
+                time.sleep(server.token_interval)
+            if tool_call:
+                send({"tool_calls": [{"index": 0, **tool_call}]})
+            include_usage = (body.get("stream_options") or {}).get("include_usage")
+            send(
+                {},
+                "tool_calls" if tool_call else "stop",
+                _usage(reply) if include_usage else None,
+            )
+            # [DONE] 与结束块一起发出，客户端读到 [DONE] 时响应已完整，连接可以复用
+            self._write_chunk("data: [DONE]\n\n", last=True)
+
+        def _write_chunk(self, text: str, last: bool = False):
+            data = text.encode()
+            frame = f"{len(data):x}\r\n".encode() + data + b"\r\n"
+            self.wfile.write(frame + b"0\r\n\r\n" if last else frame)
+            self.wfile.flush()
+
+        def _send_json(self, status: int, payload: dict):
+            data = json.dumps(payload, ensure_ascii=False).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+def _usage(reply: str) -> dict:
+    completion = len(reply)
+    return {
+        "prompt_tokens": 100,
+        "completion_tokens": completion,
+        "total_tokens": 100 + completion,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--first-token", type=float, default=0.3)
+    parser.add_argument("--token-interval", type=float, default=0.02)
+    parser.add_argument("--tool-call-every", type=int, default=0)
+    parser.add_argument("--fail-every", type=int, default=0)
+    parser.add_argument("--tool-call-first", action="store_true")
+    args = parser.parse_args()
+    server = MockLLMServer(
+        args.host,
+        args.port,
+        args.first_token,
+        args.token_interval,
+        args.tool_call_every,
+        args.fail_every,
+        args.tool_call_first,
+    )
+    print(f"[MockLLM] 监听 {server.url}")
+    with contextlib.suppress(KeyboardInterrupt):
+        server._httpd.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
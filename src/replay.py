@@ -0,0 +1,216 @@
+"""可回放的输入源：用录好的音频和画面代替麦克风与显示器，便于无头环境下测试和做基准。
+
+- AudioReplay：WAV / NPY 音频，按 VAD 帧大小切块，交给 FullSentenceWorker(source=...)；
+- FrameReplay：图片目录、视频文件或内存中的帧序列，提供与 mss 相同的
+  monitors / grab / close 接口，交给 ScreenChangeDetector(source=...)。
+"""
+
+import os
+import threading
+import time
+import wave
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".webp")
+
+
+def load_audio(path: str, sample_rate: int = 16000) -> np.ndarray:
+    """读取 WAV（16 位 PCM）或 NPY 文件，返回单声道 int16 音频。
+
+    多声道取平均；WAV 采样率与 sample_rate 不同时线性插值重采样。
+    NPY 中的浮点数据视为 [-1, 1] 范围，且假定采样率已是 sample_rate。
+    """
+    if path.endswith(".npy"):
+        audio = np.load(path)
+        if audio.ndim > 1:
+            audio = audio.mean(axis=-1)
+        if np.issubdtype(audio.dtype, np.floating):
+            audio = np.clip(audio, -1, 1) * 32767
+        return audio.astype(np.int16)
+
+    with wave.open(path, "rb") as f:
+        if f.getsampwidth() != 2:
+            raise ValueError(f"只支持 16 位 PCM WAV: {path}")
+        rate, channels = f.getframerate(), f.getnchannels()
+        audio = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+    if channels > 1:
+        audio = audio.reshape(-1, channels).mean(axis=1).astype(np.int16)
+    if rate != sample_rate:
+        n = int(len(audio) * sample_rate / rate)
+        positions = np.linspace(0, len(audio) - 1, n)
+        audio = np.interp(positions, np.arange(len(audio)), audio).astype(np.int16)
+    return audio
+
+
+class AudioReplay:
+    """把一段 int16 音频按 block_size 切块回放；最后一块不足时补零。
+
+    realtime=True 时按音频时长控制节奏，模拟麦克风；否则尽快输出。
+    """
+
+    def __init__(
+        self,
+        audio: np.ndarray,
+        sample_rate: int = 16000,
+        block_size: int = 512,
+        realtime: bool = False,
+    ) -> None:
+        self.audio = np.asarray(audio, dtype=np.int16)
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.realtime = realtime
+
+    @classmethod
+    def from_file(cls, path: str, sample_rate: int = 16000, **kwargs) -> "AudioReplay":
+        return cls(load_audio(path, sample_rate), sample_rate, **kwargs)
+
+    @property
+    def duration(self) -> float:
+        return len(self.audio) / self.sample_rate
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        start = time.perf_counter()
+        for i in range(0, len(self.audio), self.block_size):
+            block = self.audio[i : i + self.block_size]
+            if len(block) < self.block_size:
+                block = np.pad(block, (0, self.block_size - len(block)))
+            if self.realtime:
+                delay = start + i / self.sample_rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            yield block
+
+
+@dataclass
+class _Shot:
+    """与 mss 截图结果相同的最小接口。"""
+
+    raw: bytearray
+    width: int
+    height: int
+
+
+class FrameReplay:
+    """回放 BGRA 帧序列，接口与 mss.mss() 相同，可直接替换检测器的截图来源。
+
+    frames 为帧的个数和按下标取帧的函数，取帧是惰性的，长视频不必整段载入内存。
+    realtime=True 时按 fps 随时间推进（检测器采样慢时会跳帧，与真实屏幕一致）；
+    否则每次整屏截图推进一帧，用于测量检测器吞吐。
+    全部帧回放完后 exhausted 被置位，之后的截图一直返回最后一帧。
+    """
+
+    def __init__(
+        self,
+        count: int,
+        read_frame: Callable[[int], np.ndarray],
+        fps: float = 30.0,
+        realtime: bool = False,
+    ) -> None:
+        if count <= 0:
+            raise ValueError("帧序列为空")
+        self.count = count
+        self.fps = fps
+        self.realtime = realtime
+        self.exhausted = threading.Event()
+        self.grabs = 0  # 整屏截图次数（即检测器处理的帧数）
+        self._read_frame = read_frame
+        self._index = -1
+        self._frame = read_frame(0)
+        self._cached = 0
+        self._start: float | None = None
+        h, w = self._frame.shape[:2]
+        monitor = {"left": 0, "top": 0, "width": w, "height": h}
+        self.monitors = [monitor, monitor]
+
+    @classmethod
+    def from_frames(cls, frames: list[np.ndarray], **kwargs) -> "FrameReplay":
+        return cls(len(frames), lambda i: _to_bgra(frames[i]), **kwargs)
+
+    @classmethod
+    def from_directory(cls, path: str, **kwargs) -> "FrameReplay":
+        """按文件名顺序回放目录中的截图。"""
+        files = sorted(
+            os.path.join(path, name)
+            for name in os.listdir(path)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        return cls(len(files), lambda i: _to_bgra(cv2.imread(files[i])), **kwargs)
+
+    @classmethod
+    def from_video(cls, path: str, **kwargs) -> "FrameReplay":
+        """顺序解码视频文件；只支持向后取帧，跳帧时丢弃中间的帧。"""
+        capture = cv2.VideoCapture(path)
+        if not capture.isOpened():
+            raise ValueError(f"无法打开视频: {path}")
+        count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        kwargs.setdefault("fps", capture.get(cv2.CAP_PROP_FPS) or 30.0)
+        position = [0]
+
+        def read_frame(i: int) -> np.ndarray:
+            frame = None
+            while position[0] <= i:
+                ok, frame = capture.read()
+                if not ok:
+                    raise ValueError(f"视频在第 {position[0]} 帧提前结束: {path}")
+                position[0] += 1
+            return _to_bgra(frame)
+
+        return cls(count, read_frame, **kwargs)
+
+    @classmethod
+    def open(cls, path: str, **kwargs) -> "FrameReplay":
+        """按路径类型选择：目录为截图序列，.npy 为 (n, h, w, c) 数组，其余视为视频。"""
+        if os.path.isdir(path):
+            return cls.from_directory(path, **kwargs)
+        if path.endswith(".npy"):
+            frames = np.load(path, mmap_mode="r")
+            return cls(len(frames), lambda i: _to_bgra(frames[i]), **kwargs)
+        return cls.from_video(path, **kwargs)
+
+    def grab(self, region: dict) -> _Shot:
+        """返回当前帧（或其中一块区域）的一份拷贝，调用方可以原地修改。"""
+        monitor = self.monitors[1]
+        if region == monitor:
+            self._advance()
+        frame = self._current()
+        x, y = region["left"] - monitor["left"], region["top"] - monitor["top"]
+        w, h = region["width"], region["height"]
+        crop = np.ascontiguousarray(frame[y : y + h, x : x + w])
+        return _Shot(bytearray(crop.tobytes()), w, h)
+
+    def close(self):
+        pass
+
+    def _advance(self):
+        self.grabs += 1
+        if self.realtime:
+            if self._start is None:
+                self._start = time.perf_counter()
+            index = int((time.perf_counter() - self._start) * self.fps)
+        else:
+            index = self._index + 1
+        if index >= self.count:
+            self.exhausted.set()
+            index = self.count - 1
+        self._index = index
+
+    def _current(self) -> np.ndarray:
+        index = max(self._index, 0)
+        if index != self._cached:
+            self._frame = self._read_frame(index)
+            self._cached = index
+        return self._frame
+
+
+def _to_bgra(frame: np.ndarray) -> np.ndarray:
+    """把灰度 / BGR / BGRA 帧统一为连续的 BGRA uint8 数组。"""
+    frame = np.asarray(frame, dtype=np.uint8)
+    if frame.ndim == 2:
+        return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGRA)
+    if frame.shape[2] == 3:
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA)
+    return np.ascontiguousarray(frame)
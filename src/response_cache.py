@@ -0,0 +1,232 @@
+"""回复缓存：重复的口头语和反复回到的画面直接复用之前的回复，省去一次模型调用。
+
+语音按归一化文本精确匹配；屏幕按 ScreenDedupFilter 计算的逐瓦片感知哈希近似匹配，
+键为首次出现时的指纹。两分钟内重复的画面已由去重过滤器直接丢弃，缓存负责的是
+隔一段时间又回到的画面（例如每天打开同一个网页）。
+缓存的回复只有文本：命中时不会再执行原回复中的 perform（表情 / 动作）和记忆工具调用。
+"""
+
+import json
+import os
+import random
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+
+import numpy as np
+
+from src.screen_dedup import ScreenFingerprint
+
+# 屏幕键的前缀；语音键是去掉标点后的文本，不会含有冒号
+SCREEN_PREFIX = "screen:"
+
+
+def normalize_text(text: str) -> str:
+    """归一化语音文本：全半角统一、转小写、去掉标点和空白、合并连续重复的字。
+
+    “在吗？”“在吗”“在吗吗” 得到同一个键。
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    chars = [ch for ch in text if unicodedata.category(ch)[0] not in "PSZC"]
+    return "".join(ch for i, ch in enumerate(chars) if i == 0 or ch != chars[i - 1])
+
+
+@dataclass
+class CachedResponse:
+    replies: list[str]  # 收集到的不同回复，最旧的在前
+    latency: float  # 生成这些回复的平均模型耗时（秒）
+    # time.time()，最近一次写入或命中的时间；过期从此刻起算，常用的条目不会过期
+    used_at: float
+    served: list[int] = field(default_factory=list)  # 最近返回过的回复下标
+
+
+class ResponseCache:
+    """按归一化文本或屏幕指纹缓存回复，带 TTL（自最近一次使用起）、LRU 淘汰和磁盘持久化。
+
+    变化策略：同一个键先收集 variants 条不同的模型回复，收集满之后才从缓存返回，
+    并避开最近返回过的回复；即使已收集满，也有 refresh_rate 的概率重新调用模型，
+    用新回复替换最旧的一条。variants=1、refresh_rate=0 时总是复用同一条回复。
+    """
+
+    def __init__(
+        self,
+        path: str | None = "data/response_cache.json",
+        ttl: float = 6 * 3600,
+        capacity: int = 512,
+        variants: int = 3,
+        refresh_rate: float = 0.2,
+    ) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.capacity = capacity
+        self.variants = max(1, variants)
+        self.refresh_rate = refresh_rate
+        # 只缓存归一化后不超过此长度的短句，长句往往依赖上下文
+        self.max_text_len = 16
+        # 屏幕条目的键是整个指纹（约 9KB 十六进制），单独限制条数
+        self.screen_capacity = 64
+        # 每写入多少次自动保存一次
+        self.save_every = 16
+
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._text: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._screen: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._fingerprints: dict[str, ScreenFingerprint] = {}  # 屏幕键 -> 解析后的指纹
+        self._dirty = 0
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._load()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def describe(self) -> str:
+        return (
+            f"命中 {self.hits} / 未命中 {self.misses} ({self.hit_rate:.0%}), "
+            f"节省 {self.saved_seconds:.1f}s"
+        )
+
+    # ── 查找与写入 ──
+
+    def text_key(self, text: str) -> str | None:
+        """语音文本的缓存键；过长或为空的文本不参与缓存。"""
+        key = normalize_text(text)
+        return key if 0 < len(key) <= self.max_text_len else None
+
+    def screen_key(
+        self, fingerprint: ScreenFingerprint, changed: np.ndarray | None = None
+    ) -> str:
+        """屏幕指纹的缓存键：与已缓存的某个画面匹配时返回其键，否则返回新键。
+
+        匹配规则见 ScreenFingerprint.matches，changed 为本次变化的瓦片。
+        """
+        with self._lock:
+            self._evict_expired()
+            for key in reversed(self._screen):
+                if fingerprint.matches(self._fingerprints[key], changed):
+                    return key
+        return SCREEN_PREFIX + fingerprint.hex()
+
+    def lookup(self, key: str) -> str | None:
+        """查找可复用的回复，按变化策略可能返回 None 要求重新生成。"""
+        with self._lock:
+            self._evict_expired()
+            table = self._table(key)
+            entry = table.get(key)
+            if (
+                entry is None
+                or len(entry.replies) < self.variants
+                or random.random() < self.refresh_rate
+            ):
+                self.misses += 1
+                return None
+            table.move_to_end(key)
+            entry.used_at = time.time()
+            choices = [
+                i for i in range(len(entry.replies)) if i not in entry.served
+            ] or list(range(len(entry.replies)))
+            index = random.choice(choices)
+            entry.served.append(index)
+            del entry.served[: max(0, len(entry.served) - (self.variants - 1))]
+            self.hits += 1
+            self.saved_seconds += entry.latency
+            return entry.replies[index]
+
+    def store(self, key: str, reply: str, latency: float):
+        """记录一次模型回复及其耗时。"""
+        with self._lock:
+            self._evict_expired()
+            table = self._table(key)
+            entry = table.get(key)
+            if entry is None:
+                entry = table[key] = CachedResponse([], latency, time.time())
+                if table is self._screen:
+                    self._fingerprints[key] = _parse_screen_key(key)
+            else:
+                n = len(entry.replies)
+                entry.latency = (entry.latency * n + latency) / (n + 1)
+                entry.used_at = time.time()
+            if reply not in entry.replies:
+                entry.replies.append(reply)
+                if len(entry.replies) > self.variants:
+                    entry.replies.pop(0)
+                    entry.served.clear()
+            table.move_to_end(key)
+            capacity = self.screen_capacity if table is self._screen else self.capacity
+            while len(table) > capacity:
+                self._remove(table, next(iter(table)))
+            self._dirty += 1
+            should_save = self._dirty >= self.save_every
+        if should_save:
+            self.save()
+
+    # ── 持久化 ──
+
+    def save(self):
+        """原子地写入磁盘（先写临时文件再替换）。"""
+        if not self.path:
+            return
+        with self._lock:
+            data = {
+                "text": {k: asdict(v) for k, v in self._text.items()},
+                "screen": {k: asdict(v) for k, v in self._screen.items()},
+            }
+            self._dirty = 0
+        with self._save_lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            for table, name in ((self._text, "text"), (self._screen, "screen")):
+                for k, v in data.get(name, {}).items():
+                    # 旧版本的文件记录的是 created_at
+                    if "created_at" in v:
+                        v["used_at"] = v.pop("created_at")
+                    table[k] = CachedResponse(**v)
+            for k in self._screen:
+                self._fingerprints[k] = _parse_screen_key(k)
+        except (OSError, ValueError, TypeError) as e:
+            print(f"[ResponseCache] 读取缓存失败，从空缓存开始: {e}")
+            self._text.clear()
+            self._screen.clear()
+            self._fingerprints.clear()
+            return
+        self._evict_expired()
+        print(
+            f"[ResponseCache] 已加载 {len(self._text)} 条语音缓存, "
+            f"{len(self._screen)} 条屏幕缓存"
+        )
+
+    # ── 内部方法（调用方持有锁） ──
+
+    def _table(self, key: str) -> OrderedDict[str, CachedResponse]:
+        return self._screen if key.startswith(SCREEN_PREFIX) else self._text
+
+    def _remove(self, table: OrderedDict[str, CachedResponse], key: str):
+        del table[key]
+        self._fingerprints.pop(key, None)
+
+    def _evict_expired(self):
+        deadline = time.time() - self.ttl
+        for table in (self._text, self._screen):
+            expired = [k for k, v in table.items() if v.used_at < deadline]
+            for k in expired:
+                self._remove(table, k)
+
+
+def _parse_screen_key(key: str) -> ScreenFingerprint:
+    return ScreenFingerprint.from_hex(key.removeprefix(SCREEN_PREFIX))
@@ -0,0 +1,202 @@
+"""屏幕截图去重：按瓦片计算感知哈希，过滤与近期画面几乎相同的屏幕变化。
+
+整屏只算一个 8x8 哈希时，新弹出的对话框、通知或窗口内改动的几行文字都只影响
+少数几位，会被误判为“同一画面”。这里把画面切成与检测器相同的瓦片网格，
+每个瓦片各算一个 dHash：检测器报告变化的瓦片必须逐个相近才算重复，
+其余瓦片允许少数几个不同（任务栏时钟、托盘图标）。
+"""
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+import cv2
+import numpy as np
+from PySide6.QtCore import QObject, Signal, Slot
+
+from src.screen_worker import ScreenEvent
+from src.tracing import tracer
+
+
+@dataclass(frozen=True)
+class ScreenFingerprint:
+    """按瓦片网格计算的感知哈希，每个瓦片 hash_size*hash_size 位。"""
+
+    bits: np.ndarray  # (rows, cols, hash_size*hash_size/8) uint8
+
+    @property
+    def grid(self) -> tuple[int, int]:
+        return self.bits.shape[:2]
+
+    def distances(self, other: "ScreenFingerprint") -> np.ndarray:
+        """逐瓦片的汉明距离，形状 (rows, cols)；网格不同时视为全部不同。"""
+        if self.bits.shape != other.bits.shape:
+            return np.full(self.grid, self.bits.shape[2] * 8)
+        return np.bitwise_count(self.bits ^ other.bits).sum(axis=-1)
+
+    def matches(
+        self,
+        other: "ScreenFingerprint",
+        changed: np.ndarray | None = None,
+        tile_distance: int = 8,
+        max_other_tiles: int = 2,
+    ) -> bool:
+        """是否为同一画面。
+
+        changed 为检测器报告变化的瓦片 (rows, cols) bool：这些瓦片的距离都必须
+        不超过 tile_distance；其余瓦片最多 max_other_tiles 个超出。
+        """
+        differing = self.distances(other) > tile_distance
+        if changed is not None and changed.shape == differing.shape:
+            if (differing & changed).any():
+                return False
+            differing &= ~changed
+        return int(differing.sum()) <= max_other_tiles
+
+    def key(self) -> bytes:
+        return self.bits.tobytes()
+
+    def hex(self) -> str:
+        rows, cols, _ = self.bits.shape
+        return f"{rows}x{cols}:{self.bits.tobytes().hex()}"
+
+    @classmethod
+    def from_hex(cls, text: str) -> "ScreenFingerprint":
+        grid, _, data = text.partition(":")
+        rows, cols = (int(n) for n in grid.split("x"))
+        bits = np.frombuffer(bytes.fromhex(data), dtype=np.uint8)
+        return cls(bits.reshape(rows, cols, -1))
+
+
+def tile_fingerprint(
+    img: np.ndarray, grid: tuple[int, int], hash_size: int = 16, margin: int = 2
+) -> ScreenFingerprint:
+    """计算 BGRA 图像在 (rows, cols) 网格上每个瓦片的差值哈希（dHash）。"""
+    rows, cols = grid
+    h, w = img.shape[:2]
+    # 先按步长抽样，避免在全分辨率图像上做 resize
+    step = max(1, min(w // (cols * (hash_size + 1) * 4), h // (rows * hash_size * 4)))
+    small = cv2.resize(
+        img[::step, ::step],
+        (cols * (hash_size + 1), rows * hash_size),
+        interpolation=cv2.INTER_AREA,
+    )
+    gray = cv2.cvtColor(small, cv2.COLOR_BGRA2GRAY)
+    tiles = gray.reshape(rows, hash_size, cols, hash_size + 1).transpose(0, 2, 1, 3)
+    tiles = tiles.astype(np.int16)
+    # 差值不超过 margin 视为平坦：大片纯色背景上的细微抖动不会随机翻转哈希位
+    bits = tiles[..., 1:] - tiles[..., :-1] > margin
+    return ScreenFingerprint(
+        np.packbits(bits.reshape(rows, cols, hash_size * hash_size), axis=-1)
+    )
+
+
+@dataclass
+class CacheEntry:
+    fingerprint: ScreenFingerprint
+    created_at: float
+    value: Any = None
+
+
+class PerceptualHashCache:
+    """容量有限的感知哈希 LRU 缓存，条目超过 ttl 秒后失效。
+
+    查找时返回与给定指纹匹配（见 ScreenFingerprint.matches）的最近条目。
+    """
+
+    def __init__(
+        self,
+        capacity: int = 64,
+        ttl: float = 120.0,
+        tile_distance: int = 8,
+        max_other_tiles: int = 2,
+    ):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.tile_distance = tile_distance
+        self.max_other_tiles = max_other_tiles
+        self._entries: OrderedDict[bytes, CacheEntry] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def lookup(
+        self, fingerprint: ScreenFingerprint, changed: np.ndarray | None = None
+    ) -> CacheEntry | None:
+        """查找同一画面；命中时刷新其 LRU 位置（不延长 TTL）。"""
+        self._evict_expired()
+        for key in reversed(self._entries):
+            entry = self._entries[key]
+            if fingerprint.matches(
+                entry.fingerprint, changed, self.tile_distance, self.max_other_tiles
+            ):
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry
+        self.misses += 1
+        return None
+
+    def put(self, fingerprint: ScreenFingerprint, value: Any = None) -> CacheEntry:
+        """插入或覆盖条目，超出容量时淘汰最久未使用的条目。"""
+        key = fingerprint.key()
+        entry = CacheEntry(fingerprint, time.monotonic(), value)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+        return entry
+
+    def _evict_expired(self):
+        deadline = time.monotonic() - self.ttl
+        expired = [k for k, e in self._entries.items() if e.created_at < deadline]
+        for k in expired:
+            del self._entries[k]
+
+
+class ScreenDedupFilter(QObject):
+    """位于屏幕检测器和 Controller 之间，按“抑制或复用”处理重复画面。
+
+    ttl 秒内再次出现的同一画面（例如来回切换同两个窗口）直接丢弃；
+    其余画面照常转发，事件带上指纹，AgentWorker 据此在回复缓存中复用
+    之前对同一画面的回复（见 ResponseCache.screen_key）。
+    """
+
+    screen_passed = Signal(object)  # ScreenEvent
+
+    def __init__(
+        self,
+        capacity: int = 64,
+        ttl: float = 120.0,
+        tile_distance: int = 8,
+        max_other_tiles: int = 2,
+    ) -> None:
+        super().__init__()
+        self.cache = PerceptualHashCache(capacity, ttl, tile_distance, max_other_tiles)
+
+    @Slot(object)
+    def on_screen_change(self, event: ScreenEvent):
+        """计算截图指纹；近期出现过同一画面则丢弃，否则记录并转发。"""
+        img = event.image
+        if img is None:
+            tracer.mark(event.trace_id, "dropped:overwritten")
+            event.discard()
+            return
+        event.fingerprint = tile_fingerprint(img, event.changed_tiles.shape)
+        if self.cache.lookup(event.fingerprint, event.changed_tiles) is not None:
+            print(
+                f"[Dedup] 画面与近期重复，跳过 "
+                f"(命中 {self.cache.hits} / 未命中 {self.cache.misses})"
+            )
+            tracer.mark(event.trace_id, "dropped:duplicate")
+            event.discard()
+            return
+        self.cache.put(event.fingerprint)
+        self.screen_passed.emit(event)
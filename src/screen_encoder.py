@@ -0,0 +1,167 @@
+"""截图编码：按字节预算选择分辨率、格式与质量，并在线程池中完成编码。"""
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+# 格式 -> (文件扩展名, MIME 类型, OpenCV 质量参数)
+FORMATS = {
+    "jpeg": (".jpg", "image/jpeg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", "image/webp", cv2.IMWRITE_WEBP_QUALITY),
+    "png": (".png", "image/png", cv2.IMWRITE_PNG_COMPRESSION),
+}
+
+# 从高到低的 (最长边, 质量) 阶梯；PNG 忽略质量，只按分辨率降级
+LADDER = [
+    (2560, 85),
+    (1920, 80),
+    (1600, 75),
+    (1280, 70),
+    (1024, 60),
+    (768, 50),
+]
+
+
+@dataclass
+class EncodedImage:
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    quality: int
+    encode_ms: float
+
+    def describe(self) -> str:
+        fmt = self.mime_type.split("/")[1]
+        if fmt != "png":
+            fmt += f" q{self.quality}"
+        return (
+            f"{self.width}x{self.height} {fmt} "
+            f"{len(self.data) / 1024:.0f} KB, 编码 {self.encode_ms:.0f} ms"
+        )
+
+
+def shrink_encoded(
+    data: bytes, max_side: int = 320, quality: int = 40
+) -> EncodedImage | None:
+    """把已编码的图片缩小为低分辨率 JPEG；解码失败时返回 None。"""
+    start = time.perf_counter()
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    h, w = img.shape[:2]
+    scale = min(1.0, max_side / max(w, h))
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    if scale < 1.0:
+        img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    success, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not success:
+        return None
+    return EncodedImage(
+        data=buf.tobytes(),
+        mime_type="image/jpeg",
+        width=size[0],
+        height=size[1],
+        quality=quality,
+        encode_ms=(time.perf_counter() - start) * 1000,
+    )
+
+
+class ScreenEncoder:
+    """沿分辨率/质量阶梯寻找第一个不超过 byte_budget 的编码结果。
+
+    按图像尺寸（不同显示器、不同大小的区域）分别记住上一次满足预算的阶梯位置，
+    下一次从其上一级开始尝试，通常只需编码一到两次。
+    fmt="auto" 时按预算选择格式：原图像素量不超过预算的 png_max_ratio 倍时
+    （小区域、文字为主的截图）先尝试无损 PNG，放得进预算就用 PNG，否则走 JPEG 阶梯。
+    """
+
+    def __init__(
+        self, byte_budget: int = 300_000, fmt: str = "auto", max_workers: int = 2
+    ):
+        if fmt != "auto" and fmt not in FORMATS:
+            raise ValueError(f"不支持的编码格式: {fmt}")
+        self.byte_budget = byte_budget
+        self.fmt = fmt
+        # auto 模式下尝试 PNG 的上限：BGR 原始字节数 / 预算
+        self.png_max_ratio = 4
+        # 最多记住多少种图像尺寸的阶梯位置
+        self.max_rung_sizes = 32
+        self._rung_lock = threading.Lock()
+        self._start_rungs: OrderedDict[tuple[int, int], int] = OrderedDict()
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="screen-encoder"
+        )
+
+    def submit(self, img: np.ndarray) -> Future:
+        """在线程池中编码 BGRA 截图，返回 Future[EncodedImage]。"""
+        return self._pool.submit(self.encode, img)
+
+    def submit_thumbnail(self, img: np.ndarray) -> Future:
+        """在线程池中生成整屏低分辨率缩略图，返回 Future[EncodedImage]。"""
+        return self._pool.submit(self.encode_thumbnail, img)
+
+    def encode(self, img: np.ndarray) -> EncodedImage:
+        """同步编码 BGRA 截图。"""
+        start = time.perf_counter()
+        h, w = img.shape[:2]
+        if self.fmt == "auto" and w * h * 3 <= self.byte_budget * self.png_max_ratio:
+            buf, size = self._encode_once(img, "png", max(w, h), 0)
+            if len(buf) <= self.byte_budget:
+                return self._result(buf, size, "png", 0, start)
+        fmt = "jpeg" if self.fmt == "auto" else self.fmt
+        with self._rung_lock:
+            first = max(0, self._start_rungs.get((w, h), 0) - 1)
+        for rung in range(first, len(LADDER)):
+            max_side, quality = LADDER[rung]
+            buf, size = self._encode_once(img, fmt, max_side, quality)
+            if len(buf) <= self.byte_budget:
+                break
+        with self._rung_lock:
+            self._start_rungs[(w, h)] = rung
+            self._start_rungs.move_to_end((w, h))
+            while len(self._start_rungs) > self.max_rung_sizes:
+                self._start_rungs.popitem(last=False)
+        return self._result(buf, size, fmt, quality, start)
+
+    def encode_thumbnail(
+        self, img: np.ndarray, max_side: int = 480, quality: int = 50
+    ) -> EncodedImage:
+        """同步生成缩略图，只编码一次，不参与字节预算。"""
+        start = time.perf_counter()
+        fmt = "jpeg" if self.fmt == "auto" else self.fmt
+        buf, size = self._encode_once(img, fmt, max_side, quality)
+        return self._result(buf, size, fmt, quality, start)
+
+    def _encode_once(self, img: np.ndarray, fmt: str, max_side: int, quality: int):
+        ext, _, quality_flag = FORMATS[fmt]
+        h, w = img.shape[:2]
+        scale = min(1.0, max_side / max(w, h))
+        size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        small = (
+            cv2.resize(img, size, interpolation=cv2.INTER_AREA) if scale < 1.0 else img
+        )
+        bgr = cv2.cvtColor(small, cv2.COLOR_BGRA2BGR)
+        params = [quality_flag, 3 if fmt == "png" else quality]
+        success, buf = cv2.imencode(ext, bgr, params)
+        if not success:
+            raise RuntimeError(f"截图编码失败: {fmt}")
+        return buf, size
+
+    def _result(self, buf, size, fmt: str, quality: int, start: float) -> EncodedImage:
+        return EncodedImage(
+            data=buf.tobytes(),
+            mime_type=FORMATS[fmt][1],
+            width=size[0],
+            height=size[1],
+            quality=quality,
+            encode_ms=(time.perf_counter() - start) * 1000,
+        )
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
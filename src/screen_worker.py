@@ -1,79 +1,525 @@
+import math
+import threading
 import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
 
 import cv2
 import mss
 import numpy as np
 from PySide6.QtCore import QObject, QThread, Signal, Slot
 
+from src.frame_ring import FrameRef, FrameRing
+from src.screen_encoder import ScreenEncoder
+from src.tracing import tracer
+from src.window_mask import OwnWindowMask, Rect
+from src.xdamage import XDamageMonitor
+
+
+@dataclass
+class ScreenPayload:
+    """发送给 Agent 的截图内容：变化区域（为空表示整屏）及其编码任务。"""
+
+    regions: list[tuple[int, int, int, int]] = field(
+        default_factory=list
+    )  # (x, y, w, h)
+    with_thumbnail: bool = False  # 发送局部区域时是否附带整屏缩略图
+    encoded: list[Future] = field(
+        default_factory=list
+    )  # 每个区域一个 Future[EncodedImage]
+    thumbnail: Future | None = None
+
+    def crops(self, img: np.ndarray) -> list[np.ndarray]:
+        """按区域裁剪截图（零拷贝视图），没有区域时返回整屏。"""
+        return [img[y : y + h, x : x + w] for x, y, w, h in self.regions] or [img]
+
+    def submit(self, img: np.ndarray, encoder: ScreenEncoder):
+        """把裁剪结果（及缩略图）提交到编码线程池。"""
+        self.encoded = [encoder.submit(crop) for crop in self.crops(img)]
+        if self.regions and self.with_thumbnail:
+            self.thumbnail = encoder.submit_thumbnail(img)
+
+    def trace(self, trace_id: int):
+        """所有编码任务完成时在追踪中记录 encoded 阶段。"""
+        futures = [*self.encoded, *([self.thumbnail] if self.thumbnail else [])]
+        if not futures:
+            return
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def on_done(future: Future):
+            with lock:
+                remaining[0] -= 1
+                done = remaining[0] == 0
+            if done and not future.cancelled():
+                tracer.mark(trace_id, "encoded")
+
+        for future in futures:
+            future.add_done_callback(on_done)
+
+    def cancel(self):
+        for future in self.encoded:
+            future.cancel()
+        if self.thumbnail is not None:
+            self.thumbnail.cancel()
+
+
+@dataclass
+class ScreenEvent:
+    """一次显著的屏幕变化。"""
+
+    score: float  # 全局平均像素差异
+    frame: FrameRef  # 画面稳定后截取的原始 BGRA 图像在帧环中的句柄
+    ring: FrameRing
+    monitor: int  # mss 显示器编号（从 1 开始）
+    tile_scores: np.ndarray  # (rows, cols) 每个瓦片的平均像素差异
+    changed_tiles: np.ndarray  # (rows, cols) bool，超过瓦片阈值的瓦片
+    fingerprint: object | None = (
+        None  # 瓦片感知哈希（ScreenFingerprint），由去重过滤器填充
+    )
+    payload: ScreenPayload = field(default_factory=ScreenPayload)
+    trace_id: int | None = None  # 延迟追踪 ID，见 src.tracing
+
+    @property
+    def image(self) -> np.ndarray | None:
+        """截图的只读零拷贝视图；帧已被覆盖时为 None。"""
+        return self.ring.view(self.frame)
+
+    @property
+    def changed_count(self) -> int:
+        return int(self.changed_tiles.sum())
+
+    def discard(self):
+        """事件被丢弃时调用，取消尚未开始的编码任务。"""
+        self.payload.cancel()
+
+
+def available_monitors() -> list[int]:
+    """返回所有物理显示器的 mss 编号（0 号为全部屏幕的合并区域，不包含在内）。"""
+    with mss.mss() as sct:
+        return list(range(1, len(sct.monitors)))
+
+
+class FrameBudget:
+    """多个检测器共享的全局截图预算（令牌桶），限制每秒截图与比对总次数。
+
+    检测器数量增加时总开销不变，各显示器分摊同一份帧率。
+    """
+
+    def __init__(self, max_fps: float = 30, burst: int = 4):
+        self.max_fps = max_fps
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取得一帧的额度，额度不足时阻塞等待。"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._last) * self.max_fps
+                )
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.max_fps
+            time.sleep(wait)
+
 
 class ScreenChangeDetector(QObject):
-    significant_change_detected = Signal(float, np.ndarray)
+    significant_change_detected = Signal(object)  # ScreenEvent
     finished = Signal()
 
-    def __init__(self):
+    def __init__(
+        self,
+        monitor_idx: int = 1,
+        threshold: float = 50,
+        budget: FrameBudget | None = None,
+        encoder: ScreenEncoder | None = None,
+        roi_mode: bool = False,
+        roi_thumbnail: bool = True,
+        window_mask: OwnWindowMask | None = None,
+        capture: str = "poll",
+        source=None,
+    ):
         super().__init__()
         self._is_active = False
         self.sct = None
-        self.monitor_idx = 1
+        # 截图来源，默认 mss.mss()；也可传入 src.replay.FrameReplay 回放录制的画面
+        self.source = source
+        self.monitor_idx = monitor_idx
+        self.budget = budget
+        self.encoder = encoder
+        # 本程序自身窗口（Live2D 模型、对话气泡）的位置，比对和发送截图时排除
+        self.window_mask = window_mask
+        # 截图方式："poll" 定时轮询；"damage" 等待 X11 XDamage 重绘通知，只截取重绘区域
+        self.capture = capture
+        self.damage_monitor: XDamageMonitor | None = None
 
         # --- 参数调优 ---
-        self.check_interval = 1 / 30  # 每秒60帧
-        self.resize_width = 1280  # 压缩宽度，越小越忽略细节
-        self.resize_height = 720  # 压缩高度
-        self.threshold = 50  # 触发阈值：平均像素差异超过此值才算变化
+        # 自适应采样：画面静止时逐步降低采样频率，出现活动后立即恢复最高频率
+        self.min_interval = 1 / 30  # 活跃时的采样间隔（每秒30帧）
+        self.max_interval = 0.5  # 静止时的最长采样间隔（每秒2帧）
+        self.backoff = 1.5  # 每次静止采样后，采样间隔乘以此系数
+        self.activity_threshold = 4  # 任一瓦片差异超过此值即视为画面有活动
+        # 稳定判定：触发后连续 settle_frames 帧都没有活动才截取最终图像
+        self.settle_frames = 2
+        self.settle_timeout = 0.4  # 最长等待秒数，超时则直接使用最新一帧
+        # 等待期间反复变化的少量瓦片（闪烁的光标、加载动画）不算活动
+        self.settle_ignore_tiles = 2
+        # 瓦片网格：先降采样到 (grid_cols*tile_size, grid_rows*tile_size)，
+        # 再按 tile_size 切块统计，单帧计算量与显示器分辨率无关
+        self.grid_cols = 16
+        self.grid_rows = 9
+        self.tile_size = 20  # 降采样后每个瓦片的边长（像素）
+        self.threshold = threshold  # 全局阈值：整屏平均像素差异超过此值即触发
+        self.tile_threshold = 60  # 瓦片阈值：瓦片内平均差异超过此值记为“已变化”
+        self.min_changed_tiles = 3  # 变化瓦片数达到此值即触发（如弹出对话框）
+        self.ring_slots = 4  # 帧环槽位数，决定下游最多可同时持有多少张截图
+        # ROI 模式：只把发生变化的区域裁剪后发给 Agent
+        self.roi_mode = roi_mode
+        self.roi_thumbnail = roi_thumbnail  # 同时附带整屏低分辨率缩略图
+        self.roi_merge_tiles = 1  # 间隔不超过此瓦片数的区域合并为一个
+        self.roi_max_regions = 2  # 区域数超过此值时合并为一个外接矩形
+        self.roi_max_fraction = 0.5  # 变化面积超过整屏此比例时直接发送整屏
+        self.roi_padding = 0.5  # 区域四周额外保留的边距（以瓦片为单位）
+
+        self.ring: FrameRing | None = None
+        self.ignore_mask: np.ndarray | None = None  # 降采样图上比对时忽略的像素
+        self._last_own: np.ndarray | None = None
 
+        self.interval = self.min_interval
         self.last_frame = None
         self.last_trigger_time = 0
 
-    def get_processed_frame(self):
-        """获取并预处理屏幕图像"""
+    @property
+    def sample_size(self) -> tuple[int, int]:
+        """降采样后的工作分辨率 (width, height)。"""
+        return self.grid_cols * self.tile_size, self.grid_rows * self.tile_size
+
+    def downsample(
+        self, img: np.ndarray, size: tuple[int, int] | None = None
+    ) -> np.ndarray:
+        """将 BGRA 截图降采样为模糊后的小尺寸灰度图（默认缩放到 sample_size）。
+
+        先按步长抽取像素，使 resize 的输入大小与原始分辨率无关，
+        再在小图上做灰度转换和模糊。
+        """
+        sample_w, sample_h = size or self.sample_size
+        h, w = img.shape[:2]
+        step = max(1, min(w // (sample_w * 2), h // (sample_h * 2)))
+        decimated = img[::step, ::step]
+        small = cv2.resize(
+            decimated, (sample_w, sample_h), interpolation=cv2.INTER_AREA
+        )
+        gray = cv2.cvtColor(small, cv2.COLOR_BGRA2GRAY)
+        return cv2.GaussianBlur(gray, (3, 3), 0)
+
+    def tile_diff(self, prev: np.ndarray, curr: np.ndarray) -> np.ndarray:
+        """计算两帧降采样图像之间每个瓦片的平均差异，返回 (rows, cols) float32。"""
+        diff = cv2.absdiff(prev, curr)
+        if self.ignore_mask is not None:
+            diff[self.ignore_mask] = 0
+        t = self.tile_size
+        return diff.reshape(self.grid_rows, t, self.grid_cols, t).mean(
+            axis=(1, 3), dtype=np.float32
+        )
+
+    def grab(self, region: dict | None = None) -> np.ndarray:
+        """截取屏幕（或其中一块区域），返回直接引用 mss 缓冲区的 BGRA 视图（不复制）。"""
         if self.sct is None:
             raise RuntimeError("mss has not been initialized")
-        screenshot = self.sct.grab(self.sct.monitors[self.monitor_idx])
-        img = np.array(screenshot)
-        gray = cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY)
-        small = cv2.resize(
-            gray,
-            (self.resize_width, self.resize_height),
-            interpolation=cv2.INTER_AREA,
+        if self.budget is not None:
+            self.budget.acquire()
+        shot = self.sct.grab(region or self.sct.monitors[self.monitor_idx])
+        return np.frombuffer(shot.raw, dtype=np.uint8).reshape(
+            shot.height, shot.width, 4
         )
-        blurred = cv2.GaussianBlur(small, (5, 5), 0)
-        return img, blurred
+
+    def get_processed_frame(self):
+        """获取并预处理屏幕图像"""
+        img = self.grab()
+        self.update_ignore_mask(img.shape[:2])
+        return img, self.downsample(img)
+
+    def next_damaged_frame(self) -> np.ndarray | None:
+        """等待 XDamage 重绘通知，只截取重绘区域并拼回上一帧的降采样图。
+
+        超时无重绘、或重绘只发生在自身窗口内时返回 None；
+        重绘面积过大时直接截取整屏。
+        """
+        own_windows = self.window_mask.rects if self.window_mask is not None else None
+        rects = self.damage_monitor.wait(
+            self.max_interval, coalesce=self.min_interval, ignore=own_windows
+        )
+        monitor = self.sct.monitors[self.monitor_idx]
+        mon_w, mon_h = monitor["width"], monitor["height"]
+        own = self.own_window_rects((mon_h, mon_w))
+        boxes = []
+        for x, y, w, h in rects:
+            x, y = x - monitor["left"], y - monitor["top"]
+            left, top = max(0, x), max(0, y)
+            right, bottom = min(mon_w, x + w), min(mon_h, y + h)
+            if right <= left or bottom <= top:
+                continue
+            if any(
+                ox <= left and oy <= top and right <= ox + ow and bottom <= oy + oh
+                for ox, oy, ow, oh in own
+            ):
+                continue
+            boxes.append((left, top, right, bottom))
+        if not boxes:
+            return None
+        left = min(b[0] for b in boxes)
+        top = min(b[1] for b in boxes)
+        right = max(b[2] for b in boxes)
+        bottom = max(b[3] for b in boxes)
+        if (right - left) * (bottom - top) > 0.5 * mon_w * mon_h:
+            return self.get_processed_frame()[1]
+
+        # 对齐到降采样像素网格 [ix0, ix1) x [iy0, iy1)，截图时四周多取一个
+        # 降采样像素作为边距，使模糊结果与整屏降采样一致
+        sample_w, sample_h = self.sample_size
+        sx, sy = sample_w / mon_w, sample_h / mon_h
+        ix0, iy0 = int(left * sx), int(top * sy)
+        ix1 = min(sample_w, math.ceil(right * sx))
+        iy1 = min(sample_h, math.ceil(bottom * sy))
+        x0, y0 = max(0, ix0 - 1), max(0, iy0 - 1)
+        x1, y1 = min(sample_w, ix1 + 1), min(sample_h, iy1 + 1)
+        px0, py0 = int(x0 / sx), int(y0 / sy)
+        px1, py1 = min(mon_w, math.ceil(x1 / sx)), min(mon_h, math.ceil(y1 / sy))
+        patch = self.grab(
+            {
+                "left": monitor["left"] + px0,
+                "top": monitor["top"] + py0,
+                "width": px1 - px0,
+                "height": py1 - py0,
+            }
+        )
+        self.update_ignore_mask((mon_h, mon_w))
+        small = self.downsample(patch, (x1 - x0, y1 - y0))
+        frame = self.last_frame.copy()
+        frame[iy0:iy1, ix0:ix1] = small[iy0 - y0 : iy1 - y0, ix0 - x0 : ix1 - x0]
+        return frame
+
+    def own_window_rects(self, frame_shape: tuple[int, int]) -> list[Rect]:
+        """自身窗口在当前显示器截图中的矩形（已裁剪到截图范围内）。"""
+        if self.window_mask is None or self.sct is None:
+            return []
+        monitor = self.sct.monitors[self.monitor_idx]
+        h, w = frame_shape
+        rects = []
+        for x, y, rw, rh in self.window_mask.rects():
+            left = max(0, x - monitor["left"])
+            top = max(0, y - monitor["top"])
+            right = min(w, x - monitor["left"] + rw)
+            bottom = min(h, y - monitor["top"] + rh)
+            if right > left and bottom > top:
+                rects.append((left, top, right - left, bottom - top))
+        return rects
+
+    def update_ignore_mask(self, frame_shape: tuple[int, int]):
+        """比对时忽略本帧与上一帧中自身窗口覆盖区域的并集。
+
+        窗口被拖动或隐藏时，旧位置露出的背景同样不应计入变化。
+        """
+        own = None
+        rects = self.own_window_rects(frame_shape)
+        if rects:
+            sample_w, sample_h = self.sample_size
+            h, w = frame_shape
+            sx, sy = sample_w / w, sample_h / h
+            own = np.zeros((sample_h, sample_w), dtype=bool)
+            for x, y, rw, rh in rects:
+                own[
+                    int(y * sy) : math.ceil((y + rh) * sy),
+                    int(x * sx) : math.ceil((x + rw) * sx),
+                ] = True
+        if own is None or self._last_own is None:
+            self.ignore_mask = own if own is not None else self._last_own
+        else:
+            self.ignore_mask = own | self._last_own
+        self._last_own = own
+
+    def mask_own_windows(self, img: np.ndarray):
+        """在截图中原地涂黑自身窗口，避免 Agent 看到自己的模型和气泡。
+
+        img 是 mss 每次截图新分配的缓冲区，可以直接修改。
+        """
+        for x, y, w, h in self.own_window_rects(img.shape[:2]):
+            img[y : y + h, x : x + w] = 0
+
+    def find_regions(
+        self, prev: np.ndarray, curr: np.ndarray, frame_shape: tuple[int, int]
+    ) -> list[tuple[int, int, int, int]]:
+        """由两帧降采样图的瓦片差异求出变化区域，返回原图坐标 (x, y, w, h) 列表。
+
+        相邻的变化瓦片经膨胀后连通即合并；变化面积过大时返回空列表，表示发送整屏。
+        """
+        mask = (self.tile_diff(prev, curr) > self.activity_threshold).astype(np.uint8)
+        if not mask.any():
+            return []
+        k = 2 * self.roi_merge_tiles + 1
+        merged = cv2.dilate(mask, np.ones((k, k), np.uint8))
+        n, labels = cv2.connectedComponents(merged, connectivity=8)
+        boxes = []
+        for label in range(1, n):
+            ys, xs = np.nonzero((labels == label) & (mask > 0))
+            boxes.append((xs.min(), ys.min(), xs.max() + 1, ys.max() + 1))
+        if len(boxes) > self.roi_max_regions:
+            x0s, y0s, x1s, y1s = zip(*boxes)
+            boxes = [(min(x0s), min(y0s), max(x1s), max(y1s))]
+        area = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in boxes)
+        if area > self.roi_max_fraction * self.grid_rows * self.grid_cols:
+            return []
+
+        h, w = frame_shape
+        tile_w, tile_h = w / self.grid_cols, h / self.grid_rows
+        pad = self.roi_padding
+        regions = []
+        for x0, y0, x1, y1 in boxes:
+            left = max(0, int((x0 - pad) * tile_w))
+            top = max(0, int((y0 - pad) * tile_h))
+            right = min(w, int((x1 + pad) * tile_w))
+            bottom = min(h, int((y1 + pad) * tile_h))
+            regions.append((left, top, right - left, bottom - top))
+        return regions
+
+    def prepare_payload(self, img: np.ndarray, small: np.ndarray) -> ScreenPayload:
+        """确定要发送的区域，并在配置了编码器时立即提交编码。"""
+        self.mask_own_windows(img)
+        payload = ScreenPayload(with_thumbnail=self.roi_thumbnail)
+        if self.roi_mode:
+            payload.regions = self.find_regions(self.last_frame, small, img.shape[:2])
+        if self.encoder is not None:
+            payload.submit(img, self.encoder)
+        return payload
+
+    def wait_until_settled(self):
+        """以最高频率连续采样，直到画面不再变化。
+
+        画面第一次保持不变时即准备该帧的发送内容并提交编码，后续帧确认稳定
+        期间编码已在进行；画面再次变化则取消并等待下一个候选帧。
+        只在此前已变化过的至多 settle_ignore_tiles 个瓦片内的活动视为周期性
+        的小动画，不打断稳定判定。返回 (原图, 降采样图, ScreenPayload)。
+        """
+        img, prev = self.get_processed_frame()
+        candidate = None
+        stable = 0
+        seen = np.zeros((self.grid_rows, self.grid_cols), dtype=bool)
+        deadline = time.monotonic() + self.settle_timeout
+        while (
+            self._is_active
+            and stable < self.settle_frames
+            and time.monotonic() < deadline
+        ):
+            QThread.msleep(int(self.min_interval * 1000))
+            img, curr = self.get_processed_frame()
+            active = self.tile_diff(prev, curr) >= self.activity_threshold
+            repeating = not (active & ~seen).any()
+            seen |= active
+            if repeating and active.sum() <= self.settle_ignore_tiles:
+                stable += 1
+                if candidate is None:
+                    candidate = (img, curr, self.prepare_payload(img, curr))
+            else:
+                stable = 0
+                if candidate is not None:
+                    candidate[2].cancel()
+                    candidate = None
+            prev = curr
+        if candidate is not None:
+            return candidate
+        return img, prev, self.prepare_payload(img, prev)
+
+    def publish(self, img: np.ndarray) -> FrameRef:
+        """将截图写入共享内存帧环，分辨率变化时重建帧环。"""
+        if self.ring is None or self.ring.shape != img.shape[:2]:
+            if self.ring is not None:
+                self.ring.unlink()
+            h, w = img.shape[:2]
+            self.ring = FrameRing(w, h, self.ring_slots)
+        return self.ring.write(img)
 
     @Slot()
     def start_detecting(self):
         self._is_active = True
-        self.sct = mss.mss()
+        self.sct = self.source if self.source is not None else mss.mss()
+
+        if self.capture == "damage" and self.source is None:
+            self.damage_monitor = XDamageMonitor.create()
+            if self.damage_monitor is None:
+                print(f"[屏幕 {self.monitor_idx}] XDamage 不可用，回退到轮询截图")
+            else:
+                print(
+                    f"[屏幕 {self.monitor_idx}] 使用实验性的 XDamage 事件驱动截图，"
+                    "检测异常时请改回 --screen-capture poll"
+                )
 
         # 初始化第一帧
         _, self.last_frame = self.get_processed_frame()
 
         while self._is_active:
-            QThread.msleep(int(self.check_interval * 1000))
+            if self.damage_monitor is not None:
+                # 事件驱动：没有重绘就不截图
+                current_frame = self.next_damaged_frame()
+                if current_frame is None:
+                    continue
+            else:
+                QThread.msleep(int(self.interval * 1000))
 
-            # # 冷却期检查
-            # if time.time() - self.last_trigger_time < self.cooldown:
-            #     continue
-            original_img, current_frame = self.get_processed_frame()
-            diff = cv2.absdiff(self.last_frame, current_frame)
-            score = np.mean(diff)
+                # # 冷却期检查
+                # if time.time() - self.last_trigger_time < self.cooldown:
+                #     continue
+                _, current_frame = self.get_processed_frame()
+            tile_scores = self.tile_diff(self.last_frame, current_frame)
+            score = float(tile_scores.mean())
+            changed = tile_scores > self.tile_threshold
 
             # print(f"当前屏幕变化率: {score:.2f}")  # 调试用
 
-            if score > self.threshold:
-                print(f"检测到显著变化！Score: {score:.2f}")
+            if score > self.threshold or changed.sum() >= self.min_changed_tiles:
+                print(
+                    f"检测到显著变化！[屏幕 {self.monitor_idx}] Score: {score:.2f}, "
+                    f"变化瓦片: {int(changed.sum())}"
+                )
                 self.last_trigger_time = time.time()
-                # 延迟 0.3s 再截取最终图像，等待画面稳定
-                QThread.msleep(300)
-                final_img, current_frame = self.get_processed_frame()
-                self.significant_change_detected.emit(score, final_img)
-                self.last_frame = current_frame
+                trace_id = tracer.begin("screen")
+                # 等待画面稳定（动画、渲染完成）再截取最终图像
+                final_img, current_frame, payload = self.wait_until_settled()
+                tracer.mark(trace_id, "settled")
+                payload.trace(trace_id)
+                frame = self.publish(final_img)
+                self.significant_change_detected.emit(
+                    ScreenEvent(
+                        score=score,
+                        frame=frame,
+                        ring=self.ring,
+                        monitor=self.monitor_idx,
+                        tile_scores=tile_scores,
+                        changed_tiles=changed,
+                        payload=payload,
+                        trace_id=trace_id,
+                    )
+                )
+                self.interval = self.min_interval
+            elif tile_scores.max() > self.activity_threshold:
+                self.interval = self.min_interval
             else:
-                self.last_frame = current_frame
+                self.interval = min(self.interval * self.backoff, self.max_interval)
+            self.last_frame = current_frame
 
         if self.sct is not None:
             self.sct.close()
             self.sct = None
+        if self.damage_monitor is not None:
+            self.damage_monitor.close()
+            self.damage_monitor = None
+        if self.ring is not None:
+            self.ring.unlink()
 
         self.finished.emit()
 
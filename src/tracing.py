@@ -0,0 +1,183 @@
+"""端到端延迟追踪：为每句语音 / 每次屏幕变化分配追踪 ID，记录各阶段时间戳。
+
+事件以 (追踪 ID, 阶段, 时间) 元组写入固定容量的内存环形缓冲区，写入只是一次
+deque.append，可以在音频回调等热路径中调用；统计和导出在读取时才计算。
+
+语音: start（VAD 判定语句结束）→ asr_start → asr_end → accepted → dispatched
+      → llm_start → llm_first_token → llm_last_token → bubble_shown
+屏幕: start（检测到显著变化）→ settled → encoded → accepted → dispatched
+      → llm_start → ...
+丢弃的请求记录 dropped:<原因> 阶段，直接用缓存回复的记录 cache_hit 阶段。
+"""
+
+import itertools
+import json
+import os
+import statistics
+import threading
+import time
+from collections import deque
+
+
+class Tracer:
+    """线程安全的追踪事件环形缓冲区。
+
+    时间使用 time.perf_counter()；每条追踪的各阶段耗时以该追踪的 start 为零点。
+    """
+
+    def __init__(self, capacity: int = 20000) -> None:
+        self.capacity = capacity
+        # deque.append 在 CPython 中是原子操作，写入不需要加锁
+        self._events: deque[tuple[int, str, float]] = deque(maxlen=capacity)
+        self._kinds: dict[int, str] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def reserve(self) -> int:
+        """预先分配一个追踪 ID，稍后以 begin(kind, trace_id=...) 开始追踪。
+
+        用于在开始计时前就需要标识的对象，例如还没说完的一句话。
+        """
+        with self._lock:
+            return next(self._ids)
+
+    def begin(
+        self, kind: str, t: float | None = None, trace_id: int | None = None
+    ) -> int:
+        """开始一条新追踪，返回追踪 ID。kind 为 "voice" 或 "screen"。
+
+        trace_id 为 reserve() 预先分配的 ID，None 时分配新 ID。
+        """
+        with self._lock:
+            if trace_id is None:
+                trace_id = next(self._ids)
+            self._kinds[trace_id] = kind
+            # 只保留与缓冲区容量相当的 kind 记录
+            if len(self._kinds) > self.capacity:
+                del self._kinds[next(iter(self._kinds))]
+        self._events.append(
+            (trace_id, "start", time.perf_counter() if t is None else t)
+        )
+        return trace_id
+
+    def mark(self, trace_id: int | None, stage: str, t: float | None = None):
+        """记录追踪到达某个阶段；trace_id 为 None 时忽略。"""
+        if trace_id is not None:
+            self._events.append(
+                (trace_id, stage, time.perf_counter() if t is None else t)
+            )
+
+    def clear(self):
+        with self._lock:
+            self._events.clear()
+            self._kinds.clear()
+
+    # ── 读取 ──
+
+    def traces(self) -> dict[int, dict]:
+        """按追踪 ID 汇总：{id: {"kind", "start", "stages": {阶段: 相对毫秒}}}。
+
+        同一阶段出现多次时保留第一次；start 已被环形缓冲区覆盖的追踪不返回。
+        """
+        events = list(self._events)
+        with self._lock:
+            kinds = dict(self._kinds)
+        result: dict[int, dict] = {}
+        for trace_id, stage, t in events:
+            if stage == "start":
+                result[trace_id] = {
+                    "kind": kinds.get(trace_id, "unknown"),
+                    "start": t,
+                    "stages": {},
+                }
+        for trace_id, stage, t in events:
+            trace = result.get(trace_id)
+            if trace is not None and stage != "start":
+                trace["stages"].setdefault(stage, (t - trace["start"]) * 1000)
+        return result
+
+    def summary(self) -> dict[str, dict[str, dict[str, float]]]:
+        """每类追踪各阶段相对 start 的耗时分布：{kind: {阶段: {count, p50, p90, p99}}}（毫秒）。"""
+        samples: dict[str, dict[str, list[float]]] = {}
+        for trace in self.traces().values():
+            stages = samples.setdefault(trace["kind"], {})
+            for stage, ms in trace["stages"].items():
+                stages.setdefault(stage, []).append(ms)
+        result = {}
+        for kind, stages in samples.items():
+            ordered = sorted(
+                stages.items(), key=lambda item: statistics.median(item[1])
+            )
+            result[kind] = {
+                stage: {
+                    "count": len(values),
+                    "p50": _percentile(values, 50),
+                    "p90": _percentile(values, 90),
+                    "p99": _percentile(values, 99),
+                }
+                for stage, values in ordered
+            }
+        return result
+
+    def describe(self) -> str:
+        lines = []
+        for kind, stages in self.summary().items():
+            lines.append(f"[Trace] {kind}（相对开始时间，毫秒）:")
+            for stage, s in stages.items():
+                lines.append(
+                    f"  {stage:<20} n={s['count']:<5} p50 {s['p50']:8.1f}  "
+                    f"p90 {s['p90']:8.1f}  p99 {s['p99']:8.1f}"
+                )
+        return "\n".join(lines) or "[Trace] 没有追踪记录"
+
+    # ── 导出 ──
+
+    def export_json(self, path: str):
+        """导出每条追踪的阶段耗时和汇总统计。"""
+        data = {
+            "traces": {str(k): v for k, v in self.traces().items()},
+            "summary": self.summary(),
+        }
+        _write_json(path, data)
+
+    def export_chrome_trace(self, path: str):
+        """导出 Chrome Trace Event 格式，可在 chrome://tracing 或 Perfetto 中打开。
+
+        每条追踪占一行（tid = 追踪 ID），相邻两个阶段之间画成一个区间。
+        """
+        events = []
+        for trace_id, trace in sorted(self.traces().items()):
+            base = trace["start"] * 1e6
+            stages = sorted(trace["stages"].items(), key=lambda item: item[1])
+            prev_name, prev_us = "start", 0.0
+            for stage, ms in stages:
+                us = ms * 1000
+                events.append(
+                    {
+                        "name": f"{prev_name} → {stage}",
+                        "cat": trace["kind"],
+                        "ph": "X",
+                        "ts": base + prev_us,
+                        "dur": us - prev_us,
+                        "pid": trace["kind"],
+                        "tid": trace_id,
+                    }
+                )
+                prev_name, prev_us = stage, us
+        _write_json(path, {"traceEvents": events, "displayTimeUnit": "ms"})
+
+
+def _percentile(values: list[float], q: int) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def _write_json(path: str, data: dict):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+
+
+# 进程内共享的追踪器
+tracer = Tracer()
@@ -1,83 +1,664 @@
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
 import numpy as np
 import torch
-from PySide6.QtCore import QObject, Signal, Slot
-from transformers import AutoModel, AutoProcessor
+from PySide6.QtCore import QObject, Qt, QTimer, Signal, Slot
+from transformers import (
+    AutoModel,
+    AutoProcessor,
+    StoppingCriteria,
+    StoppingCriteriaList,
+)
+
+from src.tracing import tracer
+
+REPO_ID = "zai-org/GLM-ASR-Nano-2512"
+PROMPT = "Please transcribe this audio into text"
+
+# 推理配置 -> (权重精度, Linear 层动态 int8 量化, torch.compile)
+# auto 在有 CUDA 时为 bf16，否则为 fp32：多数 CPU 没有原生 bf16 指令，bf16 反而更慢
+PROFILES = {
+    "bf16": (torch.bfloat16, False, False),
+    "fp32": (torch.float32, False, False),
+    "int8": (torch.float32, True, False),
+    "compile": (torch.float32, False, True),
+    "int8-compile": (torch.float32, True, True),
+}
 
 
 class TranscribeWorker(QObject):
-    """接收 VAD 检测到的完整语句音频，使用 GLM-ASR 进行语音识别"""
+    """接收 VAD 检测到的完整语句音频，使用 GLM-ASR 进行语音识别
+
+    语句先进入有上限的队列（on_sentence_audio 以 DirectConnection 在 VAD 线程中
+    调用），识别线程每次取出至多 max_batch 句，用一次填充后的 generate 批量识别；
+    队列溢出时丢弃最旧的语句，排队超过 max_wait 秒的语句视为过时直接丢弃。
+
+    流式模式（连接 VAD 的 speech_chunk 到 on_speech_chunk）下，说话期间对滚动窗口
+    做临时识别并发出 partial_ready；窗口过长时在停顿处切分，提交前半段的识别结果，
+    语音结束后只需识别未提交的尾部，识别延迟不再随句子长度增长。
 
-    transcription_ready = Signal(str)  # 识别完成后发出文本
+    推测模式（连接 VAD 的 speech_paused / speech_resumed）下，用户短暂停顿时立即
+    识别已录到的整句；VAD 确认语句结束后直接提交推测结果，省去确认静音之后的识别
+    时间；用户接着说话则中止并作废这次推测。
 
-    def __init__(self, sample_rate=16000):
+    profile 选择推理配置（见 PROFILES），threads 设置 torch 的 CPU 线程数；
+    各配置的速度与准确率可用 benchmarks/asr_profiles.py 比较。
+    """
+
+    transcription_ready = Signal(int, str)  # 识别完成后发出 (追踪 ID, 文本)
+    partial_ready = Signal(str)  # 流式模式下说话期间的临时识别结果
+    _wake = Signal()  # 队列中有新语句，通知识别线程
+
+    def __init__(self, sample_rate=16000, profile="auto", threads=None):
         super().__init__()
         self.sample_rate = sample_rate
+        # --- 识别队列 ---
+        self.max_queue = 4  # 最多排队的语句数，溢出时丢弃最旧的
+        self.max_wait = 8.0  # 排队超过此秒数的语句已失去意义，直接丢弃
+        self.max_batch = 4  # 一次 generate 最多识别的语句数
+        self.queue_stats = AsrQueueStats()
+        self._queue: deque[_Utterance] = deque()
+        self._queue_lock = threading.Lock()
+        self._dropped: list[
+            tuple[int, str]
+        ] = []  # 待识别线程记录的 (追踪 ID, 丢弃原因)
+        self._wake_pending = False
+        self._wake.connect(self._drain_batch, Qt.ConnectionType.QueuedConnection)
+        # --- 流式识别参数 ---
+        self.partial_interval = 0.8  # 新增音频达到此时长（秒）才做一次临时识别
+        self.commit_seconds = 4.0  # 未提交的音频超过此时长即切分提交一段
+        self.commit_search = 1.0  # 在窗口末尾这么长（秒）的范围内找停顿作为切分点
+        self._stream: _StreamState | None = None
+        self._partial_scheduled = False
+        self._last_segments = 0
+        # --- 推测识别 ---
+        # 命中后再整句识别一次并比较结果，用于评估推测的准确性（会增加 CPU 开销）
+        self.verify_speculation = False
+        self.speculation = SpeculationStats()
+        self._speculation: _Speculation | None = None
+        self._resumed_id = 0  # 已恢复说话的最大推测 ID，由 VAD 线程写入
+        # --- 提示词预处理 ---
+        # 使用启动时渲染好的提示词模板（与逐句渲染的结果不一致时自动退回）
+        self.fast_prompt = True
+        self._prompt: str | None = None
+        # int16 -> float32 转换复用的缓冲区，初始可容纳 30 秒
+        self._float_buffer = np.empty(30 * sample_rate, dtype=np.float32)
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        if profile == "auto":
+            profile = "bf16" if self.device == "cuda" else "fp32"
+        if profile not in PROFILES:
+            raise ValueError(f"不支持的 ASR 推理配置: {profile}")
+        self.profile = profile
+        self.dtype, quantize, compile_model = PROFILES[profile]
+        if quantize and self.device != "cpu":
+            # 动态量化的算子只有 CPU 实现
+            print("[ASR] int8 动态量化只支持 CPU，改为在 CPU 上推理")
+            self.device = "cpu"
+        if threads:
+            # 进程级设置，同时影响同进程中其他使用 torch 的模块（如 VAD）
+            torch.set_num_threads(threads)
+
+        self.processor, self.model = self._load_model()
+        if quantize:
+            self.model = torch.ao.quantization.quantize_dynamic(
+                self.model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        if compile_model:
+            # 音频长度各不相同，按动态形状编译；首次识别时才真正编译，会明显变慢
+            self.model.forward = torch.compile(self.model.forward, dynamic=True)
+        print(
+            f"[ASR] 推理配置 {profile} @ {self.device}, "
+            f"{torch.get_num_threads()} 个 CPU 线程"
+        )
+        # 批量识别时在左侧填充，各句生成的 token 在右侧对齐
+        self.processor.tokenizer.padding_side = "left"
+        self._prepare_prompt()
 
-        repo_id = "zai-org/GLM-ASR-Nano-2512"
+    def _load_model(self):
+        options = {"dtype": self.dtype, "device_map": self.device}
         try:
             # 优先尝试加载本地缓存，避免每次都联网检查导致警告
             print("[ASR] 尝试加载本地缓存模型...")
-            self.processor = AutoProcessor.from_pretrained(
-                repo_id, local_files_only=True
-            )
-            self.model = AutoModel.from_pretrained(
-                repo_id,
-                dtype=torch.bfloat16,
-                device_map=self.device,
-                local_files_only=True,
-            )
+            processor = AutoProcessor.from_pretrained(REPO_ID, local_files_only=True)
+            model = AutoModel.from_pretrained(REPO_ID, local_files_only=True, **options)
             print("[ASR] 本地模型加载成功")
         except Exception:
             # 本地没有缓存时，联网下载
             print("[ASR] 本地无缓存，开始联网下载模型（这可能需要一些时间）...")
-            self.processor = AutoProcessor.from_pretrained(repo_id)
-            self.model = AutoModel.from_pretrained(
-                repo_id, dtype=torch.bfloat16, device_map=self.device
-            )
+            processor = AutoProcessor.from_pretrained(REPO_ID)
+            model = AutoModel.from_pretrained(REPO_ID, **options)
             print("[ASR] 模型下载并加载成功")
+        return processor, model
+
+    def on_sentence_audio(self, trace_id: int, audio_data: np.ndarray):
+        """把一句话的完整 int16 音频放入识别队列（线程安全，不做识别）。
+
+        应以 DirectConnection 连接 VAD 的 sentence_ready，使排队发生在 VAD 线程，
+        识别跟不上时积压的是这里有上限的队列，而不是无上限的 Qt 事件队列。
+        """
+        with self._queue_lock:
+            if len(self._queue) >= self.max_queue:
+                self._drop(self._queue.popleft(), "overflow")
+            self._queue.append(_Utterance(trace_id, audio_data, time.monotonic()))
+            stats = self.queue_stats
+            stats.max_depth = max(stats.max_depth, len(self._queue))
+        self._schedule()
+
+    @Slot()
+    def drain(self):
+        """在当前线程识别队列中的全部语句（基准测试等没有事件循环的场合使用）。"""
+        while self._drain_batch():
+            pass
+
+    def _schedule(self):
+        with self._queue_lock:
+            if self._wake_pending or not self._queue:
+                return
+            self._wake_pending = True
+        self._wake.emit()
+
+    @Slot()
+    def _drain_batch(self) -> bool:
+        """取出至多 max_batch 句识别，还有剩余时重新排入事件队列；返回是否识别了语句。
+
+        每次只处理一批，使这期间到达的流式音频段先于后续语句被处理。
+        """
+        batch = []
+        with self._queue_lock:
+            self._wake_pending = False
+            now = time.monotonic()
+            while self._queue and len(batch) < self.max_batch:
+                item = self._queue.popleft()
+                if now - item.enqueued_at > self.max_wait:
+                    self._drop(item, "stale")
+                else:
+                    batch.append(item)
+            dropped, self._dropped = self._dropped, []
+        for trace_id, reason in dropped:
+            tracer.mark(trace_id, f"dropped:{reason}")
+            print(f"[ASR] 丢弃排队中的语音 #{trace_id} ({reason})")
+        if batch:
+            try:
+                self._transcribe_items(batch)
+            except Exception as e:
+                print(f"[ASR Error] {e}")
+        self._schedule()
+        return bool(batch)
+
+    def _drop(self, item: "_Utterance", reason: str):
+        """丢弃排队中的语句（调用方持有队列锁）。
+
+        可能在 PortAudio 回调中调用，这里只计数；追踪标记和日志留给识别线程。
+        """
+        self.queue_stats.drop(reason)
+        self._dropped.append((item.trace_id, reason))
+
+    def _transcribe_items(self, batch: list["_Utterance"]):
+        """识别一批语句并按到达顺序发出结果。
+
+        与推测结果或流式状态对应的语句走快速路径，其余的合并成一次批量识别。
+        """
+        start = time.perf_counter()
+        texts: dict[int, str] = {}
+        modes: dict[int, str] = {}
+        verify = []
+        pending = []
+        for item in batch:
+            tracer.mark(item.trace_id, "asr_start")
+            speculation = self._take_speculation(item.trace_id, len(item.audio))
+            if speculation is not None:
+                # 推测时的音频与整句只差结尾的静音，直接使用推测结果
+                texts[item.trace_id] = speculation.text
+                # 不推测时识别从入队才开始；推测只比它提前了开始时刻到入队的这段
+                # 间隔（约为确认静音与推测静音之差），且不超过识别本身的耗时
+                saved = min(
+                    speculation.seconds, item.enqueued_at - speculation.started_at
+                )
+                saved = max(0.0, saved)
+                self.speculation.committed += 1
+                self.speculation.saved_seconds += saved
+                tracer.mark(item.trace_id, "speculation_hit")
+                modes[item.trace_id] = f"推测命中，省下 {saved * 1000:.0f} ms"
+                if self.verify_speculation:
+                    verify.append(item)
+            elif self._stream is not None and self._stream.trace_id == item.trace_id:
+                texts[item.trace_id] = self._finish_stream(item.audio)
+                modes[item.trace_id] = f"流式，提交 {self._last_segments} 段"
+            else:
+                pending.append(item)
+        if self._stream is not None and any(
+            self._stream.trace_id == item.trace_id for item in batch
+        ):
+            self._stream = None
+        if pending:
+            results = self.transcribe_batch([item.audio for item in pending])
+            for item, text in zip(pending, results):
+                texts[item.trace_id] = text
+                modes[item.trace_id] = (
+                    f"批量 {len(pending)} 句" if len(pending) > 1 else "整句"
+                )
 
-    @Slot(np.ndarray)
-    def on_sentence_audio(self, audio_data: np.ndarray):
-        """接收 int16 音频数据并进行语音识别"""
+        done = time.monotonic()
+        stats = self.queue_stats
+        stats.batches += 1
+        stats.decode_seconds += time.perf_counter() - start
+        for item in batch:
+            text = texts[item.trace_id]
+            tracer.mark(item.trace_id, "asr_end")
+            # 入队即语音结束的时刻，等待时间包含排队和识别
+            wait = done - item.enqueued_at
+            stats.utterances += 1
+            stats.audio_seconds += len(item.audio) / self.sample_rate
+            stats.wait_total += wait
+            stats.wait_max = max(stats.wait_max, wait)
+            print(
+                f"[ASR] 语音结束后 {wait * 1000:.0f} ms 完成识别 "
+                f"({modes[item.trace_id]})"
+            )
+            if text:
+                print(f"[ASR] {text}")
+                self.transcription_ready.emit(item.trace_id, text)
+            else:
+                tracer.mark(item.trace_id, "dropped:empty")
+        if len(batch) > 1 or stats.dropped:
+            print(f"[ASR] {stats.describe()}")
+        for item in verify:
+            self._verify(item.audio, texts[item.trace_id])
+
+    @Slot(int, int, np.ndarray)
+    def on_speech_paused(
+        self, trace_id: int, speculation_id: int, audio_data: np.ndarray
+    ):
+        """推测识别：用户短暂停顿时立即识别已录到的音频，结果留待语句结束时提交。"""
+        self._take_speculation()  # 上一次推测若已作废，计入统计
+        if speculation_id <= self._resumed_id:
+            return  # 排队期间用户已经接着说了
+        self.speculation.started += 1
+        started_at = time.monotonic()
+        start = time.perf_counter()
         try:
-            # int16 -> float32 归一化
-            audio_float = audio_data.astype(np.float32) / 32768.0
-
-            messages = [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "audio",
-                            "audio": audio_float,
-                            "sampling_rate": self.sample_rate,
-                        },
-                        {
-                            "type": "text",
-                            "text": "Please transcribe this audio into text",
-                        },
-                    ],
-                }
-            ]
+            text = self._decode(
+                trace_id,
+                audio_data,
+                cancelled=lambda: speculation_id <= self._resumed_id,
+            )
+        except Exception as e:
+            print(f"[ASR Error] {e}")
+            return
+        self._speculation = _Speculation(
+            trace_id,
+            speculation_id,
+            len(audio_data),
+            text,
+            time.perf_counter() - start,
+            started_at,
+        )
+
+    def cancel_speculation(self, speculation_id: int):
+        """用户恢复说话，作废对应的推测。
+
+        需要以 DirectConnection 连接，在 VAD 线程中直接调用：只写入一个整数，
+        正在进行的识别会在下一个 token 时停止。
+        """
+        self._resumed_id = max(self._resumed_id, speculation_id)
+
+    @Slot(int, np.ndarray)
+    def on_speech_chunk(self, trace_id: int, audio_data: np.ndarray):
+        """流式模式：接收说话期间的一段新音频，按滚动窗口识别出临时结果。"""
+        if self._stream is None or self._stream.trace_id != trace_id:
+            # 新的一句话；上一句若未能走流式路径，会在队列中整句识别
+            self._stream = _StreamState(trace_id)
+        self._stream.chunks.append(audio_data)
+        # 解码跟不上时，排队中的音频段先合并，只对最新的音频解码一次
+        if not self._partial_scheduled:
+            self._partial_scheduled = True
+            QTimer.singleShot(0, self._decode_partial)
+
+    def transcribe(self, audio_data: np.ndarray, cancelled=None) -> str:
+        """识别一段 int16 音频，返回文本。
 
+        cancelled 为可选的无参函数，返回 True 时提前结束生成（结果不完整）。
+        """
+        return self.transcribe_batch([audio_data], cancelled)[0]
+
+    def transcribe_batch(self, audios: list[np.ndarray], cancelled=None) -> list[str]:
+        """用一次 generate 识别多段 int16 音频，返回各自的文本。"""
+        inputs = self._prepare_inputs(audios)
+        options = {}
+        if cancelled is not None:
+            options["stopping_criteria"] = StoppingCriteriaList([_Cancelled(cancelled)])
+        outputs = self.model.generate(
+            **inputs, max_new_tokens=128, do_sample=False, **options
+        )
+        texts = self.processor.batch_decode(
+            outputs[:, inputs.input_ids.shape[1] :], skip_special_tokens=True
+        )
+        return [text.strip() for text in texts]
+
+    def _prepare_inputs(self, audios: list[np.ndarray]):
+        """把 int16 音频转成模型输入：提示词 token、音频特征与注意力掩码。"""
+        audios = self._to_float(audios)
+        if self.fast_prompt and self._prompt is not None:
+            # 跳过逐句构造消息和渲染模板，直接交给处理器分词并提取特征
+            inputs = self.processor(
+                text=[self._prompt] * len(audios),
+                audio=audios,
+                sampling_rate=self.sample_rate,
+                return_tensors="pt",
+                padding=True,
+            )
+        else:
             inputs = self.processor.apply_chat_template(
-                messages,
+                [_conversation(audio, self.sample_rate) for audio in audios],
                 tokenize=True,
                 add_generation_prompt=True,
                 return_dict=True,
                 return_tensors="pt",
+                padding=True,
             )
-            inputs = inputs.to(self.device, dtype=torch.bfloat16)
+        return inputs.to(self.device, dtype=self.dtype)
 
-            outputs = self.model.generate(**inputs, max_new_tokens=128, do_sample=False)
-            text = self.processor.batch_decode(
-                outputs[:, inputs.input_ids.shape[1] :], skip_special_tokens=True
-            )[0].strip()
+    def _to_float(self, audios: list[np.ndarray]) -> list[np.ndarray]:
+        """int16 -> float32 归一化，写入复用的缓冲区，返回各段的视图。
 
-            if text:
-                print(f"[ASR] {text}")
-                self.transcription_ready.emit(text)
+        视图在下一次调用时会被覆盖；识别都在 ASR 线程中串行进行，处理器
+        提取完特征后不再引用它们。
+        """
+        total = sum(len(audio) for audio in audios)
+        if total > len(self._float_buffer):
+            self._float_buffer = np.empty(
+                max(total, 2 * len(self._float_buffer)), dtype=np.float32
+            )
+        views, offset = [], 0
+        for audio in audios:
+            view = self._float_buffer[offset : offset + len(audio)]
+            np.multiply(audio, 1 / 32768.0, out=view)
+            views.append(view)
+            offset += len(audio)
+        return views
+
+    def _prepare_prompt(self):
+        """启动时渲染一次提示词模板，与逐句渲染的结果核对，不一致或出错时退回。
+
+        不缓存前缀的 KV：音频在 PROMPT 之前，音频之前的固定部分只有对话头的
+        几个 token，每句拷贝一份缓存的开销比重新计算它们还大。
+        """
+        # 两段不同长度的类语音信号，确认提示词与音频长度无关
+        probes = [_voiced_probe(seconds, self.sample_rate) for seconds in (1, 2)]
+        try:
+            prompt = self.processor.apply_chat_template(
+                [_conversation(probes[0], self.sample_rate)],
+                tokenize=False,
+                add_generation_prompt=True,
+            )
+            self._prompt = prompt[0] if isinstance(prompt, list) else prompt
+            fast = [self._prepare_inputs([probe]) for probe in probes]
+            self.fast_prompt = False
+            slow = [self._prepare_inputs([probe]) for probe in probes]
+            for f, s in zip(fast, slow):
+                # 除 input_ids 外，音频特征、注意力掩码等也必须逐项一致
+                if f.keys() != s.keys():
+                    raise ValueError(f"输入字段不一致: {sorted(f)} / {sorted(s)}")
+                for key in f:
+                    if not _same_value(f[key], s[key]):
+                        raise ValueError(f"{key} 与逐句渲染的结果不一致")
+        except Exception as e:
+            print(f"[ASR] 不使用预渲染的提示词模板: {e}")
+            self._prompt = None
+        finally:
+            self.fast_prompt = True
+
+    # ── 推测识别 ──
+
+    def _decode(self, trace_id: int, audio_data: np.ndarray, cancelled=None) -> str:
+        """识别到目前为止的整句；流式模式下复用已提交的段落，只识别尾部。"""
+        stream = self._stream
+        if stream is None or stream.trace_id != trace_id:
+            return self.transcribe(audio_data, cancelled)
+        self._commit_segments(stream, audio_data)
+        tail = self.transcribe(audio_data[stream.offset :], cancelled)
+        return _join(stream.committed, tail)
+
+    def _take_speculation(
+        self, trace_id: int | None = None, samples: int = 0
+    ) -> "_Speculation | None":
+        """取出与 trace_id 这句话对应且仍然有效的推测结果。
+
+        trace_id 为 None 表示推测被新的停顿取代；其他语句的推测原样保留，
+        已作废的推测计入统计并丢弃。
+        """
+        speculation = self._speculation
+        if speculation is None:
+            return None
+        if trace_id is not None and speculation.trace_id != trace_id:
+            return None
+        self._speculation = None
+        if (
+            trace_id is not None
+            and speculation.id > self._resumed_id
+            and speculation.samples <= samples
+        ):
+            return speculation
+        self.speculation.cancelled += 1
+        self.speculation.wasted_seconds += speculation.seconds
+        return None
 
+    def _verify(self, audio_data: np.ndarray, text: str):
+        full = self.transcribe(audio_data)
+        self.speculation.verified += 1
+        if _normalize(full) != _normalize(text):
+            self.speculation.mismatched += 1
+            print(f"[ASR] 推测结果与整句识别不一致: {text!r} / {full!r}")
+        print(f"[ASR] {self.speculation.describe()}")
+
+    # ── 流式识别 ──
+
+    def _decode_partial(self):
+        self._partial_scheduled = False
+        stream = self._stream
+        if stream is None:
+            return
+        audio = stream.audio()
+        if len(audio) - stream.decoded < self.partial_interval * self.sample_rate:
+            return
+        try:
+            self._commit_segments(stream, audio)
+            hypothesis = self.transcribe(audio[stream.offset :])
         except Exception as e:
             print(f"[ASR Error] {e}")
+            return
+        stream.decoded = len(audio)
+        partial = _join(stream.committed, hypothesis)
+        if partial and partial != stream.partial:
+            stream.partial = partial
+            print(f"[ASR] （识别中）{partial}")
+            self.partial_ready.emit(partial)
+
+    def _commit_segments(self, stream: "_StreamState", audio: np.ndarray):
+        """窗口超过 commit_seconds 时，在最安静处切开，识别并提交前半段。"""
+        rate = self.sample_rate
+        while len(audio) - stream.offset > self.commit_seconds * rate:
+            cut = _quietest_point(
+                audio,
+                stream.offset + int((self.commit_seconds - self.commit_search) * rate),
+                stream.offset + int(self.commit_seconds * rate),
+                frame=int(0.02 * rate),
+            )
+            stream.committed.append(self.transcribe(audio[stream.offset : cut]))
+            stream.offset = cut
+
+    def _finish_stream(self, audio_data: np.ndarray) -> str:
+        """识别未提交的尾部，与已提交的段落拼成整句。"""
+        stream, self._stream = self._stream, None
+        # 整句音频以流式音频为前缀，已提交部分之后的都属于尾部
+        self._commit_segments(stream, audio_data)
+        self._last_segments = len(stream.committed)
+        return _join(stream.committed, self.transcribe(audio_data[stream.offset :]))
+
+
+@dataclass
+class SpeculationStats:
+    started: int = 0
+    committed: int = 0  # 静音得到确认，直接使用了推测结果
+    cancelled: int = 0  # 用户接着说话，推测作废
+    wasted_seconds: float = 0.0  # 作废的推测花费的识别时间
+    saved_seconds: float = 0.0  # 命中的推测比入队后再识别提前得到结果的时间
+    verified: int = 0
+    mismatched: int = 0  # 推测结果与整句识别不一致的次数
+
+    def describe(self) -> str:
+        hit_rate = self.committed / self.started if self.started else 0.0
+        saved = self.saved_seconds / self.committed * 1000 if self.committed else 0.0
+        verify = (
+            f", 校验 {self.verified} 次不一致 {self.mismatched} 次"
+            if self.verified
+            else ""
+        )
+        return (
+            f"推测 {self.started} 次: 命中 {self.committed} ({hit_rate:.0%}), "
+            f"作废 {self.cancelled} (浪费 {self.wasted_seconds:.1f}s), "
+            f"平均省下 {saved:.0f} ms{verify}"
+        )
+
+
+@dataclass
+class AsrQueueStats:
+    utterances: int = 0
+    batches: int = 0
+    audio_seconds: float = 0.0  # 已识别的音频总时长
+    decode_seconds: float = 0.0  # 识别耗时总和
+    wait_total: float = 0.0  # 从入队到识别完成的累计时间（秒）
+    wait_max: float = 0.0
+    max_depth: int = 0
+    dropped: dict[str, int] = field(default_factory=dict)  # 丢弃原因 -> 次数
+
+    @property
+    def throughput(self) -> float:
+        """每秒识别耗时能处理的音频秒数（实时率的倒数）。"""
+        return self.audio_seconds / self.decode_seconds if self.decode_seconds else 0.0
+
+    @property
+    def avg_wait(self) -> float:
+        return self.wait_total / self.utterances if self.utterances else 0.0
+
+    def drop(self, reason: str):
+        self.dropped[reason] = self.dropped.get(reason, 0) + 1
+
+    def describe(self) -> str:
+        per_batch = self.utterances / self.batches if self.batches else 0.0
+        return (
+            f"已识别 {self.utterances} 句 / {self.batches} 批 "
+            f"(平均每批 {per_batch:.1f} 句), 吞吐 {self.throughput:.1f}x 实时, "
+            f"平均等待 {self.avg_wait:.2f}s (最长 {self.wait_max:.2f}s), "
+            f"最大队列 {self.max_depth}, 丢弃 {self.dropped or 0}"
+        )
+
+
+@dataclass
+class _Utterance:
+    trace_id: int
+    audio: np.ndarray
+    enqueued_at: float  # time.monotonic()
+
+
+@dataclass
+class _Speculation:
+    trace_id: int
+    id: int
+    samples: int  # 推测时的音频长度
+    text: str
+    seconds: float  # 识别耗时
+    started_at: float  # time.monotonic()，与 _Utterance.enqueued_at 可比
+
+
+class _Cancelled(StoppingCriteria):
+    """cancelled() 返回 True 时让 generate 在下一个 token 停止。"""
+
+    def __init__(self, cancelled) -> None:
+        self.cancelled = cancelled
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full(
+            (input_ids.shape[0],),
+            self.cancelled(),
+            dtype=torch.bool,
+            device=input_ids.device,
+        )
+
+
+@dataclass
+class _StreamState:
+    """一句话的流式识别状态。"""
+
+    trace_id: int
+    chunks: list[np.ndarray] = field(default_factory=list)
+    offset: int = 0  # 已提交音频的结束位置（采样点）
+    decoded: int = 0  # 上次临时识别时的音频长度
+    committed: list[str] = field(default_factory=list)  # 已提交段落的识别结果
+    partial: str = ""
+
+    def audio(self) -> np.ndarray:
+        if len(self.chunks) > 1:
+            self.chunks = [np.concatenate(self.chunks)]
+        return self.chunks[0]
+
+
+def _quietest_point(audio: np.ndarray, lo: int, hi: int, frame: int) -> int:
+    """在 [lo, hi) 中找短时能量最低的帧，返回其中心位置，作为切分点。"""
+    lo = max(0, lo)
+    window = audio[lo:hi].astype(np.float32)
+    n = len(window) // frame
+    if n == 0:
+        return hi
+    energy = np.square(window[: n * frame]).reshape(n, frame).mean(axis=1)
+    return lo + int(energy.argmin()) * frame + frame // 2
+
+
+def _conversation(audio: np.ndarray, sample_rate: int) -> list[dict]:
+    """单句识别的对话消息；int16 音频在这里归一化为 float32。"""
+    if audio.dtype == np.int16:
+        audio = audio.astype(np.float32) / 32768.0
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "audio", "audio": audio, "sampling_rate": sample_rate},
+                {"type": "text", "text": PROMPT},
+            ],
+        }
+    ]
+
+
+def _voiced_probe(seconds: int, sample_rate: int) -> np.ndarray:
+    """启动自检用的类语音 int16 信号：变调的谐波加音节状的幅度起伏。"""
+    t = np.arange(seconds * sample_rate) / sample_rate
+    pitch = 140 + 40 * np.sin(2 * np.pi * 3 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    signal = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t)
+    return (envelope * signal * 0.3 * 32767).astype(np.int16)
+
+
+def _same_value(a, b) -> bool:
+    if isinstance(a, torch.Tensor) and isinstance(b, torch.Tensor):
+        return a.shape == b.shape and a.dtype == b.dtype and torch.equal(a, b)
+    return a == b
+
+
+def _normalize(text: str) -> str:
+    return "".join(ch for ch in text.lower() if ch.isalnum())
+
+
+def _join(parts: list[str], tail: str) -> str:
+    """拼接分段识别结果；中文直接相连，拉丁字母之间补空格。"""
+    text = ""
+    for part in [*parts, tail]:
+        if not part:
+            continue
+        if text and text[-1].isascii() and text[-1].isalnum() and part[0].isascii():
+            text += " "
+        text += part
+    return text
@@ -1,19 +1,44 @@
 import numpy as np
-import sounddevice as sd
 import torch
 from PySide6.QtCore import QObject, QThread, Signal, Slot
 from silero_vad import VADIterator, load_silero_vad
 
+from src.tracing import tracer
+
 
 class FullSentenceWorker(QObject):
-    sentence_ready = Signal(np.ndarray)
+    sentence_ready = Signal(int, np.ndarray)  # (追踪 ID, int16 音频)
+    # 说话期间新录到的音频段 (追踪 ID, int16 音频)，流式识别用
+    speech_chunk = Signal(int, np.ndarray)
+    # 推测识别：静音达到 speculative_silence_ms 时发出 (追踪 ID, 推测 ID, 当前整句音频)，
+    # 静音未达到 300ms 就恢复说话时发出 speech_resumed(推测 ID)
+    speech_paused = Signal(int, int, np.ndarray)
+    speech_resumed = Signal(int)
     finished = Signal()
 
-    def __init__(self, sample_rate=16000):
+    def __init__(
+        self,
+        sample_rate=16000,
+        source=None,
+        chunk_seconds=None,
+        speculative_silence_ms=None,
+    ):
         super().__init__()
         self.sample_rate = sample_rate
+        self.frame_size = 512  # 16kHz 下 silero VAD 要求的帧大小
+        # 说话期间每录到 chunk_seconds 秒就发出一次 speech_chunk，None 表示不转发
+        self.chunk_seconds = chunk_seconds
+        self._forwarded = 0  # 当前话语中已经转发的音频块数
+        # 短暂静音后即发出 speech_paused 让 ASR 提前开始识别，None 表示不推测
+        self.speculative_silence_ms = speculative_silence_ms
+        self._speculation_ids = 0
+        self._speculating: int | None = None  # 当前停顿对应的推测 ID
+        # 音频来源，默认麦克风；也可传入 src.replay.AudioReplay 回放录音
+        self.source = source
         self._is_active = False
         self.buffer = []  # 用于存放当前话语的音频块
+        # 当前话语的追踪 ID，开始说话时分配，流式段、推测和整句共用
+        self._trace_id: int | None = None
 
         # 初始化 VAD 迭代器
         # min_silence_duration_ms: 停顿超过 300ms 则认为话讲完了
@@ -28,45 +53,28 @@ class FullSentenceWorker(QObject):
     @Slot()
     def start_listening(self):
         self._is_active = True
-        frame_size = 512  # 16kHz 下 silero VAD 要求的帧大小
+        if self.source is not None:
+            for block in self.source:
+                if not self._is_active:
+                    break
+                self.process_block(block)
+            self.finished.emit()
+            return
+
+        # 只有使用麦克风时才需要 PortAudio
+        import sounddevice as sd
 
         def callback(indata, frames, time, status):
+            # 音频回调运行在实时线程中，这里不做 print 等阻塞操作
             if not self._is_active:
                 raise sd.CallbackStop
-
-            audio_data = indata.flatten()
-            audio_float32 = audio_data.astype(np.float32) / 32768.0
-
-            # 使用 VADIterator 处理帧
-            # 它会返回一个字典，包含 'start' 或 'end' 键（代表采样点位置）
-            speech_dict = self.vad_iterator(
-                torch.from_numpy(audio_float32), return_seconds=False
-            )
-
-            if speech_dict:
-                if "start" in speech_dict:
-                    # 检测到开始说话，清理缓冲区并开始记录
-                    self.buffer = [audio_data]
-                    print("--- 检测到语音开始 ---")
-
-                if "end" in speech_dict:
-                    # 检测到结束说话，合并缓冲区发送给主线程
-                    if self.buffer:
-                        full_sentence = np.concatenate(self.buffer)
-                        self.sentence_ready.emit(full_sentence)
-                        self.buffer = []
-                    print("--- 检测到语音结束 ---")
-                    self.vad_iterator.reset_states()  # 重置状态准备下一句
-
-            # 如果当前正在录制状态（缓冲区不为空），则持续添加
-            elif self.buffer:
-                self.buffer.append(audio_data)
+            self.process_block(indata.flatten())
 
         with sd.InputStream(
             samplerate=self.sample_rate,
             channels=1,
             dtype="int16",
-            blocksize=frame_size,
+            blocksize=self.frame_size,
             callback=callback,
         ):
             while self._is_active:
@@ -74,6 +82,74 @@ class FullSentenceWorker(QObject):
 
         self.finished.emit()
 
+    def process_block(self, audio_data: np.ndarray):
+        """处理一帧 int16 音频，检测到一句话结束时发射 sentence_ready。"""
+        audio_float32 = audio_data.astype(np.float32) / 32768.0
+
+        # 使用 VADIterator 处理帧
+        # 它会返回一个字典，包含 'start' 或 'end' 键（代表采样点位置）
+        speech_dict = self.vad_iterator(
+            torch.from_numpy(audio_float32), return_seconds=False
+        )
+
+        if speech_dict:
+            if "start" in speech_dict:
+                # 检测到开始说话，清理缓冲区并开始记录
+                self.buffer = [audio_data]
+                self._forwarded = 0
+                self._trace_id = tracer.reserve()
+
+            if "end" in speech_dict:
+                # 检测到结束说话，合并缓冲区发送给主线程
+                if self.buffer:
+                    full_sentence = np.concatenate(self.buffer)
+                    trace_id = tracer.begin("voice", trace_id=self._trace_id)
+                    self.sentence_ready.emit(trace_id, full_sentence)
+                    self.buffer = []
+                self._speculating = None
+                self.vad_iterator.reset_states()  # 重置状态准备下一句
+
+        # 如果当前正在录制状态（缓冲区不为空），则持续添加
+        elif self.buffer:
+            self.buffer.append(audio_data)
+            self._forward_chunk()
+            self._check_pause()
+
+    def _check_pause(self):
+        """推测识别：根据 VADIterator 的静音计时判断临时停顿的开始与结束。
+
+        VADIterator 在语音概率低于阈值时记下 temp_end，静音持续 min_silence
+        才发出 end；期间语音概率回升则清零 temp_end，表示用户接着说了。
+        """
+        if self.speculative_silence_ms is None:
+            return
+        vad = self.vad_iterator
+        if vad.triggered and vad.temp_end:
+            silence = vad.current_sample - vad.temp_end
+            if (
+                self._speculating is None
+                and silence * 1000 >= self.speculative_silence_ms * self.sample_rate
+            ):
+                self._speculation_ids += 1
+                self._speculating = self._speculation_ids
+                self.speech_paused.emit(
+                    self._trace_id, self._speculating, np.concatenate(self.buffer)
+                )
+        elif self._speculating is not None:
+            self.speech_resumed.emit(self._speculating)
+            self._speculating = None
+
+    def _forward_chunk(self):
+        """流式识别：缓冲区中未转发的音频够 chunk_seconds 时发出 speech_chunk。"""
+        if self.chunk_seconds is None:
+            return
+        pending = len(self.buffer) - self._forwarded
+        if pending * self.frame_size >= self.chunk_seconds * self.sample_rate:
+            self.speech_chunk.emit(
+                self._trace_id, np.concatenate(self.buffer[self._forwarded :])
+            )
+            self._forwarded = len(self.buffer)
+
     @Slot()
     def stop_listening(self):
         self._is_active = False
@@ -0,0 +1,63 @@
+"""记录本程序顶层窗口（Live2D 模型、对话气泡）在屏幕上的位置，供屏幕检测时排除。"""
+
+import threading
+
+from PySide6.QtCore import QEvent, QObject
+from PySide6.QtWidgets import QWidget
+
+Rect = tuple[int, int, int, int]  # 全局物理像素坐标 (x, y, w, h)
+
+
+class OwnWindowMask:
+    """线程安全的窗口矩形表：主线程写入，屏幕检测线程读取。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rects: dict[int, Rect] = {}
+
+    def set(self, key: int, rect: Rect | None):
+        with self._lock:
+            if rect is None:
+                self._rects.pop(key, None)
+            else:
+                self._rects[key] = rect
+
+    def rects(self) -> list[Rect]:
+        with self._lock:
+            return list(self._rects.values())
+
+
+class OwnWindowTracker(QObject):
+    """监听窗口的移动、缩放、显示和隐藏事件，实时更新 OwnWindowMask。"""
+
+    _EVENTS = (QEvent.Type.Move, QEvent.Type.Resize, QEvent.Type.Show, QEvent.Type.Hide)
+
+    def __init__(self, mask: OwnWindowMask):
+        super().__init__()
+        self.mask = mask
+
+    def track(self, widget: QWidget):
+        widget.installEventFilter(self)
+        self._update(widget)
+
+    def eventFilter(self, watched: QObject, event: QEvent) -> bool:
+        if event.type() in self._EVENTS and isinstance(watched, QWidget):
+            self._update(watched)
+        return False
+
+    def _update(self, widget: QWidget):
+        if not widget.isVisible():
+            self.mask.set(id(widget), None)
+            return
+        # Qt 使用逻辑像素，截图使用物理像素，按窗口所在屏幕的缩放倍率换算
+        geo = widget.frameGeometry()
+        ratio = widget.devicePixelRatioF()
+        self.mask.set(
+            id(widget),
+            (
+                round(geo.x() * ratio),
+                round(geo.y() * ratio),
+                round(geo.width() * ratio),
+                round(geo.height() * ratio),
+            ),
+        )
@@ -0,0 +1,171 @@
+"""Linux X11 下基于 XDamage 扩展的屏幕变化通知。
+
+通过 ctypes 直接调用 libX11 / libXdamage，订阅根窗口的损坏（damage）事件，
+只有屏幕真正重绘时才唤醒检测线程，并告知重绘的矩形区域。
+扩展不可用（非 X11、Wayland、缺少 libXdamage）时 create() 返回 None。
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import sys
+import time
+from collections.abc import Callable
+
+from src.window_mask import Rect
+
+XDamageReportRawRectangles = 0
+XDamageNotify = 0  # 相对于扩展的 event_base
+
+
+class XRectangle(ctypes.Structure):
+    _fields_ = [
+        ("x", ctypes.c_short),
+        ("y", ctypes.c_short),
+        ("width", ctypes.c_ushort),
+        ("height", ctypes.c_ushort),
+    ]
+
+
+class XDamageNotifyEvent(ctypes.Structure):
+    _fields_ = [
+        ("type", ctypes.c_int),
+        ("serial", ctypes.c_ulong),
+        ("send_event", ctypes.c_int),
+        ("display", ctypes.c_void_p),
+        ("drawable", ctypes.c_ulong),
+        ("damage", ctypes.c_ulong),
+        ("level", ctypes.c_int),
+        ("more", ctypes.c_int),
+        ("timestamp", ctypes.c_ulong),
+        ("area", XRectangle),
+        ("geometry", XRectangle),
+    ]
+
+
+class XEvent(ctypes.Union):
+    _fields_ = [
+        ("type", ctypes.c_int),
+        ("damage", XDamageNotifyEvent),
+        ("pad", ctypes.c_long * 24),
+    ]
+
+
+def _load_libs():
+    x11_name = ctypes.util.find_library("X11")
+    damage_name = ctypes.util.find_library("Xdamage")
+    if not x11_name or not damage_name:
+        return None
+    x11 = ctypes.CDLL(x11_name)
+    damage = ctypes.CDLL(damage_name)
+
+    x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+    x11.XOpenDisplay.restype = ctypes.c_void_p
+    x11.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+    x11.XDefaultRootWindow.restype = ctypes.c_ulong
+    x11.XConnectionNumber.argtypes = [ctypes.c_void_p]
+    x11.XPending.argtypes = [ctypes.c_void_p]
+    x11.XNextEvent.argtypes = [ctypes.c_void_p, ctypes.POINTER(XEvent)]
+    x11.XFlush.argtypes = [ctypes.c_void_p]
+    x11.XCloseDisplay.argtypes = [ctypes.c_void_p]
+
+    damage.XDamageQueryExtension.argtypes = [
+        ctypes.c_void_p,
+        ctypes.POINTER(ctypes.c_int),
+        ctypes.POINTER(ctypes.c_int),
+    ]
+    damage.XDamageCreate.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.c_int]
+    damage.XDamageCreate.restype = ctypes.c_ulong
+    damage.XDamageDestroy.argtypes = [ctypes.c_void_p, ctypes.c_ulong]
+    return x11, damage
+
+
+def _contains(outer: Rect, inner: Rect) -> bool:
+    ox, oy, ow, oh = outer
+    x, y, w, h = inner
+    return ox <= x and oy <= y and x + w <= ox + ow and y + h <= oy + oh
+
+
+class XDamageMonitor:
+    """订阅 X 根窗口的 damage 事件，按需阻塞等待并返回重绘区域。"""
+
+    def __init__(self, x11, damage, display, event_base: int):
+        self._x11 = x11
+        self._damage_lib = damage
+        self._display = display
+        self._event_type = event_base + XDamageNotify
+        root = x11.XDefaultRootWindow(display)
+        self._damage = damage.XDamageCreate(display, root, XDamageReportRawRectangles)
+        x11.XFlush(display)
+        self._fd = x11.XConnectionNumber(display)
+        self._event = XEvent()
+
+    @classmethod
+    def create(cls) -> "XDamageMonitor | None":
+        """连接 X 服务器并启用 XDamage；任一环节不可用时返回 None。"""
+        if not sys.platform.startswith("linux") or not os.environ.get("DISPLAY"):
+            return None
+        try:
+            libs = _load_libs()
+        except OSError:
+            return None
+        if libs is None:
+            return None
+        x11, damage = libs
+        display = x11.XOpenDisplay(None)
+        if not display:
+            return None
+        event_base, error_base = ctypes.c_int(), ctypes.c_int()
+        if not damage.XDamageQueryExtension(
+            display, ctypes.byref(event_base), ctypes.byref(error_base)
+        ):
+            x11.XCloseDisplay(display)
+            return None
+        return cls(x11, damage, display, event_base.value)
+
+    def wait(
+        self,
+        timeout: float,
+        coalesce: float = 0.0,
+        ignore: Callable[[], list[Rect]] | None = None,
+    ) -> list[Rect]:
+        """阻塞直到出现重绘或超时，返回根窗口坐标下的重绘矩形列表。
+
+        收到第一个事件后再等待 coalesce 秒，把短时间内的连续重绘合并成一批。
+        ignore 返回本程序自身窗口的矩形：完全落在其中的重绘直接丢弃并继续等待，
+        Live2D 模型按帧率重绘时不会唤醒检测线程。
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            if not self._x11.XPending(self._display):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                readable, _, _ = select.select([self._fd], [], [], remaining)
+                if not readable:
+                    return []
+            if coalesce > 0:
+                time.sleep(coalesce)
+            # RawRectangles 级别下每次重绘都会产生事件，无需 XDamageSubtract
+            rects = self._drain()
+            if ignore is not None:
+                own = ignore()
+                rects = [r for r in rects if not any(_contains(o, r) for o in own)]
+            if rects:
+                return rects
+
+    def _drain(self) -> list[Rect]:
+        rects = []
+        while self._x11.XPending(self._display):
+            self._x11.XNextEvent(self._display, ctypes.byref(self._event))
+            if self._event.type == self._event_type:
+                area = self._event.damage.area
+                rects.append((area.x, area.y, area.width, area.height))
+        return rects
+
+    def close(self):
+        if self._display:
+            self._damage_lib.XDamageDestroy(self._display, self._damage)
+            self._x11.XCloseDisplay(self._display)
+            self._display = None